@@ -1,12 +1,15 @@
-import json
+from job_manifest import JobManifest
+from translation_memory import TranslationMemory
 
-with open('output/step3_meta.json') as f:
-    d = json.load(f)
+manifest = JobManifest('output')
 
 # seg3: 2s window, XTTS generated 4.17s for "यह सब क्यों?" — use single word
-d['segments'][3]['hindi'] = 'क्यों?'
+seg = manifest.update_segment('step3', 3, hindi='क्यों?')
+manifest.close()
 
-with open('output/step3_meta.json', 'w') as f:
-    json.dump(d, f, indent=2, ensure_ascii=False)
+# Record the fix as a translation-memory override so re-runs of step3 keep it.
+tm = TranslationMemory()
+tm.set_override(seg['english'], seg['hindi'])
+tm.close()
 
-print('Updated seg3:', d['segments'][3]['hindi'])
+print('Updated seg3:', seg['hindi'])
@@ -1,26 +1,24 @@
 """Regenerate TTS for a single segment index without re-running all of step4."""
 import json, sys, os, subprocess
-from TTS.api import TTS
-
-XTTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
+from job_manifest import JobManifest
+from step4_tts import XTTS_MODEL, load_tts, synthesize_segment
 SEG_IDX = int(sys.argv[1]) if len(sys.argv) > 1 else 3
 OUTPUT_DIR = "output"
 
-with open(os.path.join(OUTPUT_DIR, "step3_meta.json")) as f:
-    tr_data = json.load(f)
-
-with open(os.path.join(OUTPUT_DIR, "step4_meta.json")) as f:
-    meta = json.load(f)
-
-seg = tr_data["segments"][SEG_IDX]
+manifest = JobManifest(OUTPUT_DIR)
+seg = manifest.get_segment("step3", SEG_IDX)
+if seg is None:
+    print(f"No step3 segment {SEG_IDX} in the manifest (run `python job_manifest.py import {OUTPUT_DIR}` "
+          f"for output from before it existed)")
+    sys.exit(1)
 hindi_text = seg["hindi"].strip()
 print(f"Regenerating seg{SEG_IDX}: '{hindi_text}'")
 
-tts = TTS(XTTS_MODEL, gpu=False)
+tts = load_tts(XTTS_MODEL)
 ref_clip_path = os.path.join(OUTPUT_DIR, "ref_speaker.wav")
 
 wav_path = os.path.join(OUTPUT_DIR, "tts_segments", f"seg_{SEG_IDX:04d}.wav")
-tts.tts_to_file(text=hindi_text, speaker_wav=ref_clip_path, language="hi", file_path=wav_path)
+synthesize_segment(tts, hindi_text, ref_clip_path, wav_path)
 
 subprocess.run(
     ["ffmpeg", "-y", "-i", wav_path, "-ar", "24000", "-ac", "1", wav_path + ".r.wav"],
@@ -36,15 +34,9 @@ duration = float(json.loads(result.stdout)["format"]["duration"])
 target = seg["end"] - seg["start"]
 print(f"  Generated: {duration:.2f}s (target {target:.1f}s)")
 
-# Patch step4_meta.json for this segment
-for s in meta["segments"]:
-    if s["index"] == SEG_IDX:
-        s["tts_duration"] = round(duration, 3)
-        s["hindi"] = hindi_text
-        s["wav_path"] = os.path.abspath(wav_path)
-        break
-
-with open(os.path.join(OUTPUT_DIR, "step4_meta.json"), "w") as f:
-    json.dump(meta, f, indent=2, ensure_ascii=False)
+# Patch this segment's step4 row; step4_meta.json is refreshed by `job_manifest.py export`
+manifest.update_segment("step4", SEG_IDX, tts_duration=round(duration, 3), hindi=hindi_text,
+                        wav_path=os.path.abspath(wav_path))
+manifest.close()
 
-print("Done — step4_meta.json updated.")
+print("Done — step4 segment updated in the job manifest.")
@@ -0,0 +1,104 @@
+"""Memory-mapped access to the 16 kHz PCM track decoded by step 1.
+
+Step 1 decodes the soundtrack exactly once into audio.wav. Later stages open
+it through open_pcm() and slice the mapped samples directly instead of
+running ffmpeg again. Every process, including pool workers, shares the
+same page-cache pages.
+"""
+import struct
+import sys, os
+
+import numpy as np
+
+
+_open = {}
+
+
+class PcmBuffer:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        offset, size, self.sample_rate, channels, bits = _parse_wav_header(self.path)
+        if channels != 1 or bits != 16:
+            raise ValueError(f"{path}: expected 16-bit mono PCM, got {channels}ch/{bits}bit")
+        self.samples = _map_samples(self.path, "r", offset, size)
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def index(self, seconds):
+        return min(max(int(round(seconds * self.sample_rate)), 0), len(self.samples))
+
+    def slice(self, start=0.0, end=None):
+        """float32 samples in [-1, 1] for [start, end) seconds."""
+        a = self.index(start)
+        b = len(self.samples) if end is None else self.index(end)
+        return self.samples[a:max(a, b)].astype(np.float32) / 32768.0
+
+    def blocks(self, block_samples):
+        for i in range(0, len(self.samples), block_samples):
+            yield self.samples[i:i + block_samples].astype(np.float32) / 32768.0
+
+
+def _parse_wav_header(path):
+    """(data offset, data bytes, sample rate, channels, bits per sample) of a RIFF WAV."""
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path}: not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path}: no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(chunk_size - 16 + (chunk_size & 1), 1)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path}: data chunk before fmt chunk")
+                offset = f.tell()
+                file_size = os.fstat(f.fileno()).st_size
+                # ffmpeg writing to a pipe leaves the size fields unset.
+                if chunk_size in (0, 0xFFFFFFFF) or offset + chunk_size > file_size:
+                    chunk_size = file_size - offset
+                _, channels, sample_rate, _, _, bits = fmt
+                return offset, chunk_size & ~1, sample_rate, channels, bits
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+
+def map_pcm_writable(path):
+    """(sample rate, writable int16 memmap) of a 16-bit mono WAV's samples, for in-place edits."""
+    offset, size, sample_rate, channels, bits = _parse_wav_header(path)
+    if channels != 1 or bits != 16:
+        raise ValueError(f"{path}: expected 16-bit mono PCM, got {channels}ch/{bits}bit")
+    return sample_rate, _map_samples(path, "r+", offset, size)
+
+
+def _map_samples(path, mode, offset, size):
+    # A header-only WAV (silent or failed decode) has nothing to map.
+    if size < 2:
+        return np.zeros(0, dtype="<i2")
+    return np.memmap(path, dtype="<i2", mode=mode, offset=offset, shape=(size // 2,))
+
+
+def open_pcm(path):
+    """Shared PcmBuffer for ``path``, re-mapped if the file has changed since it was opened."""
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = _open.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, PcmBuffer(key))
+        _open[key] = cached
+    return cached[1]
+
+
+if __name__ == "__main__":
+    buf = open_pcm(sys.argv[1] if len(sys.argv) > 1 else "output/audio.wav")
+    print(f"{buf.path}: {buf.duration:.2f}s @ {buf.sample_rate} Hz, {len(buf)} samples mapped")
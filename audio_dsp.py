@@ -0,0 +1,187 @@
+import subprocess, wave
+import sys, os
+
+import numpy as np
+
+from audio_buffer import open_pcm
+
+
+def read_wav(path, sample_rate=24000):
+    """Load a mono WAV as float32 in [-1, 1].
+
+    16-bit mono files at the requested rate are read directly; anything else
+    is decoded and resampled through a single ffmpeg pipe.
+    """
+    try:
+        with wave.open(path, "rb") as w:
+            if (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, 2, sample_rate):
+                raw = w.readframes(w.getnframes())
+                return np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    except (wave.Error, EOFError):
+        pass
+
+    result = subprocess.run(
+        ["ffmpeg", "-v", "quiet", "-i", path,
+         "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-ac", "1", "-"],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not decode {path}")
+    return np.frombuffer(result.stdout, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def read_wav_range(path, start, end=None, sample_rate=16000):
+    """Samples for [start, end) seconds, sliced from the shared memory-mapped PCM buffer."""
+    try:
+        buf = open_pcm(path)
+    except ValueError:
+        buf = None
+    if buf is None or buf.sample_rate != sample_rate:
+        return read_wav(path, sample_rate)[int(start * sample_rate):
+                                           None if end is None else int(end * sample_rate)]
+    return buf.slice(start, end)
+
+
+def wav_levels(path, window=0.02, block_seconds=60):
+    """Per-window RMS dBFS of a 16-bit mono WAV, scanned blockwise so memory stays flat.
+
+    Returns (levels, window_seconds).
+    """
+    buf = open_pcm(path)
+    n = max(int(window * buf.sample_rate), 1)
+    block = n * max(int(block_seconds / window), 1)
+    levels = [frame_rms_db(x, buf.sample_rate, window)[0] for x in buf.blocks(block)]
+    return (np.concatenate(levels) if levels else np.zeros(0)), n / buf.sample_rate
+
+
+def plan_chunks(levels, frame_sec, max_len=30.0, search=5.0, min_len=1.0):
+    """Cut points (seconds) so every chunk is <= max_len, cutting at the quietest
+    frame within the last ``search`` seconds before each limit.
+
+    Returns a list of (start, end) tuples covering the whole track.
+    """
+    total = len(levels) * frame_sec
+    chunks = []
+    start = 0.0
+    while total - start > max_len:
+        lo = int((start + max(max_len - search, min_len)) / frame_sec)
+        hi = int((start + max_len) / frame_sec)
+        cut = (lo + int(np.argmin(levels[lo:hi]))) * frame_sec if hi > lo else start + max_len
+        chunks.append((round(start, 3), round(cut, 3)))
+        start = cut
+    if total > start or not chunks:
+        chunks.append((round(start, 3), round(total, 3)))
+    return chunks
+
+
+def to_pcm16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).round().astype("<i2")
+
+
+def write_wav(path, samples, sample_rate=24000):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(to_pcm16(samples).tobytes())
+
+
+def frame_rms_db(samples, sample_rate, window=0.02):
+    """RMS level in dBFS per non-overlapping window, the same detector silenceremove uses."""
+    n = max(int(window * sample_rate), 1)
+    frames = max(-(-len(samples) // n), 1)
+    blocks = np.pad(samples, (0, frames * n - len(samples))).reshape(frames, n)
+    rms = np.sqrt(np.mean(blocks ** 2, axis=1))
+    return 20 * np.log10(rms + 1e-12), n
+
+
+def runs(mask):
+    """(start, end) frame index pairs of consecutive True values."""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def trim_silence(samples, sample_rate, threshold_db=-40.0, keep_start=0.05, keep_end=0.15):
+    """Strip leading/trailing audio quieter than threshold_db, keeping a little silence each side."""
+    levels, n = frame_rms_db(samples, sample_rate)
+    loud = np.flatnonzero(levels > threshold_db)
+    if not len(loud):
+        return samples[:0]
+    start = max(loud[0] * n - int(keep_start * sample_rate), 0)
+    end = min((loud[-1] + 1) * n + int(keep_end * sample_rate), len(samples))
+    return samples[start:end]
+
+
+def time_stretch(samples, tempo, sample_rate=24000, frame_ms=40, search_ms=10):
+    """WSOLA time-scale modification: tempo > 1 speeds up, < 1 slows down, pitch unchanged."""
+    if len(samples) == 0 or abs(tempo - 1.0) < 1e-6:
+        return samples.copy()
+
+    n = int(sample_rate * frame_ms / 1000) & ~1
+    hop_out = n // 2
+    hop_in = hop_out * tempo
+    delta = int(sample_rate * search_ms / 1000)
+
+    out_len = int(round(len(samples) / tempo))
+    padded = np.concatenate([np.zeros(delta, np.float32), samples,
+                             np.zeros(n + 2 * delta + hop_out, np.float32)])
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n) / n)).astype(np.float32)
+
+    frames = out_len // hop_out + 1
+    out = np.zeros(frames * hop_out + n, np.float32)
+    norm = np.zeros_like(out)
+
+    prev = 0
+    for k in range(frames):
+        nominal = int(round(k * hop_in))
+        if k == 0:
+            pos = nominal
+        else:
+            # Pick the candidate frame that best continues the previous one.
+            template = padded[prev + delta + hop_out:prev + delta + hop_out + n]
+            lo = nominal
+            region = padded[lo:lo + 2 * delta + n]
+            if len(region) < 2 * delta + n or not np.any(template):
+                pos = nominal
+            else:
+                cands = np.lib.stride_tricks.sliding_window_view(region, n)
+                pos = lo + int(np.argmax(cands @ template)) - delta
+        pos = max(pos, 0)
+        seg = padded[pos + delta:pos + delta + n]
+        if len(seg) < n:
+            seg = np.pad(seg, (0, n - len(seg)))
+        out[k * hop_out:k * hop_out + n] += seg * window
+        norm[k * hop_out:k * hop_out + n] += window
+        prev = pos
+
+    norm[norm < 1e-3] = 1.0
+    return (out / norm)[:out_len]
+
+
+def fit_length(samples, length):
+    if len(samples) >= length:
+        return samples[:length]
+    return np.concatenate([samples, np.zeros(length - len(samples), samples.dtype)])
+
+
+def fade_out(samples, start, duration, sample_rate):
+    """Linear fade to silence from ``start`` seconds over ``duration``, like afade=t=out."""
+    out = samples.copy()
+    s = int(round(start * sample_rate))
+    d = max(int(round(duration * sample_rate)), 1)
+    if s >= len(out):
+        return out
+    ramp = np.linspace(1.0, 0.0, d, endpoint=False, dtype=np.float32)[:len(out) - s]
+    out[s:s + len(ramp)] *= ramp
+    out[s + d:] = 0.0
+    return out
+
+
+if __name__ == "__main__":
+    src = sys.argv[1]
+    tempo = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    x = read_wav(src)
+    y = time_stretch(trim_silence(x, 24000), tempo)
+    dst = os.path.splitext(src)[0] + f".x{tempo}.wav"
+    write_wav(dst, y)
+    print(f"{len(x) / 24000:.2f}s → {len(y) / 24000:.2f}s: {dst}")
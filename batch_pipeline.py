@@ -0,0 +1,234 @@
+"""Dub a catalogue of videos in one process.
+
+Every video gets its own output directory and runs through the same stages
+as run_pipeline, but the queue is scheduled stage-major: all videos finish
+step 2 before step 3 starts, and so on. While a model stage runs, its model
+loader is memoised, so Whisper, NLLB and XTTS are each loaded once for the
+whole queue and dropped before the next model is needed.
+
+A failing video is marked failed and left behind without stopping the
+others. Progress is kept in batch_state.json under the output root, and each
+job has its own stage cache, so re-running the same command resumes: finished
+videos are skipped and failed ones pick up from their last completed stage.
+ffmpeg-heavy stages run several videos at once, up to --ffmpeg-jobs.
+"""
+import argparse, gc, glob, threading, traceback
+import json, sys, os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from run_pipeline import pipeline_stages
+
+
+STAGE_ORDER = ["step1", "stream", "step2", "step2b", "step3", "step4", "step5", "step6",
+               "step7", "step8"]
+
+# Stage → (module, loader) pairs whose results are shared by every job in that stage.
+# The streaming stage runs steps 2-5 together and holds all three models;
+# stream_pipeline imports two of the loaders by name, so they are swapped there.
+MODEL_LOADERS = {
+    "stream": [("stream_pipeline", "load_whisper"), ("step3_translate", "load_nllb"),
+               ("stream_pipeline", "load_tts")],
+    "step2": [("step2_transcribe", "load_whisper")],
+    "step3": [("step3_translate", "load_nllb")],
+    "step4": [("step4_tts", "load_tts")],
+}
+
+# Mostly ffmpeg/ffprobe work, safe to overlap across videos.
+FFMPEG_STAGES = {"step1", "step5", "step6", "step7", "step8"}
+
+VIDEO_EXTS = (".mp4", ".mkv", ".mov", ".avi", ".webm")
+
+
+class Job:
+    def __init__(self, name, input_video, output_dir):
+        self.name = name
+        self.input_video = input_video
+        self.output_dir = output_dir
+        self.stages = None
+        self.current = None
+        self.next_stage = None
+        self.status = "pending"
+        self.error = None
+        self.final_output = None
+
+    def advance(self):
+        """Run the job's pending stage; returns the stage after it, or None when finished."""
+        try:
+            self.next_stage = next(self.stages)
+        except StopIteration as done:
+            self.next_stage = None
+            self.status = "done"
+            self.final_output = done.value
+        except KeyboardInterrupt:
+            raise
+        except BaseException as e:
+            # sys.exit() inside a step must only end this job, not the batch.
+            self.next_stage = None
+            self.status = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            print(f"[Batch] {self.name} failed in {self.current}: {self.error}")
+        return self.next_stage
+
+    def state(self):
+        return {"input": self.input_video, "output_dir": self.output_dir,
+                "status": self.status, "error": self.error, "final_output": self.final_output}
+
+
+@contextmanager
+def resident(stage):
+    """Memoise the stage's model loaders so every job reuses one loaded model each."""
+    swapped = []
+    for module_name, loader_name in MODEL_LOADERS.get(stage, ()):
+        module = __import__(module_name)
+        original = getattr(module, loader_name)
+        loaded = {}
+        setattr(module, loader_name, _shared(original, loaded))
+        swapped.append((module, loader_name, original, loaded))
+    try:
+        yield
+    finally:
+        for module, loader_name, original, loaded in swapped:
+            setattr(module, loader_name, original)
+            if loaded:
+                print(f"[Batch] Unloading {loader_name} models ({len(loaded)})")
+            loaded.clear()
+        gc.collect()
+
+
+def _shared(loader, loaded):
+    lock = threading.Lock()
+
+    def shared(*args, **kwargs):
+        key = repr((args, sorted(kwargs.items())))
+        with lock:
+            if key not in loaded:
+                loaded[key] = loader(*args, **kwargs)
+            return loaded[key]
+    return shared
+
+
+def find_inputs(source):
+    """(name, video path, output dir or None) for a directory of videos or a manifest.
+
+    A manifest is a JSON list of paths or {"input": ..., "output_dir": ...}
+    objects, or a text file with one video path per line.
+    """
+    if os.path.isdir(source):
+        paths = sorted(p for p in glob.glob(os.path.join(source, "*"))
+                       if p.lower().endswith(VIDEO_EXTS))
+        entries = [{"input": p} for p in paths]
+    else:
+        with open(source) as f:
+            text = f.read()
+        try:
+            entries = json.loads(text)
+        except ValueError:
+            entries = [line.strip() for line in text.splitlines()
+                       if line.strip() and not line.lstrip().startswith("#")]
+        entries = [e if isinstance(e, dict) else {"input": e} for e in entries]
+        base = os.path.dirname(os.path.abspath(source))
+        for e in entries:
+            e["input"] = os.path.join(base, e["input"])
+
+    names, out = set(), []
+    for e in entries:
+        stem = os.path.splitext(os.path.basename(e["input"]))[0]
+        name, n = stem, 1
+        while name in names:
+            n += 1
+            name = f"{stem}_{n}"
+        names.add(name)
+        out.append((name, os.path.abspath(e["input"]), e.get("output_dir")))
+    return out
+
+
+def run_batch(source, output_root="batch_output", ffmpeg_jobs=2, rerun=False, **pipeline_kwargs):
+    os.makedirs(output_root, exist_ok=True)
+    state_path = os.path.join(output_root, "batch_state.json")
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    def save_state():
+        tmp = state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, state_path)
+
+    jobs = []
+    for name, video, out_dir in find_inputs(source):
+        job = Job(name, video, out_dir or os.path.join(output_root, name))
+        previous = state.get(name)
+        if previous and previous["status"] == "done" and not rerun:
+            print(f"[Batch] {name}: already done, skipping")
+            continue
+        jobs.append(job)
+
+    print(f"[Batch] {len(jobs)} videos queued ({len(state)} in state file)")
+    for job in jobs:
+        job.stages = pipeline_stages(job.input_video, job.output_dir, **pipeline_kwargs)
+        job.status = "running"
+        job.advance()
+        state[job.name] = job.state()
+    save_state()
+
+    def step(job):
+        job.current = job.next_stage
+        job.advance()
+        state[job.name] = job.state()
+
+    for stage in STAGE_ORDER:
+        group = [j for j in jobs if j.next_stage == stage]
+        if not group:
+            continue
+        print(f"\n[Batch] ===== {stage}: {len(group)} videos =====")
+        with resident(stage):
+            if stage in FFMPEG_STAGES and ffmpeg_jobs > 1:
+                with ThreadPoolExecutor(max_workers=ffmpeg_jobs) as pool:
+                    list(pool.map(step, group))
+            else:
+                for job in group:
+                    step(job)
+        save_state()
+
+    done = [j for j in jobs if j.status == "done"]
+    failed = [j for j in jobs if j.status == "failed"]
+    print("\n" + "=" * 60)
+    print(f"  Batch: {len(done)} done, {len(failed)} failed")
+    for job in failed:
+        print(f"  FAILED {job.name} ({job.current}): {job.error}")
+    print(f"  State: {state_path}")
+    print("=" * 60)
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dub a directory or manifest of videos")
+    parser.add_argument("source", help="Directory of videos, or a manifest (JSON list or one path per line)")
+    parser.add_argument("--output-root", default="batch_output",
+                        help="Per-video output directories are created here")
+    parser.add_argument("--ffmpeg-jobs", type=int, default=2,
+                        help="Videos processed at once in the ffmpeg-heavy stages")
+    parser.add_argument("--rerun", action="store_true",
+                        help="Also re-run videos the state file marks as done")
+    parser.add_argument("--skip-lipsync", action="store_true", help="Skip step 7")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Re-run every stage even if its inputs are unchanged")
+    parser.add_argument("--translate-batch-size", type=int, default=8)
+    parser.add_argument("--whisper-backend", choices=["openai", "ctranslate2"], default="openai")
+    parser.add_argument("--vad", action="store_true")
+    parser.add_argument("--stream", action="store_true",
+                        help="Run steps 2-5 as one streaming stage per video")
+    parser.add_argument("--match-engine", choices=["numpy", "ffmpeg"], default="numpy")
+    parser.add_argument("--mixer", choices=["array", "ffmpeg"], default="array")
+    parser.add_argument("--assembly", choices=["fused", "staged"], default="fused")
+    args = parser.parse_args()
+
+    run_batch(args.source, args.output_root, ffmpeg_jobs=args.ffmpeg_jobs, rerun=args.rerun,
+              skip_lipsync=args.skip_lipsync, use_cache=not args.no_cache,
+              translate_batch_size=args.translate_batch_size,
+              whisper_backend=args.whisper_backend, vad=args.vad, stream=args.stream,
+              match_engine=args.match_engine, mixer=args.mixer, assembly=args.assembly)
@@ -0,0 +1,62 @@
+"""Compare step5's in-process NumPy engine with the ffmpeg filter-chain engine.
+
+Runs both engines over the same step4_meta.json and reports wall time,
+matched-duration agreement and loudness-envelope correlation per segment.
+"""
+import argparse, tempfile, time
+import json, sys, os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_dsp import frame_rms_db, read_wav
+from step5_duration_match import SAMPLE_RATE, match_durations
+
+
+def run_engine(meta_path, engine, out_dir):
+    t0 = time.perf_counter()
+    info = match_durations(meta_path, out_dir, engine=engine)
+    return time.perf_counter() - t0, {s["index"]: s for s in info["segments"]}
+
+
+def envelope_corr(a_path, b_path):
+    a, _ = frame_rms_db(read_wav(a_path, SAMPLE_RATE), SAMPLE_RATE)
+    b, _ = frame_rms_db(read_wav(b_path, SAMPLE_RATE), SAMPLE_RATE)
+    n = min(len(a), len(b))
+    a, b = np.maximum(a[:n], -60), np.maximum(b[:n], -60)
+    if n < 2 or a.std() == 0 or b.std() == 0:
+        return 1.0
+    return float(np.corrcoef(a, b)[0, 1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("meta", nargs="?", default="output/step4_meta.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for engine in ("ffmpeg", "numpy"):
+            out_dir = os.path.join(tmp, engine)
+            os.makedirs(out_dir)
+            results[engine] = run_engine(args.meta, engine, out_dir)
+
+        t_ff, ff = results["ffmpeg"]
+        t_np, npy = results["numpy"]
+        common = sorted(set(ff) & set(npy))
+
+        dur_err = [abs(ff[i]["matched_duration"] - npy[i]["matched_duration"]) for i in common]
+        tts_err = [abs(ff[i]["tts_duration"] - npy[i]["tts_duration"]) for i in common]
+        corr = [envelope_corr(ff[i]["wav_path"], npy[i]["wav_path"]) for i in common]
+
+        print("\n" + "=" * 60)
+        print(f"  Segments:              {len(common)}")
+        print(f"  ffmpeg engine:         {t_ff:.2f}s ({len(common) / max(t_ff, 1e-9):.1f} seg/s)")
+        print(f"  numpy engine:          {t_np:.2f}s ({len(common) / max(t_np, 1e-9):.1f} seg/s)")
+        print(f"  Speed-up:              {t_ff / max(t_np, 1e-9):.1f}x")
+        if common:
+            print(f"  matched_duration diff: max {max(dur_err) * 1000:.1f}ms")
+            print(f"  trimmed tts diff:      mean {np.mean(tts_err) * 1000:.1f}ms, max {max(tts_err) * 1000:.1f}ms")
+            print(f"  envelope correlation:  mean {np.mean(corr):.3f}, min {min(corr):.3f}")
+        print("=" * 60)
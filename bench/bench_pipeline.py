@@ -0,0 +1,230 @@
+"""Offline scaling benchmark of the pipeline steps with stub models.
+
+For each scale point a synthetic video is generated with ffmpeg test sources
+(testsrc picture, aevalsrc tone bursts standing in for speech, one burst per
+segment). Whisper, NLLB and XTTS are replaced by deterministic stubs, so the
+run needs no models or network and measures only the pipeline's own work:
+decoding, cleaning, memory/bookkeeping, resampling, duration matching,
+mixing and encoding. Each step's wall/CPU time, peak RSS and subprocess
+count is reported per scale, together with how it grows between scales.
+
+Save a run with --json and pass it as --baseline later to fail (exit 1)
+when any step got slower than --tolerance allows.
+"""
+import argparse, hashlib, math, random, subprocess, tempfile
+import json, sys, os
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["TRANS_NO_MODEL_SERVER"] = "1"
+
+import profiler
+import step2_transcribe, step3_translate, step4_tts
+from audio_dsp import frame_rms_db, runs, write_wav
+from step1_extract_audio import extract_audio
+from step2_transcribe import transcribe
+from step2b_clean_asr import clean_asr
+from step3_translate import translate
+from step4_tts import synthesize_all
+from step5_duration_match import match_durations
+from step6_merge_audio import merge_audio
+from step8_master_encode import assemble, master_encode
+
+
+PERIOD = 3.0
+BURST = 2.4
+
+WORDS = ("the children walked to school in the morning while their mother cooked rice "
+         "and the teacher asked about the river festival near our village market").split()
+
+
+# Stub models: same interfaces as the real ones, deterministic output.
+
+class StubWhisper:
+    """One segment per loud run in the audio, with made-up English text."""
+
+    def __init__(self):
+        self.count = 0
+
+    def transcribe(self, audio, task="translate", language=None, verbose=False):
+        levels, n = frame_rms_db(np.asarray(audio, dtype=np.float32), 16000)
+        frame = n / 16000
+        segments = []
+        for a, b in runs(levels > -35.0):
+            rng = random.Random(self.count)
+            self.count += 1
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 12)))
+            segments.append({"start": float(a) * frame, "end": float(b) * frame,
+                             "text": f"{text} {self.count}"})
+        return {"segments": segments}
+
+
+def stub_translate_texts(texts, tokenizer, model, batch_size=8):
+    return [f"हिंदी अनुवाद {t}" for t in texts]
+
+
+def stub_synthesize_segment(tts, text, ref_clip_path, wav_path, language="hi"):
+    """A tone whose length follows the text length, roughly like real TTS output."""
+    seed = int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+    seconds = min(max(0.045 * len(text), 0.5), 12.0) * (0.9 + 0.3 * (seed % 100) / 100)
+    t = np.arange(int(seconds * 24000)) / 24000
+    write_wav(wav_path, 0.2 * np.sin(2 * np.pi * (180 + seed % 120) * t), 24000)
+    return wav_path
+
+
+def install_stubs():
+    step2_transcribe.load_whisper = lambda *a, **kw: StubWhisper()
+    step3_translate.load_nllb = lambda model_name: (None, None)
+    step3_translate.translate_texts = stub_translate_texts
+    step4_tts.load_tts = lambda model_name=None: None
+    step4_tts.synthesize_segment = stub_synthesize_segment
+
+
+def make_fixture(path, segments, size="160x120", rate=10):
+    """Synthetic video with ``segments`` tone bursts of BURST seconds every PERIOD seconds."""
+    duration = segments * PERIOD
+    speech = (f"aevalsrc='0.3*sin(2*PI*(300+37*mod(floor(t/{PERIOD}),20))*t)"
+              f"*lt(mod(t,{PERIOD}),{BURST})':s=16000:d={duration}")
+    cmd = ["ffmpeg", "-y", "-v", "error",
+           "-f", "lavfi", "-i", f"testsrc=size={size}:rate={rate}:duration={duration}",
+           "-f", "lavfi", "-i", speech,
+           "-c:v", "libx264", "-preset", "ultrafast", "-g", str(rate * 2),
+           "-c:a", "aac", "-shortest", path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Fixture generation failed: {result.stderr[-300:]}")
+    return path
+
+
+def run_scale(n, work_dir, mixers, engines, encode):
+    out = os.path.join(work_dir, f"n{n}")
+    os.makedirs(out, exist_ok=True)
+    video = make_fixture(os.path.join(work_dir, f"fixture_{n}.mp4"), n)
+
+    def step(name, func, *args, **kwargs):
+        with profiler.stage(name, segments=n) as extra:
+            try:
+                return func(*args, **kwargs)
+            except (Exception, SystemExit) as e:
+                extra["failed"] = f"{type(e).__name__}: {e}"[:200]
+                print(f"[Bench] {name} at n={n} failed: {extra['failed']}")
+
+    def meta(name):
+        return os.path.join(out, name)
+
+    step("extract_audio", extract_audio, video, out)
+    audio = meta("audio.wav")
+    step("transcribe", transcribe, audio, out, model_name="stub")
+    step("clean_asr", clean_asr, meta("step2_meta.json"), out)
+    step("translate", translate, meta("step2_cleaned.json"), out, tm_path=None)
+    step("synthesize_all", synthesize_all, meta("step3_meta.json"), audio, out, model_name="stub")
+    for engine in engines:
+        step(f"match_durations[{engine}]", match_durations, meta("step4_meta.json"), out,
+             engine=engine)
+    for mixer in mixers:
+        step(f"merge_audio[{mixer}]", merge_audio, meta("step5_meta.json"), video, out,
+             mixer=mixer, mux=False)
+    dubbed = meta("dubbed_audio.wav")
+    step("assemble[copy]", assemble, video, dubbed, out)
+    if encode:
+        step("master_encode[encode]", master_encode, video, out, video="encode")
+
+
+def report(stages, scales):
+    table = {}
+    for row in stages:
+        table.setdefault(row["stage"], {})[row["segments"]] = row
+
+    print("\n" + "=" * 78)
+    header = "".join(f"{f'n={n}':>11}" for n in scales)
+    print(f"  {'step':<24}{header}   growth")
+    for name, by_n in table.items():
+        cells = []
+        for n in scales:
+            row = by_n.get(n)
+            cells.append(f"{'FAIL' if row is None or row.get('failed') else row['wall_s']:>11}")
+        growth = ""
+        ok = [n for n in scales if n in by_n and not by_n[n].get("failed")]
+        if len(ok) >= 2:
+            a, b = ok[-2], ok[-1]
+            ta, tb = max(by_n[a]["wall_s"], 1e-3), max(by_n[b]["wall_s"], 1e-3)
+            k = math.log(tb / ta) / math.log(b / a)
+            growth = f"n^{k:.2f}" + ("  super-linear" if k > 1.3 else "")
+        print(f"  {name:<24}{''.join(cells)}   {growth}")
+    print("=" * 78)
+    print("  wall seconds per step; growth is the exponent between the two largest scales")
+
+
+def compare(stages, baseline_path, tolerance, min_delta):
+    """Steps that got slower than the saved --json baseline; returns the regressions."""
+    with open(baseline_path) as f:
+        baseline = {(row["stage"], row["segments"]): row for row in json.load(f)["stages"]}
+
+    regressions = []
+    print(f"\n[Bench] Against {baseline_path} (tolerance {tolerance:.0%}, "
+          f"ignoring changes under {min_delta}s)")
+    for row in stages:
+        base = baseline.get((row["stage"], row["segments"]))
+        if base is None or base.get("failed"):
+            continue
+        label = f"{row['stage']} n={row['segments']}"
+        if row.get("failed"):
+            regressions.append(label)
+            print(f"  {label:<36} FAILED (baseline {base['wall_s']}s)")
+            continue
+        delta = row["wall_s"] - base["wall_s"]
+        ratio = row["wall_s"] / max(base["wall_s"], 1e-3)
+        slower = delta > min_delta and ratio > 1 + tolerance
+        if slower:
+            regressions.append(label)
+        print(f"  {label:<36} {base['wall_s']:>9}s → {row['wall_s']:>9}s  {ratio - 1:+.0%}"
+              f"{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="10,100,1000",
+                        help="Comma-separated segment counts")
+    parser.add_argument("--mixers", default="array,ffmpeg", help="Step 6 mixers to time")
+    parser.add_argument("--engines", default="numpy", help="Step 5 engines to time")
+    parser.add_argument("--no-encode", action="store_true", help="Skip the full libx264 encode")
+    parser.add_argument("--keep", default=None, help="Work in this directory and keep it")
+    parser.add_argument("--json", default=None, help="Write per-step metrics to this path")
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace to this path")
+    parser.add_argument("--baseline", default=None,
+                        help="Compare against metrics saved with --json; exit 1 on a slowdown")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline (fraction, default 0.25)")
+    parser.add_argument("--min-delta", type=float, default=0.05,
+                        help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",")]
+    install_stubs()
+    profiler.enable()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.keep or tmp
+        os.makedirs(work_dir, exist_ok=True)
+        for n in scales:
+            print(f"\n[Bench] ===== {n} segments ({n * PERIOD:.0f}s of video) =====")
+            run_scale(n, work_dir, args.mixers.split(","), args.engines.split(","),
+                      not args.no_encode)
+
+    metrics = profiler.active().metrics()
+    report(metrics["stages"], scales)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(metrics, f, indent=2)
+    if args.trace:
+        profiler.write_trace(args.trace)
+    if args.baseline:
+        regressions = compare(metrics["stages"], args.baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print(f"[Bench] {len(regressions)} steps slower than the baseline: "
+                  f"{', '.join(regressions)}")
+            sys.exit(1)
+        print("[Bench] No regressions against the baseline")
@@ -0,0 +1,78 @@
+"""Side-by-side real-time factor and memory of step2's Whisper backends.
+
+Each backend runs in its own subprocess so peak RSS is measured in
+isolation and model load time is reported separately from decoding.
+"""
+import argparse, difflib, resource, subprocess, wave
+import json, sys, os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_one(audio, model_name, backend, threads):
+    import time
+    from step2_transcribe import load_whisper, run_whisper
+
+    t0 = time.perf_counter()
+    model = load_whisper(model_name, backend=backend, cpu_threads=threads)
+    t_load = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    segments = run_whisper(model, audio)
+    t_decode = time.perf_counter() - t0
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "backend": backend,
+        "load_s": t_load,
+        "decode_s": t_decode,
+        "peak_rss_mb": peak_kb / 1024,
+        "segments": len(segments),
+        "text": " ".join(s["text"].strip() for s in segments),
+    }))
+
+
+def audio_seconds(path):
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / w.getframerate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audio", nargs="?", default="output/audio.wav")
+    parser.add_argument("--model", default="medium")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--backends", default="openai,ctranslate2")
+    parser.add_argument("--_child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._child:
+        run_one(args.audio, args.model, args._child, args.threads)
+        sys.exit(0)
+
+    duration = audio_seconds(args.audio)
+    rows = []
+    for backend in args.backends.split(","):
+        print(f"[Bench] {backend}...")
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), args.audio, "--model", args.model,
+             "--threads", str(args.threads), "--_child", backend],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"[Bench] {backend} failed: {proc.stderr[-300:]}")
+            continue
+        rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print("\n" + "=" * 72)
+    print(f"  Audio: {args.audio} ({duration:.1f}s), model {args.model}")
+    print(f"  {'backend':<12} {'load':>7} {'decode':>8} {'RTF':>6} {'peak RSS':>10} {'segs':>5}")
+    for r in rows:
+        rtf = r["decode_s"] / duration if duration else 0.0
+        print(f"  {r['backend']:<12} {r['load_s']:>6.1f}s {r['decode_s']:>7.1f}s {rtf:>6.3f} "
+              f"{r['peak_rss_mb']:>8.0f}MB {r['segments']:>5}")
+    if len(rows) == 2:
+        sim = difflib.SequenceMatcher(None, rows[0]["text"], rows[1]["text"]).ratio()
+        print(f"  transcript similarity {rows[0]['backend']} vs {rows[1]['backend']}: {sim:.3f}")
+    print("=" * 72)
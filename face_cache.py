@@ -0,0 +1,88 @@
+"""Per-frame face boxes for Wav2Lip, computed once per source video.
+
+Boxes are stored as an int32 (frames, 4) array of (y1, y2, x1, x2) under
+FACE_CACHE_DIR, keyed by the source video's sha256 plus the --pads and
+--resize_factor they were detected with. Rows of -1 are frames not yet seen.
+
+Run as a script it wraps Wav2Lip's inference.py: face_detect is swapped for
+a version that reads the cache and only detects missing frames, in blocks,
+so repeat lip-sync runs over the same video go straight to the generator.
+"""
+import hashlib
+import sys, os
+
+import numpy as np
+
+
+FACE_CACHE_DIR = os.environ.get(
+    "TRANS_FACE_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "trans", "wav2lip_faces")
+)
+DETECT_BLOCK = 256
+
+_hashes = {}
+
+
+def video_hash(path):
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    if _hashes.get(path, (None,))[0] != stamp:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _hashes[path] = (stamp, h.hexdigest())
+    return _hashes[path][1]
+
+
+def cache_path(video_path, pads, resize_factor):
+    tag = "_".join(str(int(p)) for p in pads)
+    return os.path.join(FACE_CACHE_DIR,
+                        f"{video_hash(video_path)[:32]}_p{tag}_r{resize_factor}.npy")
+
+
+def load_boxes(path, frames=0):
+    """Cached boxes, grown with -1 rows to at least ``frames`` rows."""
+    boxes = np.load(path) if os.path.exists(path) else np.zeros((0, 4), np.int32)
+    if len(boxes) < frames:
+        boxes = np.concatenate([boxes, np.full((frames - len(boxes), 4), -1, np.int32)])
+    return boxes
+
+
+def save_boxes(path, boxes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npy"
+    np.save(tmp, boxes.astype(np.int32))
+    os.replace(tmp, path)
+
+
+def cached_face_detect(detect, path, offset):
+    """Wrap Wav2Lip's face_detect(images) with the box cache for frames offset, offset+1, ..."""
+    def face_detect(images):
+        boxes = load_boxes(path, offset + len(images))
+        rows = boxes[offset:offset + len(images)]
+        missing = np.flatnonzero(rows[:, 0] < 0)
+        print(f"[FaceCache] {len(images) - len(missing)}/{len(images)} frames cached")
+        for i in range(0, len(missing), DETECT_BLOCK):
+            block = missing[i:i + DETECT_BLOCK]
+            detected = detect([images[j] for j in block])
+            rows[block] = [coords for _, coords in detected]
+            # Save as we go so an interrupted first pass is not lost.
+            save_boxes(path, boxes)
+        return [[img[y1:y2, x1:x2], (y1, y2, x1, x2)]
+                for img, (y1, y2, x1, x2) in zip(images, rows.tolist())]
+    return face_detect
+
+
+if __name__ == "__main__":
+    # face_cache.py --cache PATH --offset N -- <inference.py arguments>
+    split = sys.argv.index("--")
+    opts = dict(zip(sys.argv[1:split:2], sys.argv[2:split:2]))
+    sys.argv = ["inference.py"] + sys.argv[split + 1:]
+
+    import inference
+
+    inference.face_detect = cached_face_detect(inference.face_detect, opts["--cache"],
+                                               int(opts.get("--offset", 0)))
+    inference.main()
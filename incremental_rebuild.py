@@ -0,0 +1,311 @@
+"""Rebuild only the segments that changed since the last run.
+
+Every downstream segment row in the job manifest carries the upstream fields
+it was built from, so the last run is its own baseline:
+
+  * step 3 rows are re-translated where step2_cleaned's text changed, and
+    re-timed where only start/end moved;
+  * step 4 rows are re-synthesised where step 3's Hindi changed;
+  * step 5 rows are re-matched where step 4's timing/text changed or its wav
+    is newer than the matched one (e.g. after _regen_seg.py).
+
+Only those segments go through NLLB/XTTS/duration matching. If anything
+changed, the segments are spliced into dubbed_audio.wav in place and steps
+7-8 are redone the way the last run did them, so final_output.mp4 picks up
+the edit.
+
+Edit the manifest rows (``job_manifest.py set``), or edit step2_cleaned.json
+or step3_meta.json and pass --import-view step2b/step3, then run this
+instead of run_pipeline.py. Step 3 Hindi edited under unchanged English is
+recorded as a translation-memory override, which changes the step 3 cache
+fingerprint, so a later cached run_pipeline.py run re-translates (keeping
+the fix) instead of restoring its cached outputs over the edit.
+"""
+import argparse, time
+import json, sys, os
+
+from job_manifest import STAGE_FILES, JobManifest
+
+
+TIMING = ("start", "end")
+
+
+def _changed(a, b, keys):
+    return any(a.get(k) != b.get(k) for k in keys)
+
+
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+
+def _keep_previous(row):
+    """Move a step 5 row's matched wav aside before it is rewritten; returns the row pointing at it."""
+    kept = row["wav_path"] + ".prev.wav"
+    if os.path.exists(row["wav_path"]):
+        os.replace(row["wav_path"], kept)
+    return dict(row, wav_path=kept)
+
+
+def _replace_segments(manifest, stage, segments, **fields):
+    info = manifest.read_stage(stage)
+    info.update(fields)
+    info["segments"] = segments
+    manifest.write_stage(stage, info, export=False)
+
+
+def rebuild_translations(manifest, model_name, batch_size=8, tm_path=None):
+    """Re-translate step 3 rows whose English changed; returns the changed positions.
+
+    Rows whose Hindi no longer matches the translation memory under the same
+    English were edited by hand and become overrides.
+    """
+    from step3_translate import GENERATION_PARAMS, print_memory_stats, translate_with_memory
+    from translation_memory import DEFAULT_TM_PATH, TranslationMemory
+
+    cleaned = list(manifest.iter_segments("step2b"))
+    translated = list(manifest.iter_segments("step3"))
+    if len(cleaned) != len(translated):
+        print(f"[Rebuild] step2_cleaned has {len(cleaned)} segments, step3 has "
+              f"{len(translated)}; segments were added or removed, run run_pipeline.py")
+        sys.exit(1)
+
+    retext = [i for i, (c, t) in enumerate(zip(cleaned, translated)) if c["text"] != t["english"]]
+    retime = [i for i, (c, t) in enumerate(zip(cleaned, translated))
+              if _changed(c, t, TIMING) and i not in retext]
+
+    tm = TranslationMemory(tm_path or DEFAULT_TM_PATH, model_name, GENERATION_PARAMS)
+    try:
+        # Hindi edited by hand under unchanged English differs from what the
+        # memory would give; make it an override, so cached step 3 results
+        # (keyed on the overrides) are invalidated rather than restored over it.
+        overridden = 0
+        for i, (c, t) in enumerate(zip(cleaned, translated)):
+            if i in retext or not t.get("hindi"):
+                continue
+            remembered = tm.lookup(t["english"])
+            if remembered is not None and remembered != t["hindi"]:
+                tm.set_override(t["english"], t["hindi"])
+                overridden += 1
+        if overridden:
+            print(f"[Rebuild] Step 3: {overridden} hand-edited translations recorded as "
+                  f"translation-memory overrides")
+        tm.hits = tm.misses = tm.override_hits = 0
+        if retext:
+            hindi_texts, _, _ = translate_with_memory([cleaned[i]["text"] for i in retext],
+                                                      model_name, batch_size=batch_size, tm=tm)
+            print_memory_stats(tm)
+    finally:
+        tm.close()
+    if retext:
+        for i, hindi in zip(retext, hindi_texts):
+            translated[i] = manifest.update_segment(
+                "step3", i, start=cleaned[i]["start"], end=cleaned[i]["end"],
+                english=cleaned[i]["text"], hindi=hindi)
+            print(f"  [{i:03d}] {cleaned[i]['text']} → {hindi}")
+    for i in retime:
+        translated[i] = manifest.update_segment("step3", i, start=cleaned[i]["start"],
+                                                end=cleaned[i]["end"])
+
+    if retext or overridden:
+        manifest.update_info("step3", full_hindi=" ".join(s["hindi"] for s in translated))
+    print(f"[Rebuild] Step 3: {len(retext)} re-translated, {len(retime)} re-timed")
+    return set(retext) | set(retime)
+
+
+def rebuild_tts(manifest, output_dir, model_name):
+    """Re-synthesise step 4 rows whose Hindi changed; returns the changed indices."""
+    from step4_tts import load_tts, synthesize_entry
+
+    translated = list(manifest.iter_segments("step3"))
+    rows = {s["index"]: s for s in manifest.iter_segments("step4")}
+    ref_clip = manifest.read_stage("step4")["ref_clip"]
+    tts_dir = os.path.join(output_dir, "tts_segments")
+
+    resynth, retime, removed = [], [], [i for i in rows if i >= len(translated)]
+    for i, seg in enumerate(translated):
+        hindi, row = seg.get("hindi", "").strip(), rows.get(i)
+        if not hindi:
+            if row is not None:
+                removed.append(i)
+        elif row is None or row["hindi"] != hindi:
+            resynth.append(i)
+        elif _changed(seg, row, TIMING):
+            retime.append(i)
+
+    tts = load_tts(model_name) if resynth else None
+    added = False
+    for i in resynth:
+        entry = synthesize_entry(tts, i, translated[i], ref_clip, tts_dir)
+        added = added or i not in rows
+        rows[i] = entry
+    for i in retime:
+        seg = translated[i]
+        rows[i] = dict(rows[i], start=seg["start"], end=seg["end"],
+                       target_duration=round(seg["end"] - seg["start"], 3))
+    for i in removed:
+        del rows[i]
+
+    if added or removed:
+        entries = [rows[i] for i in sorted(rows)]
+        _replace_segments(manifest, "step4", entries, total_segments=len(entries))
+    else:
+        for i in resynth + retime:
+            manifest.update_segment("step4", i, **rows[i])
+    print(f"[Rebuild] Step 4: {len(resynth)} re-synthesised, {len(retime)} re-timed, "
+          f"{len(removed)} removed")
+    return set(resynth) | set(retime) | set(removed)
+
+
+def rebuild_matches(manifest, output_dir, engine="numpy"):
+    """Re-match step 5 rows whose step 4 input changed.
+
+    Returns (old row or None, new row or None) for every changed segment.
+    """
+    from step5_duration_match import process_segment
+
+    wanted = {s["index"]: s for s in manifest.iter_segments("step4") if s["target_duration"] > 0}
+    rows = {s["index"]: s for s in manifest.iter_segments("step5")}
+    matched_dir = os.path.join(output_dir, "matched_segments")
+    os.makedirs(matched_dir, exist_ok=True)
+
+    dirty = [i for i, seg in wanted.items()
+             if i not in rows
+             or _changed(seg, rows[i], TIMING + ("target_duration", "hindi"))
+             or _mtime(seg["wav_path"]) > _mtime(rows[i]["wav_path"])]
+    removed = [i for i in rows if i not in wanted]
+
+    # Keep the audio that is mixed into dubbed_audio.wav so step 6 can splice it out.
+    previous = {i: _keep_previous(rows[i]) for i in set(removed) | set(dirty) if i in rows}
+
+    changes = [(previous[i], None) for i in removed]
+    structural = bool(removed)
+    for i in sorted(dirty):
+        entry, err, _ = process_segment(wanted[i], matched_dir, engine)
+        if entry is None:
+            print(f"  [{i:03d}] ERROR: {err[:100]}")
+            if i in rows:
+                del rows[i]
+                changes.append((previous[i], None))
+                structural = True
+            continue
+        print(f"  [{i:03d}] {entry['tts_duration']:.2f}s → {entry['matched_duration']:.2f}s "
+              f"(target {entry['target_duration']:.2f}s)")
+        structural = structural or i not in rows
+        changes.append((previous.get(i), entry))
+        rows[i] = entry
+    for i in removed:
+        del rows[i]
+
+    if changes:
+        entries = [rows[i] for i in sorted(rows)]
+        avg_error = round(sum(s["duration_error"] for s in entries) / max(len(entries), 1), 4)
+        if structural:
+            _replace_segments(manifest, "step5", entries, total_segments=len(entries),
+                              avg_duration_error=avg_error)
+        else:
+            for old, new in changes:
+                manifest.update_segment("step5", new["index"], **new)
+            manifest.update_info("step5", avg_duration_error=avg_error)
+    print(f"[Rebuild] Step 5: {len(changes)} segments re-matched or removed")
+    return changes
+
+
+def rebuild_outputs(manifest, output_dir, changes, mixer="array", encode_workers=1,
+                    full_remix=False):
+    """Redo steps 6-8 the way the last run did, from the updated step 5 rows.
+
+    The changed segments are spliced into the existing dubbed_audio.wav;
+    it is only re-mixed from every segment if that isn't possible. Windowed
+    lip sync re-runs Wav2Lip only over windows the changed segments touch.
+    """
+    from step6_merge_audio import merge_audio, splice_audio
+    from step7_lipsync import lip_sync
+    from step8_master_encode import assemble, master_encode
+
+    out = lambda name: os.path.join(output_dir, name)
+    input_video = manifest.read_stage("step1")["input_video"]
+    step6 = manifest.read_stage("step6") or {}
+    step7 = manifest.read_stage("step7")
+    step8 = manifest.read_stage("step8") or {}
+
+    mux = bool(step6.get("dubbed_video"))
+    spliced = None if full_remix else splice_audio(changes, input_video, output_dir, mux=mux)
+    if spliced is None:
+        merge_audio(out("step5_meta.json"), input_video, output_dir, mixer=mixer, mux=mux)
+    for old, _ in changes:
+        if old is not None and os.path.exists(old["wav_path"]):
+            os.remove(old["wav_path"])
+    dubbed_audio = out("dubbed_audio.wav")
+
+    video = "encode" if step8.get("video") == "encode" else "auto"
+    if step8.get("assembly") == "fused":
+        return assemble(input_video, dubbed_audio, output_dir, video=video, workers=encode_workers)
+
+    source = step8.get("source_video") or step6.get("dubbed_video")
+    if step7 and (step7["lip_sync_applied"]
+                  or (step7.get("lipsync_video") and source == step7["lipsync_video"])):
+        # Old and new spans of every changed segment: audio under both moved.
+        spans = [(row["start"],
+                  row["start"] + row.get("matched_duration", row["end"] - row["start"]))
+                 for pair in changes for row in pair if row is not None]
+        s7 = lip_sync(input_video, dubbed_audio, output_dir,
+                      use_wav2lip=step7["lip_sync_applied"], mux=bool(step7.get("lipsync_video")),
+                      windows_only="windows" in step7, changed=spans)
+        source = s7["lipsync_video"] or input_video
+    return master_encode(source, output_dir, video=video, workers=encode_workers)
+
+
+def rebuild(output_dir="output", nllb_model=None, xtts_model=None, translate_batch_size=8,
+            match_engine="numpy", mixer="array", encode_workers=1, tm_path=None,
+            full_remix=False, import_views=()):
+    from step3_translate import NLLB_MODEL
+    from step4_tts import XTTS_MODEL
+
+    t0 = time.perf_counter()
+    manifest = JobManifest(output_dir)
+    try:
+        for stage in import_views:
+            manifest.import_view(stage)
+        missing = [s for s in ("step1", "step2b", "step3", "step4", "step5")
+                   if not manifest.has_stage(s)]
+        if missing:
+            print(f"[Rebuild] No {', '.join(missing)} in the job manifest; run "
+                  f"`python job_manifest.py import {output_dir}` first")
+            sys.exit(1)
+
+        print("[Rebuild] Diffing segments against the last run...")
+        changed = rebuild_translations(manifest, nllb_model or NLLB_MODEL,
+                                       translate_batch_size, tm_path)
+        changed |= rebuild_tts(manifest, output_dir, xtts_model or XTTS_MODEL)
+        changes = rebuild_matches(manifest, output_dir, match_engine)
+        manifest.export_all()
+
+        if not changes:
+            print(f"[Rebuild] Nothing to rebuild ({len(changed)} metadata-only changes)")
+            return None
+        result = rebuild_outputs(manifest, output_dir, changes, mixer, encode_workers, full_remix)
+    finally:
+        manifest.close()
+
+    print(f"[Rebuild] {len(changes)} segments rebuilt in {time.perf_counter() - t0:.1f}s "
+          f"→ {result['final_output']}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild only the segments edited since the last run")
+    parser.add_argument("--output-dir", default="output", help="Output directory of the last run")
+    parser.add_argument("--translate-batch-size", type=int, default=8)
+    parser.add_argument("--match-engine", choices=["numpy", "ffmpeg"], default="numpy")
+    parser.add_argument("--mixer", choices=["array", "ffmpeg"], default="array")
+    parser.add_argument("--encode-workers", type=int, default=1)
+    parser.add_argument("--import-view", action="append", default=[], choices=list(STAGE_FILES),
+                        help="Take this stage's hand-edited JSON view into the manifest first "
+                             "(repeatable)")
+    parser.add_argument("--full-remix", action="store_true",
+                        help="Re-mix dubbed_audio.wav from every segment instead of splicing")
+    args = parser.parse_args()
+
+    rebuild(args.output_dir, translate_batch_size=args.translate_batch_size,
+            match_engine=args.match_engine, mixer=args.mixer, encode_workers=args.encode_workers,
+            full_remix=args.full_remix, import_views=args.import_view)
@@ -0,0 +1,284 @@
+"""SQLite job manifest: every stage's meta for one output directory, one row per segment.
+
+The manifest is the source of truth. Steps write through save_meta(), which
+stores the stage and exports its stepN_meta.json view at the stage boundary,
+and read through load_meta(), which reads the manifest. Single-segment edits
+(_regen_seg.py, _patch_translations.py, ``job_manifest.py set``) change one
+row in one indexed transaction and only mark the view stale; stale views are
+rewritten by export_all() / ``job_manifest.py export``.
+
+JSON views are never read back implicitly. A hand-edited view is taken in
+only with ``job_manifest.py import`` (or when the stage cache restores a
+stage's cached outputs).
+"""
+import sqlite3, tempfile, time
+import json, sys, os
+
+
+MANIFEST_NAME = "job.sqlite"
+
+# Stage name → exported JSON view.
+STAGE_FILES = {
+    "step1": "step1_meta.json",
+    "step2": "step2_meta.json",
+    "step2b": "step2_cleaned.json",
+    "step3": "step3_meta.json",
+    "step4": "step4_meta.json",
+    "step5": "step5_meta.json",
+    "step6": "step6_meta.json",
+    "step7": "step7_meta.json",
+    "step8": "step8_meta.json",
+}
+FILE_STAGES = {name: stage for stage, name in STAGE_FILES.items()}
+
+
+class JobManifest:
+    """Per-output-dir store of stage info plus per-segment rows keyed by (stage, index).
+
+    A segment's index is its "index" field when it has one (steps 4-5, which
+    carry the step 3 position), otherwise its position in the stage's list.
+    Lists whose "index" values repeat fall back to positions.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        os.makedirs(output_dir, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS stages (
+                stage TEXT PRIMARY KEY,
+                info TEXT NOT NULL,
+                has_segments INTEGER NOT NULL,
+                dirty INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS segments (
+                stage TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                pos INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (stage, idx)
+            );
+            CREATE INDEX IF NOT EXISTS segments_order ON segments (stage, pos);
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so concurrent
+        # read-modify-write updates serialise instead of losing each other.
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def view_path(self, stage):
+        return os.path.join(self.output_dir, STAGE_FILES[stage])
+
+    def has_stage(self, stage):
+        return self.db.execute("SELECT 1 FROM stages WHERE stage = ?", (stage,)).fetchone() is not None
+
+    def stage_updated(self, stage):
+        """Time of the stage's last write or edit (None if unknown); changes with every edit."""
+        row = self.db.execute("SELECT updated FROM stages WHERE stage = ?", (stage,)).fetchone()
+        return row[0] if row else None
+
+    def write_stage(self, stage, info, export=True):
+        """Replace a stage's info and segment rows in one transaction (and export its view)."""
+        info = dict(info)
+        segments = info.pop("segments", None)
+        keys = [seg.get("index", pos) for pos, seg in enumerate(segments or ())]
+        if len(set(keys)) != len(keys):
+            keys = list(range(len(keys)))
+        now = time.time()
+        self._transaction()
+        try:
+            self.db.execute("DELETE FROM segments WHERE stage = ?", (stage,))
+            if segments is not None:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO segments (stage, idx, pos, data, updated) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(stage, idx, pos, json.dumps(seg, ensure_ascii=False), now)
+                     for pos, (idx, seg) in enumerate(zip(keys, segments))]
+                )
+            self.db.execute(
+                "INSERT OR REPLACE INTO stages (stage, info, has_segments, dirty, updated) "
+                "VALUES (?, ?, ?, 1, ?)",
+                (stage, json.dumps(info, ensure_ascii=False), segments is not None, now)
+            )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        if export:
+            self.export(stage)
+
+    def read_stage(self, stage):
+        """The stage's meta dict, as its JSON view would contain it; None if unknown."""
+        # One read transaction, so info and rows come from the same snapshot.
+        self.db.execute("BEGIN")
+        try:
+            row = self.db.execute("SELECT info, has_segments FROM stages WHERE stage = ?",
+                                  (stage,)).fetchone()
+            if row is None:
+                return None
+            info = json.loads(row[0])
+            if row[1]:
+                info["segments"] = list(self.iter_segments(stage))
+            return info
+        finally:
+            self.db.execute("COMMIT")
+
+    def iter_segments(self, stage):
+        for (data,) in self.db.execute(
+                "SELECT data FROM segments WHERE stage = ? ORDER BY pos", (stage,)).fetchall():
+            yield json.loads(data)
+
+    def get_segment(self, stage, idx):
+        row = self.db.execute("SELECT data FROM segments WHERE stage = ? AND idx = ?",
+                              (stage, idx)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_segment(self, stage, idx, **fields):
+        """Merge ``fields`` into one segment row and mark the view stale; returns the segment."""
+        self._transaction()
+        try:
+            row = self.db.execute("SELECT data FROM segments WHERE stage = ? AND idx = ?",
+                                  (stage, idx)).fetchone()
+            if row is None:
+                raise KeyError(f"{stage} has no segment {idx}")
+            seg = json.loads(row[0])
+            seg.update(fields)
+            now = time.time()
+            self.db.execute("UPDATE segments SET data = ?, updated = ? WHERE stage = ? AND idx = ?",
+                            (json.dumps(seg, ensure_ascii=False), now, stage, idx))
+            self.db.execute("UPDATE stages SET dirty = 1, updated = ? WHERE stage = ?",
+                            (now, stage))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return seg
+
+    def update_info(self, stage, **fields):
+        """Merge ``fields`` into the stage's top-level info (not its segments)."""
+        self._transaction()
+        try:
+            row = self.db.execute("SELECT info FROM stages WHERE stage = ?", (stage,)).fetchone()
+            if row is None:
+                raise KeyError(f"no {stage} in manifest")
+            info = json.loads(row[0])
+            info.update(fields)
+            self.db.execute("UPDATE stages SET info = ?, dirty = 1, updated = ? WHERE stage = ?",
+                            (json.dumps(info, ensure_ascii=False), time.time(), stage))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return info
+
+    def find_segments(self, stage, field, value):
+        """Segments of ``stage`` whose ``field`` equals ``value``."""
+        return [json.loads(data) for (data,) in self.db.execute(
+            "SELECT data FROM segments WHERE stage = ? AND json_extract(data, ?) = ? ORDER BY pos",
+            (stage, f"$.{field}", value))]
+
+    def export(self, stage):
+        """Write the stage's JSON view from the store."""
+        started = time.time()
+        info = self.read_stage(stage)
+        path = self.view_path(stage)
+        # A private temp file per writer; os.replace makes the new view appear atomically.
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                   dir=self.output_dir)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(info, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        # Rows edited while we were writing keep the view marked stale.
+        self.db.execute("UPDATE stages SET dirty = 0 WHERE stage = ? AND updated <= ?",
+                        (stage, started))
+        return path
+
+    def export_all(self):
+        """Re-export every stale view."""
+        return [self.export(stage) for (stage,) in
+                self.db.execute("SELECT stage FROM stages WHERE dirty = 1").fetchall()]
+
+    def import_view(self, stage):
+        """Replace the stage's rows with its JSON view on disk (e.g. after a hand edit)."""
+        with open(self.view_path(stage)) as f:
+            info = json.load(f)
+        self.write_stage(stage, info, export=False)
+        self.db.execute("UPDATE stages SET dirty = 0 WHERE stage = ?", (stage,))
+
+
+def save_meta(meta_path, info):
+    """Record a stage's meta in its directory's manifest and export the JSON view to meta_path."""
+    stage = FILE_STAGES.get(os.path.basename(meta_path))
+    if stage is None:
+        with open(meta_path, "w") as f:
+            json.dump(info, f, indent=2, ensure_ascii=False)
+        return
+    with JobManifest(os.path.dirname(meta_path) or ".") as manifest:
+        manifest.write_stage(stage, info)
+
+
+def load_meta(meta_path):
+    """A stage's meta, read from the manifest (or the plain JSON file outside of one).
+
+    Raises FileNotFoundError when the stage's view is gone, as reading the
+    JSON file did, so a deleted stage output still counts as missing.
+    """
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(meta_path)
+    stage = FILE_STAGES.get(os.path.basename(meta_path))
+    output_dir = os.path.dirname(meta_path) or "."
+    info = None
+    if stage is not None and os.path.exists(os.path.join(output_dir, MANIFEST_NAME)):
+        with JobManifest(output_dir) as manifest:
+            info = manifest.read_stage(stage)
+    if info is None:
+        with open(meta_path) as f:
+            info = json.load(f)
+    return info
+
+
+if __name__ == "__main__":
+    # job_manifest.py export [output_dir]                     re-export stale JSON views
+    # job_manifest.py import [output_dir] [stage ...]         take hand-edited views into the manifest
+    # job_manifest.py get [output_dir] STAGE INDEX
+    # job_manifest.py set [output_dir] STAGE INDEX FIELD VALUE
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "export"
+    out = sys.argv[2] if len(sys.argv) > 2 else "output"
+    rest = sys.argv[3:]
+    with JobManifest(out) as manifest:
+        if cmd == "import":
+            for stage in rest or [s for s in STAGE_FILES if os.path.exists(manifest.view_path(s))]:
+                manifest.import_view(stage)
+                print(f"[Manifest] Imported {manifest.view_path(stage)}")
+        elif cmd == "get":
+            print(json.dumps(manifest.get_segment(rest[0], int(rest[1])), indent=2,
+                             ensure_ascii=False))
+        elif cmd == "set":
+            stage, idx, field, value = rest[0], int(rest[1]), rest[2], rest[3]
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+            seg = manifest.update_segment(stage, idx, **{field: value})
+            print(json.dumps(seg, indent=2, ensure_ascii=False))
+        else:
+            for path in manifest.export_all():
+                print(f"[Manifest] Exported {path}")
@@ -0,0 +1,188 @@
+import argparse, socket, socketserver, threading, time
+import json, sys, os
+
+
+SOCKET_PATH = os.environ.get("TRANS_MODEL_SOCKET", "/tmp/trans-model-server.sock")
+
+_models = {}
+_load_lock = threading.Lock()
+_infer_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"started": time.time(), "requests": 0}
+
+
+def _connect(path, timeout):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(path)
+    return sock
+
+
+def _roundtrip(sock, payload):
+    f = sock.makefile("rw", encoding="utf-8")
+    f.write(json.dumps(payload) + "\n")
+    f.flush()
+    line = f.readline()
+    if not line:
+        raise RuntimeError("Model server closed the connection")
+    return json.loads(line)
+
+
+def available(path=SOCKET_PATH):
+    if os.environ.get("TRANS_NO_MODEL_SERVER") or not os.path.exists(path):
+        return False
+    try:
+        with _connect(path, 1.0) as sock:
+            return _roundtrip(sock, {"op": "ping"}).get("ok", False)
+    except (OSError, ValueError, RuntimeError):
+        return False
+
+
+def call(op, path=SOCKET_PATH, **kwargs):
+    """Send one request to the model server.
+
+    Returns None when no server is running so callers can fall back to loading
+    the model in-process. Errors raised inside the server are re-raised here.
+    """
+    if not available(path):
+        return None
+    with _connect(path, 5.0) as sock:
+        sock.settimeout(None)
+        resp = _roundtrip(sock, dict(kwargs, op=op))
+    if not resp.get("ok"):
+        raise RuntimeError(f"Model server {op} failed: {resp.get('error')}")
+    return resp["result"]
+
+
+class RemoteTTS:
+    """Stand-in for TTS.api.TTS that forwards tts_to_file to the model server."""
+
+    def __init__(self, model_name, path=SOCKET_PATH):
+        self.model_name = model_name
+        self.path = path
+
+    def tts_to_file(self, text, speaker_wav, language, file_path):
+        call("synthesize", self.path, model_name=self.model_name, text=text,
+             speaker_wav=os.path.abspath(speaker_wav), language=language,
+             file_path=os.path.abspath(file_path))
+        return file_path
+
+
+def _get_model(kind, model_name, **opts):
+    key = ":".join([kind, model_name] + [f"{k}={v}" for k, v in sorted(opts.items())])
+    with _load_lock:
+        if key not in _models:
+            t0 = time.perf_counter()
+            print(f"[Server] Loading {key}...")
+            if kind == "whisper":
+                from step2_transcribe import load_whisper
+                _models[key] = load_whisper(model_name, **opts)
+            elif kind == "nllb":
+                from step3_translate import load_nllb
+                _models[key] = load_nllb(model_name)
+            elif kind == "xtts":
+                from step4_tts import load_local_tts
+                _models[key] = load_local_tts(model_name)
+            else:
+                raise ValueError(f"Unknown model kind: {kind}")
+            print(f"[Server] Loaded {key} in {time.perf_counter() - t0:.1f}s")
+        return _models[key]
+
+
+def _dispatch(req):
+    op = req.get("op")
+    if op == "ping":
+        return "pong"
+    if op == "shutdown":
+        return "bye"
+    if op == "stats":
+        with _stats_lock:
+            requests = _stats["requests"]
+        return {"models": sorted(_models), "requests": requests,
+                "uptime": round(time.time() - _stats["started"], 1)}
+
+    with _stats_lock:
+        _stats["requests"] += 1
+    if op == "transcribe":
+        from step2_transcribe import run_whisper
+        model = _get_model("whisper", req["model_name"], backend=req.get("backend", "openai"),
+                           cpu_threads=req.get("cpu_threads", 0))
+        with _infer_lock:
+            return run_whisper(model, req["audio_path"], req.get("start"), req.get("end"),
+                               req.get("regions"))
+    if op == "translate":
+        from step3_translate import translate_texts
+        tokenizer, model = _get_model("nllb", req["model_name"])
+        with _infer_lock:
+            return translate_texts(req["texts"], tokenizer, model,
+                                   batch_size=req.get("batch_size", 8))
+    if op == "synthesize":
+        from step4_tts import synthesize_segment
+        tts = _get_model("xtts", req["model_name"])
+        with _infer_lock:
+            return synthesize_segment(tts, req["text"], req["speaker_wav"], req["file_path"],
+                                      language=req["language"])
+    raise ValueError(f"Unknown op: {op}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            req = {}
+            try:
+                req = json.loads(line)
+                resp = {"ok": True, "result": _dispatch(req)}
+            except Exception as e:
+                resp = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(resp) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if req.get("op") == "shutdown":
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path=SOCKET_PATH, preload=()):
+    if os.path.exists(path):
+        if available(path):
+            print(f"[Server] Already running on {path}")
+            return
+        os.remove(path)
+
+    for spec in preload:
+        kind, _, model_name = spec.partition("=")
+        if kind == "whisper":
+            _get_model(kind, model_name, backend="openai", cpu_threads=0)
+        elif kind == "whisper-ct2":
+            _get_model("whisper", model_name, backend="ctranslate2", cpu_threads=0)
+        else:
+            _get_model(kind, model_name)
+
+    server = _Server(path, _Handler)
+    print(f"[Server] Listening on {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep Whisper/NLLB/XTTS resident across pipeline runs")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path")
+    parser.add_argument("--preload", action="append", default=[],
+                        help="kind=model to load at startup, e.g. whisper=medium, whisper-ct2=medium, "
+                             "nllb=facebook/nllb-200-1.3B, xtts=tts_models/multilingual/multi-dataset/xtts_v2")
+    parser.add_argument("--stop", action="store_true", help="Stop a running server")
+    parser.add_argument("--status", action="store_true", help="Show loaded models")
+    args = parser.parse_args()
+
+    if args.stop:
+        print("[Server] Stopped" if call("shutdown", args.socket) is not None else "[Server] Not running")
+    elif args.status:
+        print(call("stats", args.socket) or "[Server] Not running")
+    else:
+        serve(args.socket, args.preload)
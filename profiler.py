@@ -0,0 +1,220 @@
+"""Opt-in per-stage profiling for run_pipeline.
+
+profiler.enable() turns it on for the process. After that:
+
+  * ``stage(name)`` measures wall time, CPU time (this process plus finished
+    children such as ffmpeg) and peak RSS around one pipeline stage;
+  * ``span(name, **args)`` / ``record(...)`` add finer events, e.g. one per
+    segment in steps 3-5;
+  * every subprocess.Popen (so every subprocess.run of ffmpeg/ffprobe) is
+    counted per executable and stage.
+
+write_trace() emits Chrome-trace JSON (open in chrome://tracing or
+ui.perfetto.dev), summary() prints a table and write_metrics() dumps the
+same numbers as JSON for tracking across releases. When profiling is not
+enabled every call is a cheap no-op.
+
+Subprocesses started inside ProcessPoolExecutor workers are not counted;
+their per-segment timings are recorded by the parent from returned values.
+"""
+import resource, subprocess, threading, time
+import json, sys, os
+from contextlib import contextmanager
+
+
+_active = None
+
+
+class Profiler:
+    def __init__(self, rss_interval=0.05):
+        self.t0 = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.stages = []
+        self.launches = {}
+        self.current_stage = None
+        self._lock = threading.Lock()
+        self._rss_interval = rss_interval
+        self._rss_peak = 0
+
+    def _ts(self, t):
+        return round((t - self.t0) * 1e6, 1)
+
+    def add_event(self, name, cat, start, seconds, tid=None, args=None):
+        event = {"name": name, "cat": cat, "ph": "X", "ts": self._ts(start),
+                 "dur": round(seconds * 1e6, 1), "pid": self.pid,
+                 "tid": tid if tid is not None else threading.get_ident()}
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def count_launch(self, argv):
+        exe = argv if isinstance(argv, str) else (argv[0] if argv else "?")
+        exe = os.path.basename(str(exe).split()[0]) if exe else "?"
+        with self._lock:
+            per_exe = self.launches.setdefault(self.current_stage or "-", {})
+            per_exe[exe] = per_exe.get(exe, 0) + 1
+            self.events.append({"name": exe, "cat": "subprocess", "ph": "i", "s": "t",
+                                "ts": self._ts(time.perf_counter()), "pid": self.pid,
+                                "tid": threading.get_ident()})
+
+    def _sample_rss(self, stop):
+        while not stop.wait(self._rss_interval):
+            self._rss_peak = max(self._rss_peak, _current_rss())
+
+    @contextmanager
+    def stage(self, name, **args):
+        previous, self.current_stage = self.current_stage, name
+        self._rss_peak = _current_rss()
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample_rss, args=(stop,), daemon=True)
+        sampler.start()
+
+        self_cpu, child_cpu = _cpu(resource.RUSAGE_SELF), _cpu(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            wall = time.perf_counter() - start
+            stop.set()
+            sampler.join()
+            self_cpu = _cpu(resource.RUSAGE_SELF) - self_cpu
+            child_cpu = _cpu(resource.RUSAGE_CHILDREN) - child_cpu
+            self.current_stage = previous
+
+            row = {
+                "stage": name,
+                "wall_s": round(wall, 3),
+                "cpu_s": round(self_cpu, 3),
+                "child_cpu_s": round(child_cpu, 3),
+                "peak_rss_mb": round(max(self._rss_peak, _current_rss()) / 2 ** 20, 1),
+                "subprocesses": sum(self.launches.get(name, {}).values()),
+            }
+            row.update(args)
+            self.stages.append(row)
+            self.add_event(name, "stage", start, wall, args=row)
+
+    def metrics(self):
+        return {
+            "total_wall_s": round(time.perf_counter() - self.t0, 3),
+            "max_rss_mb": round(_max_rss(resource.RUSAGE_SELF) / 2 ** 20, 1),
+            "max_child_rss_mb": round(_max_rss(resource.RUSAGE_CHILDREN) / 2 ** 20, 1),
+            "stages": self.stages,
+            "subprocesses": self.launches,
+            "spans": _span_stats(self.events),
+        }
+
+
+def _cpu(who):
+    r = resource.getrusage(who)
+    return r.ru_utime + r.ru_stime
+
+
+def _max_rss(who):
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(who).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return _max_rss(resource.RUSAGE_SELF)
+
+
+def _span_stats(events):
+    stats = {}
+    for e in events:
+        if e["ph"] != "X" or e["cat"] == "stage":
+            continue
+        s = stats.setdefault(e["name"], {"count": 0, "total_s": 0.0, "max_s": 0.0})
+        s["count"] += 1
+        s["total_s"] += e["dur"] / 1e6
+        s["max_s"] = max(s["max_s"], e["dur"] / 1e6)
+    for s in stats.values():
+        s["mean_s"] = round(s["total_s"] / s["count"], 4)
+        s["total_s"] = round(s["total_s"], 3)
+        s["max_s"] = round(s["max_s"], 4)
+    return stats
+
+
+_popen_init = subprocess.Popen.__init__
+
+
+def _counting_popen_init(self, args, *a, **kw):
+    if _active is not None:
+        _active.count_launch(args)
+    _popen_init(self, args, *a, **kw)
+
+
+def enable():
+    """Start profiling this process; returns the Profiler."""
+    global _active
+    if _active is None:
+        _active = Profiler()
+        subprocess.Popen.__init__ = _counting_popen_init
+    return _active
+
+
+def active():
+    return _active
+
+
+@contextmanager
+def stage(name, **args):
+    if _active is None:
+        yield args
+        return
+    with _active.stage(name, **args) as extra:
+        yield extra
+
+
+@contextmanager
+def span(name, **args):
+    if _active is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active.add_event(name, "span", start, time.perf_counter() - start, args=args or None)
+
+
+def record(name, start, seconds, tid=None, **args):
+    """Add an already-measured span (``start`` from time.perf_counter, possibly in another process)."""
+    if _active is not None:
+        _active.add_event(name, "span", start, seconds, tid=tid, args=args or None)
+
+
+def write_trace(path):
+    with open(path, "w") as f:
+        json.dump({"traceEvents": _active.events, "displayTimeUnit": "ms"}, f)
+
+
+def write_metrics(path):
+    with open(path, "w") as f:
+        json.dump(_active.metrics(), f, indent=2)
+
+
+def summary():
+    m = _active.metrics()
+    print(f"{'stage':<10} {'wall s':>9} {'cpu s':>9} {'child s':>9} {'peak MB':>9} {'procs':>6}")
+    for row in m["stages"]:
+        cached = " (cached)" if row.get("cached") else ""
+        print(f"{row['stage']:<10} {row['wall_s']:>9.2f} {row['cpu_s']:>9.2f} "
+              f"{row['child_cpu_s']:>9.2f} {row['peak_rss_mb']:>9.1f} {row['subprocesses']:>6}{cached}")
+    print(f"{'total':<10} {m['total_wall_s']:>9.2f}  max RSS {m['max_rss_mb']:.1f} MB, "
+          f"largest child {m['max_child_rss_mb']:.1f} MB")
+    for name, s in sorted(m["spans"].items()):
+        print(f"  {name:<22} n={s['count']:<5} mean {s['mean_s'] * 1000:8.1f} ms  "
+              f"max {s['max_s'] * 1000:8.1f} ms")
+    launches = {}
+    for per_exe in m["subprocesses"].values():
+        for exe, n in per_exe.items():
+            launches[exe] = launches.get(exe, 0) + n
+    if launches:
+        print("  subprocesses: " + ", ".join(f"{exe} ×{n}" for exe, n in sorted(launches.items())))
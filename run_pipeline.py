@@ -1,81 +1,334 @@
 import sys, os, json, argparse
 
+import profiler
+from stage_cache import StageCache, stage_code
+from step2b_clean_asr import DEFAULT_GLOSSARY
+from translation_memory import overrides_digest
 
-def load_meta(path):
-    with open(path) as f:
-        return json.load(f)
 
+WHISPER_MODEL = "medium"
+NLLB_MODEL = "facebook/nllb-200-1.3B"
+XTTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
 
-def run_pipeline(input_video, output_dir="output", skip_lipsync=False):
-    os.makedirs(output_dir, exist_ok=True)
-
-    print("=" * 60)
-    print("  Kannada → Hindi Dubbing Pipeline")
-    print("=" * 60)
 
-    print("\n[1/8] Extracting audio...")
+def _step1(input_video, output_dir):
     from step1_extract_audio import extract_audio
-    s1 = extract_audio(input_video, output_dir)
-    audio_wav = s1["audio_path"]
+    return extract_audio(input_video, output_dir)
+
 
-    print("\n[2/8] Transcribing (Kannada → English via Whisper)...")
+def _step2(audio_wav, output_dir, backend, cpu_threads, workers, vad):
     from step2_transcribe import transcribe
-    transcribe(audio_wav, output_dir)
-    s2_meta = os.path.join(output_dir, "step2_meta.json")
+    return transcribe(audio_wav, output_dir, model_name=WHISPER_MODEL, backend=backend,
+                      cpu_threads=cpu_threads, workers=workers, vad=vad)
+
 
-    print("\n[2b/8] Cleaning ASR output...")
+def _step2b(s2_meta, output_dir):
     from step2b_clean_asr import clean_asr
-    clean_asr(s2_meta, output_dir)
-    s2b_meta = os.path.join(output_dir, "step2_cleaned.json")
+    return clean_asr(s2_meta, output_dir)
 
-    print("\n[3/8] Translating English → Hindi (NLLB-1.3B)...")
+
+def _step3(s2b_meta, output_dir, batch_size):
     from step3_translate import translate
-    translate(s2b_meta, output_dir)
-    s3_meta = os.path.join(output_dir, "step3_meta.json")
+    return translate(s2b_meta, output_dir, model_name=NLLB_MODEL, batch_size=batch_size)
+
 
-    print("\n[4/8] Hindi TTS with voice cloning (F5-TTS)...")
+def _step4(s3_meta, audio_wav, output_dir):
     from step4_tts import synthesize_all
-    synthesize_all(s3_meta, audio_wav, output_dir)
+    return synthesize_all(s3_meta, audio_wav, output_dir, model_name=XTTS_MODEL)
 
-    s4_meta = os.path.join(output_dir, "step4_meta.json")
 
-    print("\n[5/8] Matching TTS duration to original timings...")
+def _step5(s4_meta, output_dir, engine, workers):
     from step5_duration_match import match_durations
-    match_durations(s4_meta, output_dir)
+    return match_durations(s4_meta, output_dir, engine=engine, workers=workers)
 
-    s5_meta = os.path.join(output_dir, "step5_meta.json")
 
-    print("\n[6/8] Merging dubbed audio with video...")
+def _step6(s5_meta, input_video, output_dir, mixer, mux):
     from step6_merge_audio import merge_audio
-    merge_audio(s5_meta, input_video, output_dir)
+    return merge_audio(s5_meta, input_video, output_dir, mixer=mixer, mux=mux)
+
 
-    dubbed_video = os.path.join(output_dir, "dubbed_video.mp4")
-    dubbed_audio = os.path.join(output_dir, "dubbed_audio.wav")
+def _stream(audio_wav, input_video, output_dir, **kwargs):
+    from stream_pipeline import run_streaming
+    return run_streaming(audio_wav, input_video, output_dir, **kwargs)
+
+
+def _step7(input_video, dubbed_audio, output_dir, mux, wav2lip):
+    from step7_lipsync import lip_sync
+    return lip_sync(input_video, dubbed_audio, output_dir, use_wav2lip=wav2lip, mux=mux)
+
+
+def _step8(lipsync_video, output_dir, video, workers):
+    from step8_master_encode import master_encode
+    return master_encode(lipsync_video, output_dir, video=video, workers=workers)
+
+
+def _assemble(input_video, dubbed_audio, output_dir, video, workers):
+    from step8_master_encode import assemble
+    return assemble(input_video, dubbed_audio, output_dir, video=video, workers=workers)
+
+
+def pipeline_stages(input_video, output_dir="output", skip_lipsync=False, use_cache=True,
+                 translate_batch_size=8, match_engine="numpy", mixer="array",
+                 match_workers=1, stream=False, whisper_backend="openai", whisper_threads=0,
+                 whisper_workers=1, vad=False, assembly="fused",
+                 reencode_video=False, encode_workers=1, wav2lip=False, profile=False,
+                 metrics_path=None):
+    """The pipeline for one video as a generator.
+
+    Yields each stage's name just before running it and returns the final
+    output path, so batch_pipeline can step many videos through the stages
+    together. run_pipeline drives it to completion.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cache = StageCache(output_dir, enabled=use_cache)
+    if profile or metrics_path:
+        profiler.enable()
 
+    def run(stage, *args, **kwargs):
+        yield stage
+        with profiler.stage(stage) as extra:
+            hits = cache.hits
+            result = cache.run(stage, *args, **kwargs)
+            extra["cached"] = cache.hits > hits
+        return result
+
+    def out(name):
+        return os.path.join(output_dir, name)
+
+    print("=" * 60)
+    print("  Kannada → Hindi Dubbing Pipeline")
+    print("=" * 60)
+
+    print("\n[1/8] Extracting audio...")
+    s1 = yield from run(
+        "step1", _step1, (input_video, output_dir),
+        inputs=[input_video],
+        code=stage_code("step1_extract_audio.py"),
+        outputs=[out("audio.wav"), out("step1_meta.json")],
+    )
+    audio_wav = s1["audio_path"]
+
+    dubbed_video = out("dubbed_video.mp4")
+    dubbed_audio = out("dubbed_audio.wav")
+    # Fused assembly goes straight from the original video + dubbed_audio.wav to
+    # final_output.mp4; the staged path also writes dubbed_video/lipsync_video.
+    staged = assembly == "staged"
+    video_mode = "encode" if reencode_video else "auto"
+
+    if stream:
+        print("\n[2-6/8] Streaming transcribe → clean → translate → TTS → match → mix...")
+        yield from run(
+            "stream", _stream, (audio_wav, input_video, output_dir),
+            kwargs={"whisper_model": WHISPER_MODEL, "whisper_backend": whisper_backend,
+                    "nllb_model": NLLB_MODEL,
+                    "xtts_model": XTTS_MODEL, "translate_batch_size": translate_batch_size,
+                    "match_engine": match_engine, "mixer": mixer, "vad": vad, "mux": staged},
+            inputs=[audio_wav, input_video, DEFAULT_GLOSSARY],
+            params={"whisper": WHISPER_MODEL, "whisper_backend": whisper_backend,
+                    "nllb": NLLB_MODEL, "xtts": XTTS_MODEL,
+                    "batch_size": translate_batch_size, "engine": match_engine,
+                    "mixer": mixer, "vad": vad, "mux": staged,
+                    "tm_overrides": overrides_digest()},
+            code=stage_code("stream_pipeline.py", "step2_transcribe.py", "step2b_clean_asr.py",
+                            "step3_translate.py", "step4_tts.py", "step5_duration_match.py",
+                            "step6_merge_audio.py", "audio_dsp.py", "audio_buffer.py", "vad.py"),
+            outputs=[out(n) for n in (
+                "step2_meta.json", "step2_cleaned.json", "step3_meta.json", "step4_meta.json",
+                "step5_meta.json", "step6_meta.json", "ref_speaker.wav", "tts_segments",
+                "matched_segments", "dubbed_audio.wav", "dubbed_video.mp4"
+            )],
+        )
+    else:
+        print("\n[2/8] Transcribing (Kannada → English via Whisper)...")
+        s2_meta = out("step2_meta.json")
+        yield from run(
+            "step2", _step2,
+            (audio_wav, output_dir, whisper_backend, whisper_threads, whisper_workers, vad),
+            inputs=[audio_wav],
+            params={"model": WHISPER_MODEL, "backend": whisper_backend,
+                    "chunked": whisper_workers > 1, "vad": vad,
+                    "task": "translate", "language": "kn"},
+            code=stage_code("step2_transcribe.py", "vad.py", "audio_dsp.py", "audio_buffer.py"),
+            outputs=[s2_meta],
+        )
+
+        print("\n[2b/8] Cleaning ASR output...")
+        s2b_meta = out("step2_cleaned.json")
+        yield from run(
+            "step2b", _step2b, (s2_meta, output_dir),
+            inputs=[DEFAULT_GLOSSARY],
+            metas=[s2_meta],
+            code=stage_code("step2b_clean_asr.py"),
+            outputs=[s2b_meta],
+        )
+
+        print("\n[3/8] Translating English → Hindi (NLLB-1.3B)...")
+        s3_meta = out("step3_meta.json")
+        yield from run(
+            "step3", _step3, (s2b_meta, output_dir, translate_batch_size),
+            metas=[s2b_meta],
+            params={"model": NLLB_MODEL, "batch_size": translate_batch_size,
+                    "tm_overrides": overrides_digest()},
+            code=stage_code("step3_translate.py"),
+            outputs=[s3_meta],
+        )
+
+        print("\n[4/8] Hindi TTS with voice cloning (F5-TTS)...")
+        s4_meta = out("step4_meta.json")
+        yield from run(
+            "step4", _step4, (s3_meta, audio_wav, output_dir),
+            inputs=[audio_wav],
+            metas=[s3_meta],
+            params={"model": XTTS_MODEL},
+            code=stage_code("step4_tts.py", "audio_buffer.py"),
+            outputs=[s4_meta, out("ref_speaker.wav"), out("tts_segments")],
+        )
+
+        print("\n[5/8] Matching TTS duration to original timings...")
+        s5_meta = out("step5_meta.json")
+        yield from run(
+            "step5", _step5, (s4_meta, output_dir, match_engine, match_workers),
+            inputs=[out("tts_segments")],
+            metas=[s4_meta],
+            params={"engine": match_engine},
+            code=stage_code("step5_duration_match.py", "audio_dsp.py"),
+            outputs=[s5_meta, out("matched_segments")],
+        )
+
+        print("\n[6/8] Merging dubbed audio with video...")
+        yield from run(
+            "step6", _step6, (s5_meta, input_video, output_dir, mixer, staged),
+            inputs=[input_video, out("matched_segments")],
+            metas=[s5_meta],
+            params={"mixer": mixer, "mux": staged},
+            code=stage_code("step6_merge_audio.py", "audio_dsp.py"),
+            outputs=[dubbed_audio, dubbed_video, out("step6_meta.json")],
+        )
+
+    lip_synced = False
     if not skip_lipsync:
         print("\n[7/8] Lip sync (Wav2Lip)...")
-        from step7_lipsync import lip_sync
-        s7 = lip_sync(input_video, dubbed_audio, output_dir)
-        lipsync_video = s7["lipsync_video"]
+        s7 = yield from run(
+            "step7", _step7, (input_video, dubbed_audio, output_dir, staged, wav2lip),
+            inputs=[input_video, dubbed_audio],
+            metas=[out("step5_meta.json")] if wav2lip else [],
+            params={"mux": staged, "wav2lip": wav2lip},
+            code=stage_code("step7_lipsync.py"),
+            outputs=[out("lipsync_video.mp4"), out("lipsync_windows"), out("step7_meta.json")],
+        )
+        # Window lip sync without a mux leaves only clips; step 8 splices them into the source.
+        lipsync_video = s7["lipsync_video"] or input_video
+        lip_synced = s7["lip_sync_applied"]
     else:
         print("\n[7/8] Skipping lip sync.")
         lipsync_video = dubbed_video
 
-    print("\n[8/8] Audio mastering and final encode...")
-    from step8_master_encode import master_encode
-    s8 = master_encode(lipsync_video, output_dir)
+    if staged or lip_synced:
+        print("\n[8/8] Audio mastering and final encode...")
+        s8 = yield from run(
+            "step8", _step8, (lipsync_video, output_dir, video_mode, encode_workers),
+            inputs=[lipsync_video] if skip_lipsync else [lipsync_video, dubbed_audio,
+                                                          out("lipsync_windows")],
+            metas=[] if skip_lipsync else [out("step7_meta.json")],
+            params={"video": video_mode, "encode_workers": encode_workers},
+            code=stage_code("step8_master_encode.py"),
+            outputs=[out("final_output.mp4"), out("step8_meta.json")],
+        )
+    else:
+        print("\n[8/8] Single-pass mux, mastering and final encode...")
+        s8 = yield from run(
+            "step8", _assemble, (input_video, dubbed_audio, output_dir, video_mode, encode_workers),
+            inputs=[input_video, dubbed_audio],
+            params={"assembly": "fused", "video": video_mode, "encode_workers": encode_workers},
+            code=stage_code("step8_master_encode.py"),
+            outputs=[out("final_output.mp4"), out("step8_meta.json")],
+        )
 
     print("\n" + "=" * 60)
     print(f"  DONE → {s8['final_output']}")
+    if use_cache:
+        print(f"  Stage cache: {cache.hits} reused, {cache.misses} executed")
     print("=" * 60)
+
+    if profiler.active():
+        trace_path = out("profile_trace.json")
+        profiler.write_trace(trace_path)
+        print()
+        profiler.summary()
+        print(f"  Trace: {trace_path}")
+        if metrics_path:
+            profiler.write_metrics(metrics_path)
+            print(f"  Metrics: {metrics_path}")
     return s8["final_output"]
 
 
+def run_pipeline(*args, **kwargs):
+    """Run every stage for one video; takes pipeline_stages' arguments."""
+    stages = pipeline_stages(*args, **kwargs)
+    while True:
+        try:
+            next(stages)
+        except StopIteration as done:
+            return done.value
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Kannada to Hindi dubbing pipeline")
     parser.add_argument("input_video", help="Path to input video file")
     parser.add_argument("--output-dir", default="output", help="Output directory")
     parser.add_argument("--skip-lipsync", action="store_true", help="Skip Wav2Lip lip sync")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Re-run every stage even if its inputs are unchanged")
+    parser.add_argument("--translate-batch-size", type=int, default=8,
+                        help="Segments per NLLB generate call (1 = one call per segment)")
+    parser.add_argument("--match-engine", choices=["numpy", "ffmpeg"], default="numpy",
+                        help="Step 5 duration-matching engine")
+    parser.add_argument("--match-workers", type=int, default=1,
+                        help="Worker processes for step 5 duration matching")
+    parser.add_argument("--whisper-backend", choices=["openai", "ctranslate2"], default="openai",
+                        help="Whisper implementation for step 2 (ctranslate2 = int8 faster-whisper)")
+    parser.add_argument("--whisper-threads", type=int, default=0,
+                        help="CPU threads for the ctranslate2 backend (0 = library default)")
+    parser.add_argument("--whisper-workers", type=int, default=1,
+                        help="Split audio at quiet points and transcribe chunks in N processes")
+    parser.add_argument("--vad", action="store_true",
+                        help="Only decode speech regions found by the energy/band VAD")
+    parser.add_argument("--stream", action="store_true",
+                        help="Overlap steps 2-6 per segment instead of stage-at-a-time")
+    parser.add_argument("--mixer", choices=["array", "ffmpeg"], default="array",
+                        help="Step 6 mixer: memory-mapped timeline or ffmpeg amix graph")
+    parser.add_argument("--assembly", choices=["fused", "staged"], default="fused",
+                        help="fused: one ffmpeg pass from the original video + dubbed audio to the "
+                             "final output; staged: also write dubbed_video.mp4 / lipsync_video.mp4")
+    parser.add_argument("--reencode-video", action="store_true",
+                        help="Always re-encode the picture in step 8 instead of stream-copying "
+                             "frames lip sync did not change")
+    parser.add_argument("--encode-workers", type=int, default=1,
+                        help="Split a full step 8 re-encode into N keyframe-aligned chunks "
+                             "encoded in parallel")
+    parser.add_argument("--wav2lip", action="store_true",
+                        help="Run Wav2Lip in step 7 over the dubbed speech windows")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage wall/CPU/RSS, per-segment spans and subprocess "
+                             "launches; writes profile_trace.json (Chrome trace) and a summary")
+    parser.add_argument("--metrics", default=None,
+                        help="Also write the profile numbers as JSON to this path")
     args = parser.parse_args()
 
-    run_pipeline(args.input_video, args.output_dir, args.skip_lipsync)
+    run_pipeline(args.input_video, args.output_dir, args.skip_lipsync,
+                 use_cache=not args.no_cache,
+                 translate_batch_size=args.translate_batch_size,
+                 match_engine=args.match_engine,
+                 mixer=args.mixer,
+                 match_workers=args.match_workers,
+                 stream=args.stream,
+                 whisper_backend=args.whisper_backend,
+                 whisper_threads=args.whisper_threads,
+                 whisper_workers=args.whisper_workers,
+                 vad=args.vad,
+                 assembly=args.assembly,
+                 reencode_video=args.reencode_video,
+                 encode_workers=args.encode_workers,
+                 wav2lip=args.wav2lip,
+                 profile=args.profile,
+                 metrics_path=args.metrics)
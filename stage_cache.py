@@ -0,0 +1,314 @@
+import hashlib, shutil
+import json, sys, os
+
+from job_manifest import FILE_STAGES, JobManifest, load_meta
+
+
+CACHE_DIRNAME = ".stage_cache"
+HASH_CHUNK = 1 << 20
+DEFAULT_KEEP = 3
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _load_meta(path):
+    try:
+        return load_meta(path)
+    except (OSError, ValueError):
+        return None
+
+
+def _link_or_copy(src, dst):
+    """Hard-link ``src`` to ``dst``; copy only where linking fails (another device)."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _place(src, dst):
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, copy_function=_link_or_copy)
+    else:
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        _link_or_copy(src, dst)
+
+
+def _files(path):
+    if os.path.isdir(path):
+        for parent, _, names in os.walk(path):
+            for name in names:
+                yield os.path.join(parent, name)
+    elif os.path.exists(path):
+        yield path
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class StageCache:
+    """Per-stage results keyed by a fingerprint of their inputs, params and code.
+
+    Cached outputs are hard links to the files a run produced, so a store
+    costs no extra write pass and no extra disk while the output is
+    unchanged. Something rewriting an output in place (e.g. splice_audio on
+    dubbed_audio.wav) rewrites the cached copy too; restore() re-checks the
+    cached files' hashes and drops an entry whose files changed. Only the
+    ``keep`` most recently used results per stage are kept.
+    """
+
+    def __init__(self, output_dir="output", enabled=True, keep=DEFAULT_KEEP):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.keep = keep
+        self.root = os.path.join(output_dir, CACHE_DIRNAME)
+        self._hash_index_path = os.path.join(self.root, "file_hashes.json")
+        self._hash_index = _load_json(self._hash_index_path, {})
+        # Per stage: the fingerprint whose result is in the manifest, and the
+        # manifest's update time of each of its views right after it got there.
+        self._current_path = os.path.join(self.root, "current.json")
+        self._current = _load_json(self._current_path, {})
+        self.hits = 0
+        self.misses = 0
+
+    def file_hash(self, path):
+        """sha256 of a file or a directory tree.
+
+        Hashes are memoised on (size, mtime) so unchanged multi-GB inputs are
+        only read once across runs.
+        """
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            h = hashlib.sha256()
+            for name in sorted(os.listdir(path)):
+                h.update(name.encode())
+                h.update(self.file_hash(os.path.join(path, name)).encode())
+            return h.hexdigest()
+
+        if not os.path.exists(path):
+            return "missing"
+
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        known = self._hash_index.get(path)
+        if known and known["stamp"] == stamp:
+            return known["sha256"]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self._hash_index[path] = {"stamp": stamp, "sha256": digest}
+        return digest
+
+    def fingerprint(self, stage, inputs=(), metas=(), params=None, code=()):
+        payload = {
+            "stage": stage,
+            "inputs": [self.file_hash(p) for p in inputs],
+            "metas": [_load_meta(p) for p in metas],
+            "params": params or {},
+            "code": [self.file_hash(p) for p in code],
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _entry_dir(self, stage, fp):
+        return os.path.join(self.root, stage, fp[:16])
+
+    def lookup(self, stage, fp):
+        entry = self._entry_dir(stage, fp)
+        manifest = _load_json(os.path.join(entry, "manifest.json"), None)
+        if not manifest or manifest.get("fingerprint") != fp:
+            return None
+        return manifest
+
+    def _view_stages(self, outputs):
+        return {rel: FILE_STAGES[rel] for rel in outputs if rel in FILE_STAGES}
+
+    def _mark_current(self, stage, fp, views, edited=()):
+        # Edited views keep their old time, so the edit still shows on the next hit.
+        before = self._current.get(stage, {}).get("updated", {})
+        with JobManifest(self.output_dir) as job:
+            updated = {view_stage: before.get(view_stage) if view_stage in edited
+                       else job.stage_updated(view_stage) for view_stage in views}
+        self._current[stage] = {"fingerprint": fp, "updated": updated}
+        os.makedirs(self.root, exist_ok=True)
+        _write_json(self._current_path, self._current)
+
+    def _edited_views(self, stage, fp, views):
+        """Views whose manifest rows were edited since this same result was put there."""
+        current = self._current.get(stage)
+        if not current or current["fingerprint"] != fp:
+            return set()
+        with JobManifest(self.output_dir) as job:
+            return {view_stage for view_stage in views if job.has_stage(view_stage)
+                    and job.stage_updated(view_stage) != current["updated"].get(view_stage)}
+
+    def restore(self, stage, manifest):
+        """Copy a cached result's outputs back, except views whose manifest rows were
+        edited since that result was last restored or produced; those edits are kept."""
+        fp = manifest["fingerprint"]
+        entry = self._entry_dir(stage, fp)
+        # Linked files rewritten in place since the store no longer hold this result.
+        for rel, digest in manifest["outputs"].items():
+            if self.file_hash(os.path.join(entry, "files", rel)) != digest:
+                print(f"[Cache] {stage}: cached {rel} changed since it was stored; dropping entry")
+                shutil.rmtree(entry, ignore_errors=True)
+                return False
+
+        views = self._view_stages(manifest["outputs"])
+        edited = self._edited_views(stage, fp, views.values())
+        for rel, digest in manifest["outputs"].items():
+            if views.get(rel) in edited:
+                continue
+            dst = os.path.join(self.output_dir, rel)
+            if os.path.exists(dst) and self.file_hash(dst) == digest:
+                continue
+            if os.path.isdir(dst):
+                shutil.rmtree(dst)
+            elif os.path.exists(dst):
+                os.remove(dst)
+            _place(os.path.join(entry, "files", rel), dst)
+
+        # The restored JSON views are this stage's result; make the manifest match them.
+        # Edited rows are newer than any view, so they are exported instead.
+        if views:
+            with JobManifest(self.output_dir) as job:
+                for view_stage in views.values():
+                    if view_stage in edited:
+                        print(f"[Cache] {stage}: keeping edited {view_stage} rows from the manifest")
+                        job.export(view_stage)
+                    else:
+                        job.import_view(view_stage)
+        self._mark_current(stage, fp, views.values(), edited)
+        # Recently used entries survive prune().
+        os.utime(os.path.join(entry, "manifest.json"))
+        return True
+
+    def store(self, stage, fp, outputs, result):
+        entry = self._entry_dir(stage, fp)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        files_dir = os.path.join(entry, "files")
+        os.makedirs(files_dir, exist_ok=True)
+
+        hashes = {}
+        for path in outputs:
+            if not os.path.exists(path):
+                continue
+            rel = os.path.relpath(path, self.output_dir)
+            dst = os.path.join(files_dir, rel)
+            hashes[rel] = self.file_hash(path)
+            _place(path, dst)
+            # A link shares the output's inode and stamp, so it shares its hash too.
+            for src_file in _files(path):
+                known = self._hash_index.get(os.path.abspath(src_file))
+                cached_file = os.path.join(dst, os.path.relpath(src_file, path)) \
+                    if os.path.isdir(path) else dst
+                if known and os.path.samefile(src_file, cached_file):
+                    self._hash_index[os.path.abspath(cached_file)] = dict(known)
+
+        _write_json(os.path.join(entry, "manifest.json"), {
+            "stage": stage,
+            "fingerprint": fp,
+            "outputs": hashes,
+            "result": result,
+        })
+
+    def prune(self, keep=None):
+        """Delete all but the ``keep`` most recently used results of each stage."""
+        keep = self.keep if keep is None else keep
+        removed = 0
+        if not os.path.isdir(self.root):
+            return removed
+        for stage in os.listdir(self.root):
+            stage_dir = os.path.join(self.root, stage)
+            if not os.path.isdir(stage_dir):
+                continue
+            entries = sorted((os.path.join(stage_dir, name) for name in os.listdir(stage_dir)),
+                             key=lambda e: os.path.getmtime(os.path.join(e, "manifest.json"))
+                             if os.path.exists(os.path.join(e, "manifest.json")) else 0.0,
+                             reverse=True)
+            for entry in entries[keep:]:
+                shutil.rmtree(entry, ignore_errors=True)
+                removed += 1
+        prefix = os.path.abspath(self.root) + os.sep
+        self._hash_index = {path: known for path, known in self._hash_index.items()
+                            if not path.startswith(prefix) or os.path.exists(path)}
+        return removed
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        _write_json(self._hash_index_path, self._hash_index)
+
+    def run(self, stage, func, args=(), kwargs=None, inputs=(), metas=(),
+            params=None, code=(), outputs=()):
+        """Run ``func(*args, **kwargs)`` unless a result with the same fingerprint is cached.
+
+        On a hit the stage's recorded outputs are linked back into ``output_dir``
+        and the stage's original return value is returned.
+        """
+        kwargs = kwargs or {}
+        if not self.enabled:
+            return func(*args, **kwargs)
+
+        fp = self.fingerprint(stage, inputs, metas, params, code)
+        manifest = self.lookup(stage, fp)
+        if manifest is not None and self.restore(stage, manifest):
+            self.hits += 1
+            print(f"[Cache] {stage}: unchanged ({fp[:12]}), restored cached outputs")
+            return manifest["result"]
+
+        self.misses += 1
+        # Outputs still linked into the cache must not be rewritten through the
+        # link; the cache keeps their data, so the stage writes fresh files.
+        for path in outputs:
+            for out_file in list(_files(path)):
+                if os.stat(out_file).st_nlink > 1:
+                    os.remove(out_file)
+        result = func(*args, **kwargs)
+        self.store(stage, fp, outputs, result)
+        self._mark_current(stage, fp, self._view_stages(
+            os.path.relpath(p, self.output_dir) for p in outputs).values())
+        self.prune()
+        self.save()
+        return result
+
+
+def stage_code(*module_files):
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [os.path.join(here, m) for m in module_files]
+
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else "output"
+    root = os.path.join(out, CACHE_DIRNAME)
+    if "--clear" in sys.argv and os.path.isdir(root):
+        shutil.rmtree(root)
+        print(f"[Cache] Cleared {root}")
+    elif "--prune" in sys.argv:
+        # stage_cache.py [output_dir] --prune [N]: keep the N most recently used results per stage
+        at = sys.argv.index("--prune")
+        keep = int(sys.argv[at + 1]) if len(sys.argv) > at + 1 else DEFAULT_KEEP
+        cache = StageCache(out)
+        print(f"[Cache] Pruned {cache.prune(keep)} cached result(s), keeping {keep} per stage")
+        cache.save()
+    elif os.path.isdir(root):
+        for stage in sorted(os.listdir(root)):
+            stage_dir = os.path.join(root, stage)
+            if os.path.isdir(stage_dir):
+                print(f"  {stage}: {len(os.listdir(stage_dir))} cached result(s)")
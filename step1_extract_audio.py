@@ -1,5 +1,8 @@
 import subprocess, sys, os, json
 
+from audio_buffer import open_pcm
+from job_manifest import save_meta
+
 
 def extract_audio(input_video, output_dir="output"):
     os.makedirs(output_dir, exist_ok=True)
@@ -23,16 +26,21 @@ def extract_audio(input_video, output_dir="output"):
         print(f"ERROR: {result.stderr}")
         sys.exit(1)
 
+    # Parsing the header here checks ffmpeg wrote 16-bit mono PCM and gives the
+    # sample count for the meta. The mapping itself is only reused by later
+    # stages running in this process; others map the file again themselves.
+    pcm = open_pcm(audio_path)
+
     info = {
         "input_video": os.path.abspath(input_video),
         "audio_path": os.path.abspath(audio_path),
         "duration": duration,
-        "sample_rate": 16000,
-        "channels": 1
+        "sample_rate": pcm.sample_rate,
+        "channels": 1,
+        "samples": len(pcm)
     }
 
-    with open(os.path.join(output_dir, "step1_meta.json"), "w") as f:
-        json.dump(info, f, indent=2)
+    save_meta(os.path.join(output_dir, "step1_meta.json"), info)
 
     print(f"[Step 1] Audio extracted: {audio_path} ({duration:.2f}s)")
     return info
@@ -1,21 +1,231 @@
-import whisper
 import json, sys, os
 
+from concurrent.futures import ProcessPoolExecutor
 
-def transcribe(audio_path, output_dir="output", model_name="medium"):
-    print(f"[Step 2] Loading Whisper ({model_name})...")
-    model = whisper.load_model(model_name)
+import numpy as np
 
-    print(f"[Step 2] Transcribing (Kannada → English): {audio_path}")
+import model_server
+from audio_dsp import plan_chunks, read_wav_range, wav_levels
+from job_manifest import save_meta
+from vad import speech_regions
+
+
+class FasterWhisperModel:
+    """CTranslate2 Whisper (faster-whisper) behind openai-whisper's transcribe() interface."""
+
+    def __init__(self, model_name, compute_type="int8", cpu_threads=0, batch_size=8,
+                 beam_size=5):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model_name, device="cpu", compute_type=compute_type,
+                                  cpu_threads=cpu_threads)
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+        self.pipeline = None
+        if batch_size > 1:
+            from faster_whisper import BatchedInferencePipeline
+            self.pipeline = BatchedInferencePipeline(model=self.model)
+
+    def transcribe(self, audio, task="transcribe", language=None, verbose=False):
+        if self.pipeline is not None:
+            segments, _ = self.pipeline.transcribe(audio, task=task, language=language,
+                                                   beam_size=self.beam_size,
+                                                   batch_size=self.batch_size)
+        else:
+            segments, _ = self.model.transcribe(audio, task=task, language=language,
+                                                beam_size=self.beam_size)
+        return {"segments": [{"start": s.start, "end": s.end, "text": s.text} for s in segments]}
+
+
+def load_whisper(model_name, backend="openai", compute_type="int8", cpu_threads=0, batch_size=8):
+    if backend == "ctranslate2":
+        return FasterWhisperModel(model_name, compute_type=compute_type,
+                                  cpu_threads=cpu_threads, batch_size=batch_size)
+    import whisper
+    return whisper.load_model(model_name)
+
+
+WINDOW_SECONDS = 30.0
+REGION_GAP = 0.3
+
+
+def run_whisper(model, audio_path, start=None, end=None, regions=None):
+    """Decode [start, end), or the speech ``regions`` packed back to back into one input."""
+    # Feed Whisper straight from step1's mapped PCM rather than letting it
+    # spawn its own ffmpeg decode of the same file.
+    if regions is None:
+        regions = [(start or 0.0, end)]
+    gap = np.zeros(int(REGION_GAP * 16000), dtype=np.float32)
+    parts, layout, pos = [], [], 0.0
+    for a, b in regions:
+        audio = read_wav_range(audio_path, a, b, sample_rate=16000)
+        if parts:
+            parts.append(gap)
+            pos += REGION_GAP
+        parts.append(audio)
+        layout.append((pos, a, len(audio) / 16000))
+        pos += len(audio) / 16000
     result = model.transcribe(
-        audio_path,
+        np.concatenate(parts) if len(parts) > 1 else parts[0],
         task="translate",
         language="kn",
         verbose=False
     )
+    return [{"start": _unpack_time(layout, s["start"], True),
+             "end": _unpack_time(layout, s["end"], False), "text": s["text"]}
+            for s in result["segments"]]
+
+
+def _unpack_time(layout, t, is_start):
+    """Map a time in the packed input back to the track; times in a gap snap to the next
+    region's start (segment starts) or the previous region's end (segment ends)."""
+    for n, (pos, offset, length) in enumerate(layout):
+        nxt = layout[n + 1][0] if n + 1 < len(layout) else None
+        if nxt is not None and t >= nxt:
+            continue
+        if t <= pos + length or nxt is None:
+            return offset + min(max(t - pos, 0.0), length)
+        return layout[n + 1][1] if is_start else offset + length
+    return layout[-1][1] + layout[-1][2]
+
+
+def pack_regions(regions, window=WINDOW_SECONDS):
+    """Group consecutive speech regions into lists that fill one Whisper window each.
+
+    Whisper pads every input to 30s, so decoding short VAD regions one by one
+    pays for the padding every time; packed back to back they share a decode.
+    Regions longer than the window stay on their own.
+    """
+    windows, used = [], 0.0
+    for start, end in regions:
+        length = end - start
+        if windows and used + REGION_GAP + length <= window:
+            windows[-1].append((start, end))
+            used += REGION_GAP + length
+        else:
+            windows.append([(start, end)])
+            used = length
+    return windows
+
+
+_worker_model = None
+
+
+def _init_worker(model_name, backend, cpu_threads):
+    global _worker_model
+    if backend == "openai" and cpu_threads:
+        import torch
+        torch.set_num_threads(cpu_threads)
+    _worker_model = load_whisper(model_name, backend=backend, cpu_threads=cpu_threads)
+
+
+def _transcribe_chunk(audio_path, start, end, regions=None):
+    return run_whisper(_worker_model, audio_path, start, end, regions)
+
+
+def stitch_chunks(chunks, chunk_segments):
+    """Merge per-chunk segments onto the global timeline.
+
+    Segments are clamped to their chunk, and a segment that repeats the text
+    of the one just before it across a chunk boundary is folded into it.
+    """
+    stitched = []
+    for (start, end), segs in zip(chunks, chunk_segments):
+        for i, seg in enumerate(segs):
+            s0 = max(seg["start"], start)
+            s1 = min(seg["end"], end)
+            if s1 <= s0:
+                continue
+            text = seg["text"].strip()
+            if (i == 0 and stitched and
+                    text.lower() == stitched[-1]["text"].strip().lower() and
+                    s0 - stitched[-1]["end"] < 1.0):
+                stitched[-1]["end"] = s1
+                continue
+            stitched.append({"start": s0, "end": s1, "text": seg["text"]})
+    return stitched
+
+
+def transcribe_parallel(audio_path, model_name="medium", backend="openai", workers=2,
+                        chunk_seconds=300.0, regions=None):
+    """Cut audio at quiet points into chunks of at most chunk_seconds and decode them in a
+    process pool. Each worker loads the model once and reads only its own chunk.
+
+    With VAD ``regions`` the chunks are the regions packed into Whisper windows."""
+    if regions is not None:
+        windows = pack_regions(regions)
+        chunks = [(w[0][0], w[-1][1]) for w in windows]
+    else:
+        levels, frame_sec = wav_levels(audio_path)
+        chunks = plan_chunks(levels, frame_sec, max_len=chunk_seconds,
+                             search=min(chunk_seconds / 5, 30.0))
+        windows = [None] * len(chunks)
+    threads = max((os.cpu_count() or 1) // workers, 1)
+    print(f"[Step 2] {len(chunks)} chunks of ≤{chunk_seconds:.0f}s across {workers} workers "
+          f"({threads} threads each)")
+
+    audio_path = os.path.abspath(audio_path)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, backend, threads)) as pool:
+        futures = [pool.submit(_transcribe_chunk, audio_path, start, end, window)
+                   for (start, end), window in zip(chunks, windows)]
+        chunk_segments = []
+        for n, fut in enumerate(futures):
+            chunk_segments.append(fut.result())
+            print(f"  chunk {n + 1}/{len(chunks)} [{chunks[n][0]:.0f}-{chunks[n][1]:.0f}s]: "
+                  f"{len(chunk_segments[-1])} segments")
+    return stitch_chunks(chunks, chunk_segments)
+
+
+def transcribe_regions(audio_path, regions, model_name="medium", backend="openai",
+                       cpu_threads=0):
+    """Decode VAD regions, packed into as few Whisper windows as they fit in."""
+    audio_path = os.path.abspath(audio_path)
+    if model_server.available():
+        print("[Step 2] Using warm model server")
+        decode = lambda window: model_server.call(
+            "transcribe", model_name=model_name, backend=backend, cpu_threads=cpu_threads,
+            audio_path=audio_path, regions=window
+        )
+    else:
+        print(f"[Step 2] Loading Whisper ({model_name}, {backend} backend)...")
+        model = load_whisper(model_name, backend=backend, cpu_threads=cpu_threads)
+        decode = lambda window: run_whisper(model, audio_path, regions=window)
+
+    windows = pack_regions(regions)
+    print(f"[Step 2] {len(regions)} regions packed into {len(windows)} decode windows")
+    chunk_segments = [decode(window) for window in windows]
+    return stitch_chunks([(w[0][0], w[-1][1]) for w in windows], chunk_segments)
+
+
+def transcribe(audio_path, output_dir="output", model_name="medium", backend="openai",
+               cpu_threads=0, workers=1, chunk_seconds=300.0, vad=False):
+    print(f"[Step 2] Transcribing (Kannada → English): {audio_path}")
+    regions = None
+    if vad:
+        regions, total = speech_regions(audio_path, max_len=chunk_seconds)
+        speech = sum(end - start for start, end in regions)
+        print(f"[Step 2] VAD: {len(regions)} speech regions, decoding {speech:.1f}s of "
+              f"{total:.1f}s (skipping {total - speech:.1f}s, "
+              f"{(total - speech) / total if total else 0:.0%})")
+
+    if workers > 1:
+        raw_segments = transcribe_parallel(audio_path, model_name, backend, workers,
+                                           chunk_seconds, regions=regions)
+    elif regions is not None:
+        raw_segments = transcribe_regions(audio_path, regions, model_name, backend, cpu_threads)
+    else:
+        raw_segments = model_server.call("transcribe", model_name=model_name, backend=backend,
+                                         cpu_threads=cpu_threads,
+                                         audio_path=os.path.abspath(audio_path))
+        if raw_segments is not None:
+            print("[Step 2] Used warm model server")
+    if raw_segments is None:
+        print(f"[Step 2] Loading Whisper ({model_name}, {backend} backend)...")
+        model = load_whisper(model_name, backend=backend, cpu_threads=cpu_threads)
+        raw_segments = run_whisper(model, audio_path)
 
     segments = []
-    for seg in result["segments"]:
+    for seg in raw_segments:
         segments.append({
             "start": round(seg["start"], 3),
             "end": round(seg["end"], 3),
@@ -33,8 +243,7 @@ def transcribe(audio_path, output_dir="output", model_name="medium"):
     }
 
     meta_path = os.path.join(output_dir, "step2_meta.json")
-    with open(meta_path, "w") as f:
-        json.dump(info, f, indent=2, ensure_ascii=False)
+    save_meta(meta_path, info)
 
     print(f"[Step 2] Transcription done ({len(segments)} segments)")
     print(f"[Step 2] Text: {full_text[:200]}...")
@@ -43,4 +252,6 @@ def transcribe(audio_path, output_dir="output", model_name="medium"):
 
 if __name__ == "__main__":
     audio = sys.argv[1] if len(sys.argv) > 1 else "output/audio.wav"
-    transcribe(audio)
+    backend = "ctranslate2" if "--ct2" in sys.argv else "openai"
+    workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else 1
+    transcribe(audio, backend=backend, workers=workers, vad="--vad" in sys.argv)
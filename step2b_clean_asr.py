@@ -1,32 +1,153 @@
 import re
 import json, sys, os
 
-
-def clean_segments(segments):
-    cleaned = []
-    seen_texts = set()
+import numpy as np
+
+from job_manifest import load_meta, save_meta
+
+
+DEFAULT_GLOSSARY = os.environ.get(
+    "TRANS_ASR_GLOSSARY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "asr_glossary.tsv")
+)
+
+_WHITESPACE = re.compile(r'\s+')
+_NON_WORD = re.compile(r'[^\w\s]+')
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+class Glossary:
+    """Replacement rules compiled into one case-insensitive alternation.
+
+    Every segment is rewritten in a single regex pass regardless of how many
+    rules there are; at each position the longest matching entry wins.
+    """
+
+    def __init__(self, rules):
+        self.table = {wrong.lower(): right for wrong, right in rules}
+        alternatives = sorted(self.table, key=len, reverse=True)
+        self.pattern = (re.compile("|".join(re.escape(w) for w in alternatives), re.IGNORECASE)
+                        if alternatives else None)
+
+    @classmethod
+    def from_file(cls, path):
+        rules = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line.strip() or line.lstrip().startswith("#"):
+                    continue
+                wrong, _, right = line.partition("\t")
+                rules.append((wrong.strip(), right.strip()))
+        return cls(rules)
+
+    def apply(self, text):
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(lambda m: self.table[m.group(0).lower()], text)
+
+
+_glossaries = {}
+
+
+def load_glossary(path=DEFAULT_GLOSSARY):
+    if path not in _glossaries:
+        _glossaries[path] = Glossary.from_file(path) if os.path.exists(path) else Glossary([])
+    return _glossaries[path]
+
+
+class NearDuplicateFilter:
+    """Flags segments whose text nearly repeats an earlier one (Whisper hallucination loops).
+
+    Texts are normalised and cut into byte shingles; MinHash signatures
+    are bucketed by LSH bands so each new segment is only compared with the
+    few earlier segments sharing a band. Candidates are screened on their
+    signatures in one vectorised step and confirmed by exact Jaccard.
+    """
+
+    def __init__(self, threshold=0.8, shingle=5, num_perm=60, bands=10, seed=1):
+        self.threshold = threshold
+        self.shingle = shingle
+        self.rows = num_perm // bands
+        self.bands = bands
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, _PRIME, num_perm, dtype=np.uint64)
+        self.buckets = {}
+        self.shingle_sets = []
+        self.signatures = np.zeros((1024, num_perm), np.uint64)
+
+    def _shingles(self, text):
+        """Sorted unique ``shingle``-byte windows of the normalised text, packed into ints."""
+        text = _WHITESPACE.sub(" ", _NON_WORD.sub(" ", text.casefold())).strip()
+        data = np.frombuffer(text.encode("utf-8"), np.uint8).astype(np.uint64)
+        if len(data) < self.shingle:
+            data = np.pad(data, (0, self.shingle - len(data)))
+        n = len(data) - self.shingle + 1
+        packed = data[:n].copy()
+        for k in range(1, self.shingle):
+            packed |= data[k:k + n] << np.uint64(8 * k)
+        return np.unique(packed)
+
+    def _signature(self, shingles):
+        h = shingles % _PRIME
+        return ((np.outer(self.a, h) + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def seen(self, text):
+        """True if ``text`` nearly duplicates an earlier text; otherwise remember it."""
+        shingles = self._shingles(text)
+        sig = self._signature(shingles)
+        keys = [(band, sig[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+        candidates = set()
+        for key in keys:
+            candidates.update(self.buckets.get(key, ()))
+        if candidates:
+            cand = np.fromiter(candidates, np.int64, len(candidates))
+            estimate = (self.signatures[cand] == sig).mean(axis=1)
+            for idx in cand[estimate >= self.threshold - 0.15]:
+                other = self.shingle_sets[idx]
+                common = len(np.intersect1d(shingles, other, assume_unique=True))
+                if common >= self.threshold * (len(shingles) + len(other) - common):
+                    return True
+
+        idx = len(self.shingle_sets)
+        self.shingle_sets.append(shingles)
+        if idx == len(self.signatures):
+            self.signatures = np.concatenate([self.signatures, np.zeros_like(self.signatures)])
+        self.signatures[idx] = sig
+        for key in keys:
+            self.buckets.setdefault(key, []).append(idx)
+        return False
+
+
+def clean_segments(segments, glossary=None, dedup_threshold=0.8):
+    return merge_short_segments(list(iter_clean_segments(segments, glossary, dedup_threshold)))
+
+
+def iter_clean_segments(segments, glossary=None, dedup_threshold=0.8):
+    glossary = glossary or load_glossary()
+    duplicates = NearDuplicateFilter(dedup_threshold)
 
     for seg in segments:
         text = seg["text"].strip()
 
         text = remove_repetitions(text)
-        text = fix_common_asr_errors(text)
+        text = fix_common_asr_errors(text, glossary)
         text = text.strip()
 
         if not text or len(text) < 3:
             continue
 
-        if text.lower() in seen_texts:
+        if duplicates.seen(text):
             continue
-        seen_texts.add(text.lower())
 
-        cleaned.append({
+        yield {
             "start": seg["start"],
             "end": seg["end"],
             "text": text
-        })
-
-    return merge_short_segments(cleaned)
+        }
 
 
 def remove_repetitions(text):
@@ -48,21 +169,10 @@ def remove_repetitions(text):
     return " ".join(result)
 
 
-def fix_common_asr_errors(text):
-    fixes = {
-        "bookings": "school",
-        "booking": "school",
-        "bookshop": "school",
-        "book shop": "school",
-        "the bookings": "school",
-        "the bookshop": "school",
-        "ID card": "uniform",
-        "nanny": "caretaker",
-    }
-    for wrong, right in fixes.items():
-        text = re.sub(re.escape(wrong), right, text, flags=re.IGNORECASE)
+def fix_common_asr_errors(text, glossary=None):
+    text = (glossary or load_glossary()).apply(text)
 
-    text = re.sub(r'\s+', ' ', text)
+    text = _WHITESPACE.sub(' ', text)
     text = text.strip()
 
     if text and text[0].islower():
@@ -75,32 +185,38 @@ def fix_common_asr_errors(text):
 
 
 def merge_short_segments(segments, min_duration=1.5):
-    if not segments:
-        return segments
+    return list(iter_merge_short_segments(segments, min_duration))
+
+
+def iter_merge_short_segments(segments, min_duration=1.5):
+    prev = None
+    for seg in segments:
+        if prev is None:
+            prev = seg
+            continue
 
-    merged = [segments[0]]
-    for seg in segments[1:]:
-        prev = merged[-1]
         prev_dur = prev["end"] - prev["start"]
 
         if prev_dur < min_duration:
-            merged[-1] = {
+            prev = {
                 "start": prev["start"],
                 "end": seg["end"],
                 "text": prev["text"].rstrip('.') + ", " + seg["text"][0].lower() + seg["text"][1:]
             }
         else:
-            merged.append(seg)
+            yield prev
+            prev = seg
 
-    return merged
+    if prev is not None:
+        yield prev
 
 
-def clean_asr(input_meta_path, output_dir="output"):
-    with open(input_meta_path) as f:
-        asr_data = json.load(f)
+def clean_asr(input_meta_path, output_dir="output", glossary_path=DEFAULT_GLOSSARY,
+              dedup_threshold=0.8):
+    asr_data = load_meta(input_meta_path)
 
     original_count = len(asr_data["segments"])
-    cleaned = clean_segments(asr_data["segments"])
+    cleaned = clean_segments(asr_data["segments"], load_glossary(glossary_path), dedup_threshold)
 
     info = {
         "audio_path": asr_data["audio_path"],
@@ -113,8 +229,7 @@ def clean_asr(input_meta_path, output_dir="output"):
     }
 
     meta_path = os.path.join(output_dir, "step2_cleaned.json")
-    with open(meta_path, "w") as f:
-        json.dump(info, f, indent=2, ensure_ascii=False)
+    save_meta(meta_path, info)
 
     print(f"[Step 2b] Cleaned ASR: {original_count} → {len(cleaned)} segments")
     print(f"[Step 2b] Removed {original_count - len(cleaned)} bad/duplicate segments")
@@ -122,5 +237,13 @@ def clean_asr(input_meta_path, output_dir="output"):
 
 
 if __name__ == "__main__":
-    meta = sys.argv[1] if len(sys.argv) > 1 else "output/step2_meta.json"
-    clean_asr(meta)
+    # step2b_clean_asr.py [--glossary FILE] [step2_meta.json ...]; each cleaned file is
+    # written next to its input, so a whole archive can be cleaned in one process.
+    args = sys.argv[1:]
+    glossary_path = DEFAULT_GLOSSARY
+    if "--glossary" in args:
+        i = args.index("--glossary")
+        glossary_path = args[i + 1]
+        del args[i:i + 2]
+    for meta in args or ["output/step2_meta.json"]:
+        clean_asr(meta, os.path.dirname(meta) or ".", glossary_path)
@@ -1,32 +1,132 @@
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
-import json, sys, os
+import json, sys, os, time
 
+import model_server
+import profiler
+from job_manifest import load_meta, save_meta
+from translation_memory import DEFAULT_TM_PATH, TranslationMemory, normalize_text
 
-def translate(input_meta_path, output_dir="output"):
-    with open(input_meta_path) as f:
-        asr_data = json.load(f)
 
-    model_name = "facebook/nllb-200-1.3B"
-    print(f"[Step 3] Loading NLLB-200 (1.3B): {model_name}")
+NLLB_MODEL = "facebook/nllb-200-1.3B"
+
+GENERATION_PARAMS = {
+    "max_length": 512,
+    "num_beams": 5,
+    "repetition_penalty": 1.5,
+    "no_repeat_ngram_size": 4,
+}
+
+
+def load_nllb(model_name):
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
     tokenizer = AutoTokenizer.from_pretrained(model_name, src_lang="eng_Latn")
     model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    return tokenizer, model
+
+
+def translate_texts(texts, tokenizer, model, batch_size=8):
+    """Translate a list of English strings, returning Hindi in the same order.
+
+    Texts are sorted by token length and generated in padded batches so that
+    each batch carries little padding; batch_size=1 reproduces the old
+    one-generate-call-per-segment loop.
+    """
+    if not texts:
+        return []
 
     hindi_token_id = tokenizer.convert_tokens_to_ids("hin_Deva")
+    lengths = [len(ids) for ids in tokenizer(texts, truncation=True)["input_ids"]]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
 
-    translated_segments = []
-    for seg in asr_data["segments"]:
-        english_text = seg["text"]
-        inputs = tokenizer(english_text, return_tensors="pt", padding=True, truncation=True)
-        outputs = model.generate(
-            **inputs,
-            forced_bos_token_id=hindi_token_id,
-            max_length=512,
-            num_beams=5,
-            repetition_penalty=1.5,
-            no_repeat_ngram_size=4
-        )
-        hindi_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    step = max(batch_size, 1)
+    results = [None] * len(texts)
+    for b in range(0, len(order), step):
+        batch_idx = order[b:b + step]
+        with profiler.span("step3.batch", segments=len(batch_idx)):
+            inputs = tokenizer([texts[i] for i in batch_idx], return_tensors="pt",
+                               padding=True, truncation=True)
+            outputs = model.generate(
+                **inputs,
+                forced_bos_token_id=hindi_token_id,
+                **GENERATION_PARAMS
+            )
+            decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        for i, hindi_text in zip(batch_idx, decoded):
+            results[i] = hindi_text
+    return results
+
+
+def translate_with_memory(english_texts, model_name=NLLB_MODEL, batch_size=8, tm=None,
+                          models=None):
+    """Translate texts via the translation memory, sending only unique misses to NLLB.
+
+    ``models`` is a dict used to keep a locally loaded model between calls.
+    Returns (hindi_texts, generated_count, generate_seconds).
+    """
+    hindi_texts = [tm.lookup(t) if tm else None for t in english_texts]
+    missing = [i for i, h in enumerate(hindi_texts) if h is None]
+
+    # De-duplicate misses so a phrase repeated within this video is generated once.
+    first_text = {}
+    for i in missing:
+        first_text.setdefault(normalize_text(english_texts[i]), english_texts[i])
+    unique_missing = list(first_text)
 
+    elapsed = 0.0
+    if unique_missing:
+        texts = [first_text[k] for k in unique_missing]
+        models = {} if models is None else models
+        t0 = time.perf_counter()
+        generated = None
+        if model_name not in models:
+            generated = model_server.call("translate", model_name=model_name, texts=texts,
+                                          batch_size=batch_size)
+        if generated is None:
+            if model_name not in models:
+                print(f"[Step 3] Loading NLLB-200 (1.3B): {model_name}")
+                models[model_name] = load_nllb(model_name)
+            tokenizer, model = models[model_name]
+            t0 = time.perf_counter()
+            generated = translate_texts(texts, tokenizer, model, batch_size=batch_size)
+        elapsed = time.perf_counter() - t0
+        profiler.record("step3.generate", t0, elapsed, segments=len(texts),
+                        hits=len(english_texts) - len(missing))
+
+        by_key = dict(zip(unique_missing, generated))
+        for i in missing:
+            hindi_texts[i] = by_key[normalize_text(english_texts[i])]
+        if tm:
+            for key in unique_missing:
+                tm.store(first_text[key], by_key[key])
+
+    return hindi_texts, len(unique_missing), elapsed
+
+
+def print_memory_stats(tm):
+    evicted = tm.commit()
+    stats = tm.stats()
+    print(f"[Step 3] Translation memory: {stats['hits']} hits, "
+          f"{stats['override_hits']} overrides, {stats['misses']} misses "
+          f"(hit rate {stats['hit_rate']:.0%}, {stats['entries']} entries"
+          f"{f', evicted {evicted}' if evicted else ''})")
+
+
+def translate(input_meta_path, output_dir="output", model_name=NLLB_MODEL, batch_size=8,
+              tm_path=DEFAULT_TM_PATH):
+    asr_data = load_meta(input_meta_path)
+
+    segments = asr_data["segments"]
+    english_texts = [seg["text"] for seg in segments]
+
+    tm = TranslationMemory(tm_path, model_name, GENERATION_PARAMS) if tm_path else None
+    hindi_texts, generated, elapsed = translate_with_memory(
+        english_texts, model_name, batch_size=batch_size, tm=tm
+    )
+    if tm:
+        print_memory_stats(tm)
+        tm.close()
+
+    translated_segments = []
+    for seg, english_text, hindi_text in zip(segments, english_texts, hindi_texts):
         translated_segments.append({
             "start": seg["start"],
             "end": seg["end"],
@@ -36,23 +136,26 @@ def translate(input_meta_path, output_dir="output"):
         print(f"  [{seg['start']:.1f}-{seg['end']:.1f}] {english_text} → {hindi_text}")
 
     full_hindi = " ".join(s["hindi"] for s in translated_segments)
+    seg_per_sec = generated / elapsed if elapsed > 0 else 0.0
 
     info = {
         "model": model_name,
         "source": "en",
         "target": "hi",
+        "batch_size": batch_size,
         "full_hindi": full_hindi,
         "segments": translated_segments
     }
 
     meta_path = os.path.join(output_dir, "step3_meta.json")
-    with open(meta_path, "w") as f:
-        json.dump(info, f, indent=2, ensure_ascii=False)
+    save_meta(meta_path, info)
 
-    print(f"[Step 3] Translation done ({len(translated_segments)} segments)")
+    print(f"[Step 3] Translation done ({len(translated_segments)} segments, "
+          f"{generated} generated, batch_size={batch_size}, {seg_per_sec:.2f} seg/s)")
     return info
 
 
 if __name__ == "__main__":
     meta = sys.argv[1] if len(sys.argv) > 1 else "output/step2_meta.json"
-    translate(meta)
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    translate(meta, batch_size=batch)
@@ -1,8 +1,105 @@
+import hashlib
 import json, sys, os, subprocess
-from TTS.api import TTS
+
+import model_server
+import profiler
+from audio_buffer import open_pcm
+from audio_dsp import write_wav
+from job_manifest import load_meta, save_meta
 
 
 XTTS_MODEL = "tts_models/multilingual/multi-dataset/xtts_v2"
+LATENT_CACHE_DIR = os.environ.get(
+    "TRANS_LATENT_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "trans", "xtts_latents")
+)
+
+_latents = {}
+
+
+def load_local_tts(model_name=XTTS_MODEL):
+    from TTS.api import TTS
+    return TTS(model_name, gpu=False)
+
+
+def load_tts(model_name=XTTS_MODEL):
+    if model_server.available():
+        print("[Step 4] Using warm model server for XTTS")
+        return model_server.RemoteTTS(model_name)
+    print("[Step 4] Loading XTTS-v2 model (voice cloning)...")
+    return load_local_tts(model_name)
+
+
+def speaker_latents(tts, ref_clip_path):
+    """XTTS conditioning latents for a reference clip, computed once per clip content.
+
+    Kept in memory for the process and persisted under LATENT_CACHE_DIR keyed
+    by the clip's sha256, so later runs and _regen_seg.py skip the encoder.
+    """
+    import torch
+
+    with open(ref_clip_path, "rb") as f:
+        clip_hash = hashlib.sha256(f.read()).hexdigest()
+    model_tag = hashlib.sha256(getattr(tts, "model_name", XTTS_MODEL).encode()).hexdigest()[:8]
+    key = f"{clip_hash[:32]}_{model_tag}"
+    if key in _latents:
+        return _latents[key]
+
+    cache_path = os.path.join(LATENT_CACHE_DIR, f"{key}.pt")
+    if os.path.exists(cache_path):
+        data = torch.load(cache_path)
+        print(f"[Step 4] Reusing cached speaker latents ({clip_hash[:12]})")
+    else:
+        model = tts.synthesizer.tts_model
+        cfg = model.config
+        gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
+            audio_path=[ref_clip_path],
+            gpt_cond_len=cfg.gpt_cond_len,
+            gpt_cond_chunk_len=cfg.gpt_cond_chunk_len,
+            max_ref_length=cfg.max_ref_len,
+            sound_norm_refs=cfg.sound_norm_refs
+        )
+        data = {"gpt_cond_latent": gpt_cond_latent, "speaker_embedding": speaker_embedding}
+        os.makedirs(LATENT_CACHE_DIR, exist_ok=True)
+        torch.save(data, cache_path + ".tmp")
+        os.replace(cache_path + ".tmp", cache_path)
+        print(f"[Step 4] Computed speaker latents ({clip_hash[:12]}) → {cache_path}")
+
+    _latents[key] = data
+    return data
+
+
+def synthesize_segment(tts, text, ref_clip_path, wav_path, language="hi"):
+    if isinstance(tts, model_server.RemoteTTS):
+        tts.tts_to_file(text=text, speaker_wav=ref_clip_path, language=language, file_path=wav_path)
+        return wav_path
+
+    latents = speaker_latents(tts, ref_clip_path)
+    synth = tts.synthesizer
+    model = synth.tts_model
+    cfg = model.config
+
+    # Same sentence split, sampling settings and inter-sentence gap as
+    # tts_to_file, minus the per-call reference-clip conditioning.
+    wav = []
+    for sentence in synth.split_into_sentences(text):
+        out = model.inference(
+            sentence, language,
+            latents["gpt_cond_latent"], latents["speaker_embedding"],
+            temperature=cfg.temperature,
+            length_penalty=cfg.length_penalty,
+            repetition_penalty=cfg.repetition_penalty,
+            top_k=cfg.top_k,
+            top_p=cfg.top_p
+        )
+        chunk = out["wav"]
+        if hasattr(chunk, "cpu"):
+            chunk = chunk.cpu().numpy()
+        wav += list(chunk)
+        wav += [0] * 10000
+
+    synth.save_wav(wav, wav_path)
+    return wav_path
 
 
 def extract_reference_clip(source_wav, segments, out_path, max_dur=10.0):
@@ -12,12 +109,17 @@ def extract_reference_clip(source_wav, segments, out_path, max_dur=10.0):
         default=segments[0]
     )
     dur = min(best["end"] - best["start"], max_dur)
-    subprocess.run(
-        ["ffmpeg", "-y", "-i", source_wav,
-         "-ss", str(best["start"]), "-t", str(dur),
-         "-ar", "22050", "-ac", "1", out_path],
-        capture_output=True, text=True
-    )
+    try:
+        # Slice the clip out of step1's mapped PCM; XTTS resamples references itself.
+        buf = open_pcm(source_wav)
+        write_wav(out_path, buf.slice(best["start"], best["start"] + dur), buf.sample_rate)
+    except ValueError:
+        subprocess.run(
+            ["ffmpeg", "-y", "-i", source_wav,
+             "-ss", str(best["start"]), "-t", str(dur),
+             "-ar", "22050", "-ac", "1", out_path],
+            capture_output=True, text=True
+        )
     return best
 
 
@@ -30,17 +132,48 @@ def get_audio_duration(path):
     return float(data["format"]["duration"])
 
 
-def synthesize_all(input_meta_path, original_audio_path, output_dir="output"):
-    with open(input_meta_path) as f:
-        tr_data = json.load(f)
+def synthesize_entry(tts, i, seg, ref_clip_path, tts_dir):
+    """Synthesize segment ``i`` and return its step4_meta entry (None for empty text)."""
+    hindi_text = seg.get("hindi", "").strip()
+    if not hindi_text:
+        return None
+
+    wav_path = os.path.join(tts_dir, f"seg_{i:04d}.wav")
+
+    with profiler.span("step4.segment", index=i, chars=len(hindi_text)):
+        synthesize_segment(tts, hindi_text, ref_clip_path, wav_path)
+
+        subprocess.run(
+            ["ffmpeg", "-y", "-i", wav_path, "-ar", "24000", "-ac", "1", wav_path + ".r.wav"],
+            capture_output=True, text=True
+        )
+        os.replace(wav_path + ".r.wav", wav_path)
+
+    duration = get_audio_duration(wav_path)
+    target_duration = seg["end"] - seg["start"]
+
+    print(f"  [{i:03d}] {target_duration:.2f}s target | {duration:.2f}s tts | {hindi_text[:50]}")
+
+    return {
+        "index": i,
+        "start": seg["start"],
+        "end": seg["end"],
+        "target_duration": round(target_duration, 3),
+        "tts_duration": round(duration, 3),
+        "hindi": hindi_text,
+        "wav_path": os.path.abspath(wav_path)
+    }
+
+
+def synthesize_all(input_meta_path, original_audio_path, output_dir="output", model_name=XTTS_MODEL):
+    tr_data = load_meta(input_meta_path)
 
     tts_dir = os.path.join(output_dir, "tts_segments")
     os.makedirs(tts_dir, exist_ok=True)
 
     segments = tr_data["segments"]
 
-    print("[Step 4] Loading XTTS-v2 model (voice cloning)...")
-    tts = TTS(XTTS_MODEL, gpu=False)
+    tts = load_tts(model_name)
 
     ref_clip_path = os.path.join(output_dir, "ref_speaker.wav")
     best_ref = extract_reference_clip(original_audio_path, segments, ref_clip_path)
@@ -51,51 +184,20 @@ def synthesize_all(input_meta_path, original_audio_path, output_dir="output"):
     print(f"[Step 4] Synthesising Hindi with XTTS-v2 voice cloning for {len(segments)} segments...")
 
     for i, seg in enumerate(segments):
-        hindi_text = seg.get("hindi", "").strip()
-        if not hindi_text:
-            continue
-
-        wav_path = os.path.join(tts_dir, f"seg_{i:04d}.wav")
-
-        tts.tts_to_file(
-            text=hindi_text,
-            speaker_wav=ref_clip_path,
-            language="hi",
-            file_path=wav_path
-        )
-
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", wav_path, "-ar", "24000", "-ac", "1", wav_path + ".r.wav"],
-            capture_output=True, text=True
-        )
-        os.replace(wav_path + ".r.wav", wav_path)
-
-        duration = get_audio_duration(wav_path)
-        target_duration = seg["end"] - seg["start"]
-
-        tts_segments.append({
-            "index": i,
-            "start": seg["start"],
-            "end": seg["end"],
-            "target_duration": round(target_duration, 3),
-            "tts_duration": round(duration, 3),
-            "hindi": hindi_text,
-            "wav_path": os.path.abspath(wav_path)
-        })
-
-        print(f"  [{i:03d}] {target_duration:.2f}s target | {duration:.2f}s tts | {hindi_text[:50]}")
+        entry = synthesize_entry(tts, i, seg, ref_clip_path, tts_dir)
+        if entry is not None:
+            tts_segments.append(entry)
 
     info = {
         "tts_engine": "xtts-v2",
-        "model": XTTS_MODEL,
+        "model": model_name,
         "ref_clip": ref_clip_path,
         "total_segments": len(tts_segments),
         "segments": tts_segments
     }
 
     meta_path = os.path.join(output_dir, "step4_meta.json")
-    with open(meta_path, "w") as f:
-        json.dump(info, f, indent=2, ensure_ascii=False)
+    save_meta(meta_path, info)
 
     print(f"[Step 4] TTS done — {len(tts_segments)} audio files generated")
     return info
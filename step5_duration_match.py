@@ -1,112 +1,60 @@
-import subprocess
+import subprocess, time
 import json, sys, os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
+import profiler
+from audio_dsp import fade_out, fit_length, read_wav, time_stretch, trim_silence, write_wav
+from job_manifest import load_meta, save_meta
 
-def match_durations(input_meta_path, output_dir="output"):
-    with open(input_meta_path) as f:
-        tts_data = json.load(f)
+
+SAMPLE_RATE = 24000
+
+
+def match_durations(input_meta_path, output_dir="output", engine="numpy", workers=1):
+    tts_data = load_meta(input_meta_path)
 
     matched_dir = os.path.join(output_dir, "matched_segments")
     os.makedirs(matched_dir, exist_ok=True)
 
-    segments = tts_data["segments"]
+    segments = [s for s in tts_data["segments"] if s["target_duration"] > 0]
     matched_segments = []
 
-    print(f"[Step 5] Matching duration for {len(segments)} segments...")
-
-    for seg in segments:
-        idx = seg["index"]
-        target_dur = seg["target_duration"]
-        wav_in = seg["wav_path"]
-        wav_out = os.path.join(matched_dir, f"seg_{idx:04d}.wav")
-
-        if target_dur <= 0:
-            continue
-
-        # Strip leading/trailing silence that XTTS pads around the voice.
-        # silenceremove: remove up to 1 period of leading silence > -40dB
-        # and trim trailing silence longer than 0.15s.
-        stripped = wav_out + ".stripped.wav"
-        strip_cmd = [
-            "ffmpeg", "-y", "-i", wav_in,
-            "-af", (
-                "silenceremove=start_periods=1:start_silence=0.05:start_threshold=-40dB,"
-                "areverse,"
-                "silenceremove=start_periods=1:start_silence=0.15:start_threshold=-40dB,"
-                "areverse"
-            ),
-            "-ar", "24000", "-ac", "1", stripped
-        ]
-        strip_result = subprocess.run(strip_cmd, capture_output=True, text=True)
-        if strip_result.returncode == 0 and os.path.exists(stripped):
-            tts_dur = get_duration(stripped)
-            wav_in = stripped
-        else:
-            tts_dur = seg["tts_duration"]
-
-        ratio = tts_dur / target_dur
-
-        if tts_dur <= target_dur:
-            # Slow speech just enough to fill the window (floor 0.85x = barely noticeable).
-            # This eliminates the dead-silence gap without sounding stretched.
-            slow_ratio = max(tts_dur / target_dur, 0.85)
-            if slow_ratio < 0.98:
-                filters = build_tempo_filter(slow_ratio)
-                filters += f",apad=whole_dur={target_dur}"
-            else:
-                filters = f"apad=whole_dur={target_dur}"
-            cmd = [
-                "ffmpeg", "-y", "-i", wav_in,
-                "-af", filters,
-                "-t", str(target_dur),
-                "-ar", "24000", "-ac", "1",
-                wav_out
-            ]
-        else:
-            # Speed up speech — but cap at 1.3x so it stays intelligible.
-            # If TTS is longer than 1.3x the window, trim the HEAD at natural speed
-            # with a short fade-out: the speech starts clear and fades cleanly.
-            if ratio <= 1.3:
-                compress_ratio = ratio
-                fade_start = max(target_dur - 0.1, 0)
-                filters = build_tempo_filter(compress_ratio)
-                filters += f",apad=whole_dur={target_dur}"
-                filters += f",afade=t=out:st={fade_start:.3f}:d=0.1"
-            else:
-                # Natural speed, hard-trim to target with gentle fade-out
-                fade_start = max(target_dur - 0.15, 0)
-                filters = f"afade=t=out:st={fade_start:.3f}:d=0.15"
-            cmd = [
-                "ffmpeg", "-y", "-i", wav_in,
-                "-af", filters,
-                "-t", str(target_dur),
-                "-ar", "24000", "-ac", "1",
-                wav_out
-            ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"  [{idx:03d}] ERROR: {result.stderr[:100]}")
-            continue
-
-        actual_dur = get_duration(wav_out)
-        error = abs(actual_dur - target_dur)
-
-        matched_segments.append({
-            "index": idx,
-            "start": seg["start"],
-            "end": seg["end"],
-            "target_duration": target_dur,
-            "tts_duration": tts_dur,
-            "matched_duration": round(actual_dur, 3),
-            "duration_error": round(error, 3),
-            "tempo_ratio": round(ratio, 3),
-            "hindi": seg["hindi"],
-            "wav_path": os.path.abspath(wav_out)
-        })
-
-        status = "PAD" if tts_dur <= target_dur else "COMPRESS"
-        print(f"  [{idx:03d}] {tts_dur:.2f}s → {actual_dur:.2f}s (target {target_dur:.2f}s) [{status}]")
+    print(f"[Step 5] Matching duration for {len(tts_data['segments'])} segments "
+          f"({engine} engine, {workers} worker{'s' if workers != 1 else ''})...")
+
+    t0 = time.perf_counter()
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(process_segment, segments, repeat(matched_dir), repeat(engine),
+                           chunksize=max(len(segments) // (workers * 8), 1))
+    else:
+        pool = None
+        results = (process_segment(seg, matched_dir, engine) for seg in segments)
+
+    worker_times = {}
+    try:
+        for seg, (entry, err, timing) in zip(segments, results):
+            pid, started, seconds = timing
+            profiler.record("step5.segment", started, seconds, tid=pid, index=seg["index"])
+            busy = worker_times.setdefault(pid, [0, 0.0])
+            busy[0] += 1
+            busy[1] += seconds
+
+            idx = seg["index"]
+            if entry is None:
+                print(f"  [{idx:03d}] ERROR: {err[:100]}")
+                continue
+
+            matched_segments.append(entry)
+            tts_dur, actual_dur = entry["tts_duration"], entry["matched_duration"]
+            status = "PAD" if tts_dur <= entry["target_duration"] else "COMPRESS"
+            print(f"  [{idx:03d}] {tts_dur:.2f}s → {actual_dur:.2f}s "
+                  f"(target {entry['target_duration']:.2f}s) [{status}]")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    elapsed = time.perf_counter() - t0
 
     avg_error = sum(s["duration_error"] for s in matched_segments) / max(len(matched_segments), 1)
 
@@ -117,13 +65,133 @@ def match_durations(input_meta_path, output_dir="output"):
     }
 
     meta_path = os.path.join(output_dir, "step5_meta.json")
-    with open(meta_path, "w") as f:
-        json.dump(info, f, indent=2, ensure_ascii=False)
+    save_meta(meta_path, info)
 
-    print(f"[Step 5] Duration matching done — avg error: {avg_error:.4f}s")
+    if workers > 1:
+        for n, (pid, (count, seconds)) in enumerate(sorted(worker_times.items())):
+            print(f"  worker {n} (pid {pid}): {count} segments, {seconds:.2f}s busy")
+    print(f"[Step 5] Duration matching done in {elapsed:.2f}s — avg error: {avg_error:.4f}s")
     return info
 
 
+def process_segment(seg, matched_dir, engine="numpy"):
+    """Duration-match one segment; returns (step5 entry or None, error, (pid, start, seconds))."""
+    t0 = time.perf_counter()
+    idx = seg["index"]
+    target_dur = seg["target_duration"]
+    wav_out = os.path.join(matched_dir, f"seg_{idx:04d}.wav")
+    match_segment = match_segment_numpy if engine == "numpy" else match_segment_ffmpeg
+
+    try:
+        tts_dur, actual_dur = match_segment(seg, wav_out)
+    except Exception as e:
+        return None, f"{e}", (os.getpid(), t0, time.perf_counter() - t0)
+
+    entry = {
+        "index": idx,
+        "start": seg["start"],
+        "end": seg["end"],
+        "target_duration": target_dur,
+        "tts_duration": tts_dur,
+        "matched_duration": round(actual_dur, 3),
+        "duration_error": round(abs(actual_dur - target_dur), 3),
+        "tempo_ratio": round(tts_dur / target_dur, 3),
+        "hindi": seg["hindi"],
+        "wav_path": os.path.abspath(wav_out)
+    }
+    return entry, None, (os.getpid(), t0, time.perf_counter() - t0)
+
+
+def match_segment_numpy(seg, wav_out):
+    """Trim, stretch, pad and fade one segment in memory; returns (tts_dur, matched_dur)."""
+    target_dur = seg["target_duration"]
+    target_len = int(round(target_dur * SAMPLE_RATE))
+
+    audio = trim_silence(read_wav(seg["wav_path"], SAMPLE_RATE), SAMPLE_RATE)
+    tts_dur = round(len(audio) / SAMPLE_RATE, 6)
+    ratio = tts_dur / target_dur
+
+    if tts_dur <= target_dur:
+        slow_ratio = max(ratio, 0.85)
+        if slow_ratio < 0.98:
+            audio = time_stretch(audio, slow_ratio, SAMPLE_RATE)
+        audio = fit_length(audio, target_len)
+    elif ratio <= 1.3:
+        audio = time_stretch(audio, ratio, SAMPLE_RATE)
+        audio = fade_out(fit_length(audio, target_len), max(target_dur - 0.1, 0), 0.1, SAMPLE_RATE)
+    else:
+        audio = fade_out(fit_length(audio, target_len), max(target_dur - 0.15, 0), 0.15, SAMPLE_RATE)
+
+    write_wav(wav_out, audio, SAMPLE_RATE)
+    return tts_dur, len(audio) / SAMPLE_RATE
+
+
+def match_segment_ffmpeg(seg, wav_out):
+    target_dur = seg["target_duration"]
+    wav_in = seg["wav_path"]
+
+    # Strip leading/trailing silence that XTTS pads around the voice.
+    # silenceremove: remove up to 1 period of leading silence > -40dB
+    # and trim trailing silence longer than 0.15s.
+    stripped = wav_out + ".stripped.wav"
+    strip_cmd = [
+        "ffmpeg", "-y", "-i", wav_in,
+        "-af", (
+            "silenceremove=start_periods=1:start_silence=0.05:start_threshold=-40dB,"
+            "areverse,"
+            "silenceremove=start_periods=1:start_silence=0.15:start_threshold=-40dB,"
+            "areverse"
+        ),
+        "-ar", "24000", "-ac", "1", stripped
+    ]
+    strip_result = subprocess.run(strip_cmd, capture_output=True, text=True)
+    if strip_result.returncode == 0 and os.path.exists(stripped):
+        tts_dur = get_duration(stripped)
+        wav_in = stripped
+    else:
+        tts_dur = seg["tts_duration"]
+
+    ratio = tts_dur / target_dur
+
+    if tts_dur <= target_dur:
+        # Slow speech just enough to fill the window (floor 0.85x = barely noticeable).
+        # This eliminates the dead-silence gap without sounding stretched.
+        slow_ratio = max(tts_dur / target_dur, 0.85)
+        if slow_ratio < 0.98:
+            filters = build_tempo_filter(slow_ratio)
+            filters += f",apad=whole_dur={target_dur}"
+        else:
+            filters = f"apad=whole_dur={target_dur}"
+    else:
+        # Speed up speech — but cap at 1.3x so it stays intelligible.
+        # If TTS is longer than 1.3x the window, trim the HEAD at natural speed
+        # with a short fade-out: the speech starts clear and fades cleanly.
+        if ratio <= 1.3:
+            compress_ratio = ratio
+            fade_start = max(target_dur - 0.1, 0)
+            filters = build_tempo_filter(compress_ratio)
+            filters += f",apad=whole_dur={target_dur}"
+            filters += f",afade=t=out:st={fade_start:.3f}:d=0.1"
+        else:
+            # Natural speed, hard-trim to target with gentle fade-out
+            fade_start = max(target_dur - 0.15, 0)
+            filters = f"afade=t=out:st={fade_start:.3f}:d=0.15"
+
+    cmd = [
+        "ffmpeg", "-y", "-i", wav_in,
+        "-af", filters,
+        "-t", str(target_dur),
+        "-ar", "24000", "-ac", "1",
+        wav_out
+    ]
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+
+    return tts_dur, get_duration(wav_out)
+
+
 def build_tempo_filter(ratio):
     if 0.5 <= ratio <= 2.0:
         return f"atempo={ratio}"
@@ -151,4 +219,6 @@ def get_duration(path):
 
 if __name__ == "__main__":
     meta = sys.argv[1] if len(sys.argv) > 1 else "output/step4_meta.json"
-    match_durations(meta)
+    engine = "ffmpeg" if "--ffmpeg" in sys.argv else "numpy"
+    workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else 1
+    match_durations(meta, engine=engine, workers=workers)
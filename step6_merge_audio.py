@@ -1,10 +1,24 @@
-import subprocess
+import subprocess, wave
 import json, sys, os
 
+import numpy as np
 
-def merge_audio(input_meta_path, video_path, output_dir="output"):
-    with open(input_meta_path) as f:
-        match_data = json.load(f)
+from audio_buffer import map_pcm_writable
+from audio_dsp import read_wav, to_pcm16
+from job_manifest import load_meta, save_meta
+
+
+SAMPLE_RATE = 24000
+MIX_CHUNK = SAMPLE_RATE * 60
+
+
+def merge_audio(input_meta_path, video_path, output_dir="output", mixer="array", mux=True):
+    """Mix the matched segments into dubbed_audio.wav and, if ``mux``, into dubbed_video.mp4.
+
+    With mux=False only the audio track is written; step 8's single-pass
+    assembly puts it back together with the original video.
+    """
+    match_data = load_meta(input_meta_path)
 
     segments = match_data["segments"]
     merged_wav = os.path.join(output_dir, "dubbed_audio.wav")
@@ -12,9 +26,154 @@ def merge_audio(input_meta_path, video_path, output_dir="output"):
 
     video_duration = get_duration(video_path)
 
-    print(f"[Step 6] Merging {len(segments)} segments into full audio track...")
+    print(f"[Step 6] Merging {len(segments)} segments into full audio track ({mixer} mixer)...")
     print(f"[Step 6] Video duration: {video_duration:.2f}s")
 
+    if mixer == "array":
+        audio_duration = mix_segments_array(segments, video_duration, merged_wav)
+    else:
+        audio_duration = mix_segments_ffmpeg(segments, video_duration, merged_wav)
+
+    print(f"[Step 6] Merged audio: {merged_wav}")
+
+    if mux:
+        mux_video(video_path, merged_wav, dubbed_video)
+        print(f"[Step 6] Dubbed video: {dubbed_video}")
+
+    info = {
+        "merged_audio": os.path.abspath(merged_wav),
+        "dubbed_video": os.path.abspath(dubbed_video) if mux else None,
+        "video_duration": video_duration,
+        "audio_duration": audio_duration,
+        "mixer": mixer,
+        "total_segments": len(segments)
+    }
+
+    meta_path = os.path.join(output_dir, "step6_meta.json")
+    save_meta(meta_path, info)
+
+    return info
+
+
+def splice_audio(changes, video_path, output_dir="output", mux=True):
+    """Swap changed segments into the existing dubbed_audio.wav instead of re-mixing all of them.
+
+    ``changes`` is a list of (old step5 entry or None, new entry or None);
+    an old entry's wav_path must still hold the audio that was mixed in. Its
+    samples are subtracted at their offset and the new segment's added,
+    through a writable memory map of the WAV, so only the changed spans are
+    read and written. If ``mux``, dubbed_video.mp4 gets the new audio track
+    (video stream-copied).
+
+    Subtraction only undoes the array mixer's plain sum, so this returns None
+    (re-run merge_audio then) when the mix came from the ffmpeg mixer, when
+    an old segment's span clipped in the mix (overlapping segments), when
+    the format differs, or when a new segment runs past the end.
+    """
+    merged_wav = os.path.join(output_dir, "dubbed_audio.wav")
+    dubbed_video = os.path.join(output_dir, "dubbed_video.mp4")
+    meta_path = os.path.join(output_dir, "step6_meta.json")
+    if not os.path.exists(merged_wav) or not os.path.exists(meta_path):
+        return None
+    info = load_meta(meta_path)
+    if info.get("mixer") != "array":
+        return None
+
+    try:
+        sample_rate, pcm = map_pcm_writable(merged_wav)
+    except ValueError:
+        return None
+    try:
+        if sample_rate != SAMPLE_RATE or not len(pcm):
+            return None
+        edits = []
+        for old, new in changes:
+            for entry, sign in ((old, -1.0), (new, 1.0)):
+                if entry is None:
+                    continue
+                offset = int(round(entry["start"] * SAMPLE_RATE))
+                audio = read_wav(entry["wav_path"], SAMPLE_RATE)
+                if offset + len(audio) > len(pcm):
+                    if sign > 0:
+                        return None
+                    audio = audio[:max(len(pcm) - offset, 0)]
+                if sign < 0 and np.any(np.abs(pcm[offset:offset + len(audio)]) >= 32767):
+                    print(f"[Step 6] Mix is clipped under segment {entry['index']}; re-mixing instead")
+                    return None
+                edits.append((offset, sign * audio))
+
+        print(f"[Step 6] Splicing {len(changes)} changed segments into {merged_wav}")
+        for offset, delta in edits:
+            span = pcm[offset:offset + len(delta)]
+            # The mix was written as round(sum * 32767); undo that scale before adding.
+            span[:] = to_pcm16(span / 32767.0 + delta)
+        pcm.flush()
+    finally:
+        del pcm
+
+    if mux:
+        mux_video(video_path, merged_wav, dubbed_video)
+        print(f"[Step 6] Dubbed video audio replaced: {dubbed_video}")
+
+    info["dubbed_video"] = os.path.abspath(dubbed_video) if mux else None
+    info["total_segments"] += sum((new is not None) - (old is not None) for old, new in changes)
+    save_meta(meta_path, info)
+    return info
+
+
+def mux_video(video_path, merged_wav, dubbed_video):
+    mux_cmd = [
+        "ffmpeg", "-y",
+        "-i", video_path,
+        "-i", merged_wav,
+        "-c:v", "copy",
+        "-map", "0:v:0",
+        "-map", "1:a:0",
+        "-shortest",
+        dubbed_video
+    ]
+
+    result = subprocess.run(mux_cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"[Step 6] ERROR muxing: {result.stderr[-300:]}")
+        sys.exit(1)
+
+
+def mix_segments_array(segments, video_duration, merged_wav):
+    """Sum every segment into one float32 timeline at its sample offset.
+
+    The timeline is a memory-mapped scratch file, so hours of audio do not
+    need to fit in RAM; cost is linear in total segment length.
+    """
+    total = int(round(video_duration * SAMPLE_RATE))
+    for seg in segments:
+        seg_len = int(round(seg.get("matched_duration", seg["end"] - seg["start"]) * SAMPLE_RATE))
+        total = max(total, int(round(seg["start"] * SAMPLE_RATE)) + seg_len)
+    total = max(total, 1)
+
+    scratch = merged_wav + ".mix.f32"
+    timeline = np.memmap(scratch, dtype=np.float32, mode="w+", shape=(total,))
+    try:
+        for seg in segments:
+            offset = int(round(seg["start"] * SAMPLE_RATE))
+            audio = read_wav(seg["wav_path"], SAMPLE_RATE)[:max(total - offset, 0)]
+            timeline[offset:offset + len(audio)] += audio
+
+        tmp = merged_wav + ".tmp.wav"
+        with wave.open(tmp, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            for i in range(0, total, MIX_CHUNK):
+                w.writeframes(to_pcm16(timeline[i:i + MIX_CHUNK]).tobytes())
+        os.replace(tmp, merged_wav)
+    finally:
+        del timeline
+        os.remove(scratch)
+    return total / SAMPLE_RATE
+
+
+def mix_segments_ffmpeg(segments, video_duration, merged_wav):
     filter_parts = []
     inputs = []
 
@@ -42,39 +201,7 @@ def merge_audio(input_meta_path, video_path, output_dir="output"):
     if result.returncode != 0:
         print(f"[Step 6] ERROR merging audio: {result.stderr[-300:]}")
         sys.exit(1)
-
-    print(f"[Step 6] Merged audio: {merged_wav}")
-
-    mux_cmd = [
-        "ffmpeg", "-y",
-        "-i", video_path,
-        "-i", merged_wav,
-        "-c:v", "copy",
-        "-map", "0:v:0",
-        "-map", "1:a:0",
-        "-shortest",
-        dubbed_video
-    ]
-
-    result = subprocess.run(mux_cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"[Step 6] ERROR muxing: {result.stderr[-300:]}")
-        sys.exit(1)
-
-    info = {
-        "merged_audio": os.path.abspath(merged_wav),
-        "dubbed_video": os.path.abspath(dubbed_video),
-        "video_duration": video_duration,
-        "audio_duration": get_duration(merged_wav),
-        "total_segments": len(segments)
-    }
-
-    meta_path = os.path.join(output_dir, "step6_meta.json")
-    with open(meta_path, "w") as f:
-        json.dump(info, f, indent=2)
-
-    print(f"[Step 6] Dubbed video: {dubbed_video}")
-    return info
+    return get_duration(merged_wav)
 
 
 def get_duration(path):
@@ -1,18 +1,40 @@
-import subprocess
+import shutil, subprocess
 import json, sys, os
 
+from audio_buffer import open_pcm
+from audio_dsp import write_wav
+from face_cache import cache_path
+from job_manifest import load_meta, save_meta
+
 
 WAV2LIP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Wav2Lip")
 CHECKPOINT = os.path.join(WAV2LIP_DIR, "checkpoints", "wav2lip_gan.pth")
+PADS = (0, 10, 0, 0)
+RESIZE_FACTOR = 1
+FACE_DET_BATCH = 16
 
 
-def lip_sync(video_path, audio_path, output_dir="output", use_wav2lip=False):
+def lip_sync(video_path, audio_path, output_dir="output", use_wav2lip=False, mux=True,
+             windows_only=True, margin=0.25, face_cache=True, changed=None):
     output_video = os.path.join(output_dir, "lipsync_video.mp4")
 
     video_path = os.path.abspath(video_path)
     audio_path = os.path.abspath(audio_path)
     output_video_abs = os.path.abspath(output_video)
 
+    if not use_wav2lip and not mux:
+        # Nothing to render: step 8 assembles the original video and dubbed audio itself.
+        print("[Step 7] Wav2Lip skipped (CPU too slow). Leaving the mux to step 8.")
+        info = {
+            "lipsync_video": None,
+            "source_video": video_path,
+            "source_audio": audio_path,
+            "lip_sync_applied": False
+        }
+        meta_path = os.path.join(output_dir, "step7_meta.json")
+        save_meta(meta_path, info)
+        return info
+
     if not use_wav2lip:
         print("[Step 7] Wav2Lip skipped (CPU too slow). Muxing audio into video...")
         subprocess.run(
@@ -28,34 +50,20 @@ def lip_sync(video_path, audio_path, output_dir="output", use_wav2lip=False):
             "lip_sync_applied": False
         }
         meta_path = os.path.join(output_dir, "step7_meta.json")
-        with open(meta_path, "w") as f:
-            json.dump(info, f, indent=2)
+        save_meta(meta_path, info)
         print(f"[Step 7] Output: {output_video_abs}")
         return info
 
+    if windows_only:
+        return lip_sync_windows(video_path, audio_path, output_dir, margin=margin,
+                                face_cache=face_cache, mux=mux, changed=changed)
+
     print(f"[Step 7] Running Wav2Lip lip sync...")
     print(f"[Step 7] Video: {video_path}")
     print(f"[Step 7] Audio: {audio_path}")
 
-    cmd = [
-        sys.executable,
-        os.path.join(WAV2LIP_DIR, "inference.py"),
-        "--checkpoint_path", CHECKPOINT,
-        "--face", video_path,
-        "--audio", audio_path,
-        "--outfile", output_video_abs,
-        "--resize_factor", "1",
-        "--nosmooth",
-        "--pads", "0", "10", "0", "0",
-    ]
-
-    env = os.environ.copy()
-    env["PYTHONPATH"] = WAV2LIP_DIR
-
-    result = subprocess.run(
-        cmd, capture_output=True, text=True, env=env,
-        cwd=WAV2LIP_DIR
-    )
+    box_cache = cache_path(video_path, PADS, RESIZE_FACTOR) if face_cache else None
+    result = run_wav2lip(video_path, audio_path, output_video_abs, box_cache=box_cache)
 
     if result.returncode != 0:
         print(f"[Step 7] Wav2Lip stderr: {result.stderr[-500:]}")
@@ -82,15 +90,202 @@ def lip_sync(video_path, audio_path, output_dir="output", use_wav2lip=False):
     }
 
     meta_path = os.path.join(output_dir, "step7_meta.json")
-    with open(meta_path, "w") as f:
-        json.dump(info, f, indent=2)
+    save_meta(meta_path, info)
 
     print(f"[Step 7] Output: {output_video_abs}")
     return info
 
 
+def run_wav2lip(face_path, audio_path, outfile, box_cache=None, frame_offset=0):
+    """Run Wav2Lip inference.py.
+
+    With ``box_cache`` (see face_cache.py) face boxes for source frames
+    frame_offset, frame_offset+1, ... are read from / added to that cache
+    instead of being detected from scratch.
+    """
+    cmd = [sys.executable]
+    if box_cache:
+        cmd += [os.path.join(os.path.dirname(os.path.abspath(__file__)), "face_cache.py"),
+                "--cache", box_cache, "--offset", str(frame_offset), "--"]
+    else:
+        cmd += [os.path.join(WAV2LIP_DIR, "inference.py")]
+    cmd += [
+        "--checkpoint_path", CHECKPOINT,
+        "--face", face_path,
+        "--audio", audio_path,
+        "--outfile", outfile,
+        "--resize_factor", str(RESIZE_FACTOR),
+        "--face_det_batch_size", str(FACE_DET_BATCH),
+        "--nosmooth",
+        "--pads", *[str(p) for p in PADS],
+    ]
+
+    env = os.environ.copy()
+    env["PYTHONPATH"] = WAV2LIP_DIR
+
+    return subprocess.run(
+        cmd, capture_output=True, text=True, env=env,
+        cwd=WAV2LIP_DIR
+    )
+
+
+def speech_windows(segments, duration, margin=0.25):
+    """Merged (start, end) windows covering every dubbed segment plus ``margin`` each side."""
+    windows = []
+    for seg in sorted(segments, key=lambda s: s["start"]):
+        length = seg.get("matched_duration", seg["end"] - seg["start"])
+        start = max(seg["start"] - margin, 0.0)
+        end = min(seg["start"] + length + margin, duration)
+        if end <= start:
+            continue
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return [(round(a, 3), round(b, 3)) for a, b in windows]
+
+
+def lip_sync_windows(video_path, audio_path, output_dir="output", margin=0.25, face_cache=True,
+                     mux=True, changed=None):
+    """Run Wav2Lip only over the speech windows from step5_meta.json.
+
+    Each window is cut out of the video (with the matching slice of the dubbed
+    audio) and lip-synced on its own. The synced clips stay in
+    lipsync_windows/ and are listed with their time ranges as window_clips;
+    step 8 encodes them once into the GOPs they cover and stream-copies the
+    rest of the source. With ``mux`` a lipsync_video.mp4 is also built the
+    same way, by concatenating copied and encoded pieces.
+
+    ``changed`` lists the (start, end) spans whose dubbed audio changed since
+    the last run; a window clip from that run is kept when its window is the
+    same and overlaps none of them, so only the affected windows are re-synced.
+    """
+    output_video = os.path.abspath(os.path.join(output_dir, "lipsync_video.mp4"))
+    segments = load_meta(os.path.join(output_dir, "step5_meta.json"))["segments"]
+
+    duration, fps = probe_video(video_path)
+    # Snap windows to frame boundaries so each sub-clip's frames map onto source frame indices.
+    windows = [(round(a * fps) / fps, round(b * fps) / fps)
+               for a, b in speech_windows(segments, duration, margin)]
+    box_cache = cache_path(video_path, PADS, RESIZE_FACTOR) if face_cache else None
+    covered = sum(b - a for a, b in windows)
+    print(f"[Step 7] Running Wav2Lip on {len(windows)} speech windows "
+          f"({covered:.1f}s of {duration:.1f}s)")
+
+    work_dir = os.path.abspath(os.path.join(output_dir, "lipsync_windows"))
+    meta_path = os.path.join(output_dir, "step7_meta.json")
+    previous = {}
+    if changed is not None and os.path.exists(meta_path):
+        previous = {(a, b): clip for a, b, clip in load_meta(meta_path).get("window_clips", [])
+                    if os.path.exists(clip)}
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir, exist_ok=True)
+    pcm = open_pcm(audio_path)
+
+    done, reused = [], 0
+    for a, b in windows:
+        kept = previous.get((a, b))
+        if kept and not any(a < end and start < b for start, end in changed):
+            done.append((a, b, kept))
+            reused += 1
+            continue
+        # Named by frame range, so kept clips keep their names when windows are added or removed.
+        name = f"win_{int(round(a * fps)):07d}_{int(round(b * fps)):07d}"
+        clip = os.path.join(work_dir, f"{name}.mp4")
+        clip_wav = os.path.join(work_dir, f"{name}.wav")
+        synced = os.path.join(work_dir, f"{name}_sync.mp4")
+        if os.path.exists(synced):
+            os.remove(synced)
+
+        # Re-encode the cut so it starts exactly at ``a``, not at the previous keyframe.
+        subprocess.run(
+            ["ffmpeg", "-y", "-ss", str(a), "-i", video_path, "-t", str(b - a),
+             "-an", "-c:v", "libx264", "-crf", "12", "-preset", "veryfast", clip],
+            capture_output=True, text=True
+        )
+        write_wav(clip_wav, pcm.slice(a, b), pcm.sample_rate)
+
+        result = run_wav2lip(clip, clip_wav, synced, box_cache=box_cache,
+                             frame_offset=int(round(a * fps)))
+        for path in (clip, clip_wav):
+            if os.path.exists(path):
+                os.remove(path)
+        if result.returncode != 0 or not os.path.exists(synced):
+            print(f"  [{a:.1f}-{b:.1f}] Wav2Lip failed, keeping original frames: "
+                  f"{result.stderr.strip()[-100:]}")
+            continue
+        print(f"  [{a:.1f}-{b:.1f}] lip-synced")
+        done.append((a, b, synced))
+
+    if changed is not None:
+        print(f"[Step 7] Kept {reused} unchanged window clips, re-synced {len(windows) - reused}")
+        keep = {os.path.basename(clip) for _, _, clip in done}
+        for name in os.listdir(work_dir):
+            if name not in keep:
+                os.remove(os.path.join(work_dir, name))
+
+    applied = bool(done)
+    if not mux:
+        output_video = None
+    elif applied:
+        render_windows(video_path, audio_path, done, output_video,
+                       os.path.join(output_dir, "step7_work"))
+    else:
+        subprocess.run(
+            ["ffmpeg", "-y", "-i", video_path, "-i", audio_path,
+             "-c:v", "copy", "-map", "0:v:0", "-map", "1:a:0", "-shortest", output_video],
+            capture_output=True, text=True
+        )
+
+    info = {
+        "lipsync_video": output_video,
+        "source_video": video_path,
+        "source_audio": audio_path,
+        "lip_sync_applied": applied,
+        "windows": len(windows),
+        "altered_ranges": [[a, b] for a, b, _ in done],
+        "window_clips": [[a, b, clip] for a, b, clip in done]
+    }
+
+    save_meta(meta_path, info)
+
+    print(f"[Step 7] Output: {output_video or 'window clips in ' + work_dir}")
+    return info
+
+
+def render_windows(video_path, audio_path, windows, output_video, work_dir):
+    """Write the source video with each (start, end, clip) window swapped in, plus ``audio_path``."""
+    from step8_master_encode import smart_render
+
+    spliced = (smart_render(video_path, windows, work_dir)
+               or smart_render(video_path, windows, work_dir, copy=False))
+    result = subprocess.run(
+        ["ffmpeg", "-y", "-i", spliced[0], "-i", audio_path,
+         "-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+         "-shortest", output_video],
+        capture_output=True, text=True
+    )
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if result.returncode != 0:
+        print(f"[Step 7] ERROR muxing lip-synced video: {result.stderr[-300:]}")
+        raise RuntimeError("Muxing lip-synced windows failed")
+
+
+def probe_video(path):
+    """(duration seconds, frames per second) of a video file."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-print_format", "json", "-select_streams", "v:0",
+         "-show_streams", "-show_format", path],
+        capture_output=True, text=True
+    )
+    data = json.loads(result.stdout)
+    num, _, den = data["streams"][0]["avg_frame_rate"].partition("/")
+    return float(data["format"]["duration"]), float(num) / float(den or 1)
+
+
 if __name__ == "__main__":
     video = sys.argv[1] if len(sys.argv) > 1 else "input.mp4"
     audio = sys.argv[2] if len(sys.argv) > 2 else "output/dubbed_audio.wav"
     use_w2l = "--lipsync" in sys.argv
-    lip_sync(video, audio, use_wav2lip=use_w2l)
+    lip_sync(video, audio, use_wav2lip=use_w2l, windows_only="--full-frames" not in sys.argv)
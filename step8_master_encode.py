@@ -1,56 +1,417 @@
-import subprocess
+import bisect, shutil, subprocess, time
 import json, sys, os
+from concurrent.futures import ThreadPoolExecutor
 
+from job_manifest import load_meta, save_meta
 
-def master_encode(input_video, output_dir="output"):
+
+# Keep only a gentle high-pass and a single-pass loudnorm.
+# Removing acompressor and lowpass prevents pumping artifacts and beep sounds.
+AUDIO_FILTER = (
+    "highpass=f=80,"
+    "loudnorm=I=-16:LRA=11:TP=-1.5"
+)
+
+VIDEO_ENCODE_ARGS = ["-c:v", "libx264", "-crf", "18", "-preset", "slow"]
+AUDIO_ENCODE_ARGS = ["-af", AUDIO_FILTER, "-c:a", "aac", "-b:a", "192k"]
+
+
+def master_encode(input_video, output_dir="output", video="auto", workers=1):
+    """Master the audio of ``input_video`` and write final_output.mp4.
+
+    With video="auto" the picture is only re-encoded where lip sync changed it:
+    untouched video is stream-copied, and when step 7 left lip-synced window
+    clips only the GOPs covering them are encoded, once, from the source
+    frames and the clips. video="encode" always re-encodes the whole picture;
+    with workers > 1 a full re-encode is split into keyframe-aligned chunks
+    encoded in parallel.
+    """
     output_path = os.path.join(output_dir, "final_output.mp4")
 
     print(f"[Step 8] Mastering and encoding: {input_video}")
 
-    # Keep only a gentle high-pass and a single-pass loudnorm.
-    # Removing acompressor and lowpass prevents pumping artifacts and beep sounds.
-    audio_filter = (
-        "highpass=f=80,"
-        "loudnorm=I=-16:LRA=11:TP=-1.5"
+    mode, step7 = _video_plan(input_video, output_dir)
+    if video == "encode" and mode != "smart":
+        mode = "encode"
+    extra = {"source_video": os.path.abspath(input_video)}
+    work_dir = os.path.join(output_dir, "step8_work")
+
+    if mode == "smart":
+        clips = step7["window_clips"]
+        spliced = None
+        if video != "encode":
+            spliced = smart_render(step7["source_video"], clips, work_dir)
+        if spliced is None:
+            spliced = smart_render(step7["source_video"], clips, work_dir, copy=False)
+            mode = "encode"
+        path, reencoded = spliced
+        # The dubbed track step 7 synced to, not a re-encoded copy of it.
+        _encode(_mux_cmd(path, step7["source_audio"], ["-c:v", "copy"], output_path))
+        shutil.rmtree(work_dir, ignore_errors=True)
+        extra["reencoded_seconds"] = round(reencoded, 3)
+    else:
+        mode, chunks = _render(input_video, input_video, mode, output_path, workers, work_dir)
+        extra.update(_chunk_info(chunks))
+
+    extra["video"] = mode
+    return _write_meta(output_path, output_dir, extra)
+
+
+def assemble(video_path, audio_path, output_dir="output", video="auto", workers=1):
+    """Mux, master and encode in one ffmpeg pass: original video + dubbed_audio.wav → final_output.mp4.
+
+    Replaces the step6 mux, the step7 remux and the step8 re-read, so no
+    full-length intermediate video is written. The original picture is
+    stream-copied unless video="encode".
+    """
+    output_path = os.path.join(output_dir, "final_output.mp4")
+
+    print(f"[Step 8] Single-pass assembly: {video_path} + {audio_path}")
+
+    mode, chunks = _render(video_path, audio_path, "encode" if video == "encode" else "copy",
+                           output_path, workers, os.path.join(output_dir, "step8_work"),
+                           ["-shortest"])
+
+    info = {
+        "source_video": os.path.abspath(video_path),
+        "source_audio": os.path.abspath(audio_path),
+        "assembly": "fused",
+        "video": mode
+    }
+    info.update(_chunk_info(chunks))
+    return _write_meta(output_path, output_dir, info)
+
+
+def _video_plan(input_video, output_dir):
+    """("copy" | "smart" | "encode", step7 meta) for the frames of ``input_video``."""
+    meta_path = os.path.join(output_dir, "step7_meta.json")
+    if not os.path.exists(meta_path):
+        return "copy", None
+    step7 = load_meta(meta_path)
+    if not step7.get("lip_sync_applied"):
+        return "copy", step7
+    video = os.path.abspath(input_video)
+    if step7.get("window_clips") and video in (step7["source_video"], step7.get("lipsync_video")):
+        return "smart", step7
+    if step7.get("lipsync_video") != video:
+        # Frames are the source's own; only the audio track differs.
+        return "copy", step7
+    return "encode", step7
+
+
+def _mux_cmd(video_src, audio_src, video_args, output_path, extra_args=()):
+    return (["ffmpeg", "-y", "-i", video_src, "-i", audio_src,
+             "-map", "0:v:0", "-map", "1:a:0?"] + list(extra_args) + video_args
+            + AUDIO_ENCODE_ARGS + ["-movflags", "+faststart", output_path])
+
+
+def _render(video_src, audio_src, mode, output_path, workers=1, work_dir=None, extra_args=()):
+    """Write the picture of ``video_src`` with the mastered audio of ``audio_src``.
+
+    mode="copy" stream-copies the video, retrying as a full encode if the
+    container refuses it (e.g. a codec mp4 cannot hold). A full encode runs
+    chunked across ``workers`` processes when workers > 1.
+    Returns (mode used, chunk timings or None).
+    """
+    if mode == "copy":
+        result = subprocess.run(_mux_cmd(video_src, audio_src, ["-c:v", "copy"], output_path,
+                                         extra_args),
+                                capture_output=True, text=True)
+        if result.returncode == 0:
+            print("[Step 8] Video unchanged: stream-copied, audio mastered only")
+            return "copy", None
+        print("[Step 8] Stream copy failed, re-encoding video...")
+
+    if workers > 1:
+        path, chunks = encode_chunked(video_src, work_dir, workers)
+        _encode(_mux_cmd(path, audio_src, ["-c:v", "copy"], output_path, extra_args))
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return "encode", chunks
+
+    _encode(_mux_cmd(video_src, audio_src, VIDEO_ENCODE_ARGS, output_path, extra_args))
+    return "encode", None
+
+
+def _chunk_info(chunks):
+    if not chunks:
+        return {}
+    return {"encode_chunks": len(chunks), "chunk_timings": chunks}
+
+
+def probe_video(path):
+    result = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-print_format", "json", "-select_streams", "v:0",
+         "-show_streams", "-show_format", path],
+        capture_output=True, text=True
     )
+    data = json.loads(result.stdout)
+    stream = data["streams"][0]
+    return {"codec": stream.get("codec_name"), "pix_fmt": stream.get("pix_fmt"),
+            "profile": stream.get("profile"), "level": stream.get("level"),
+            "width": stream.get("width"), "height": stream.get("height"),
+            "frame_rate": stream.get("r_frame_rate"), "time_base": stream.get("time_base"),
+            "duration": float(data.get("format", {}).get("duration") or stream.get("duration") or 0.0)}
+
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", input_video,
-        "-af", audio_filter,
-        "-c:v", "libx264",
-        "-crf", "18",
-        "-preset", "slow",
-        "-c:a", "aac",
-        "-b:a", "192k",
-        "-movflags", "+faststart",
-        output_path
+# ffprobe H.264 profile name → libx264 -profile:v.
+X264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+# Stream parameters a re-encoded GOP must share with the copied ones to concat cleanly.
+SPLICE_PARAMS = ("profile", "level", "width", "height", "pix_fmt", "frame_rate")
+
+
+def splice_encode_args(src):
+    """libx264 arguments reproducing the source's profile, level, size, pixel format and
+    frame rate; None if the source uses something x264 cannot match."""
+    profile = X264_PROFILES.get(src["profile"])
+    if profile is None or not src["level"] or src["level"] <= 0 or not src["frame_rate"]:
+        return None
+    return VIDEO_ENCODE_ARGS + [
+        "-profile:v", profile, "-level", f"{src['level'] / 10:.1f}",
+        "-vf", f"scale={src['width']}:{src['height']}", "-pix_fmt", src["pix_fmt"],
+        "-r", src["frame_rate"],
     ]
 
+
+def keyframe_times(path):
+    """Presentation times (seconds) of the video keyframes, read from packet flags without decoding."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+        capture_output=True, text=True
+    )
+    times = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            times.append(float(pts))
+    return sorted(times)
+
+
+def gop_spans(ranges, keyframes, duration):
+    """Widen each (start, end) range to the enclosing keyframe interval and merge overlaps."""
+    spans = []
+    for start, end in sorted(ranges):
+        i = bisect.bisect_right(keyframes, start) - 1
+        j = bisect.bisect_left(keyframes, end)
+        a = keyframes[i] if i >= 0 else 0.0
+        b = keyframes[j] if j < len(keyframes) else duration
+        if spans and a <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], b))
+        else:
+            spans.append((a, b))
+    return spans
+
+
+def chunk_bounds(keyframes, duration, n):
+    """Split [0, duration) into at most ``n`` chunks of roughly equal length, cutting at keyframes."""
+    cuts = set()
+    for k in range(1, n):
+        target = duration * k / n
+        i = bisect.bisect_left(keyframes, target)
+        near = [t for t in keyframes[max(i - 1, 0):i + 1] if 0.0 < t < duration]
+        if near:
+            cuts.add(min(near, key=lambda t: abs(t - target)))
+    points = [0.0] + sorted(cuts) + [duration]
+    return list(zip(points[:-1], points[1:]))
+
+
+def _encode_chunk(video_path, part, start, end, threads):
+    t0 = time.perf_counter()
+    _encode(["ffmpeg", "-y", "-ss", str(start), "-i", video_path, "-t", str(end - start),
+             "-map", "0:v:0", "-an"] + VIDEO_ENCODE_ARGS + ["-threads", str(threads), part])
+    return time.perf_counter() - t0
+
+
+def encode_chunked(video_path, work_dir, workers):
+    """Re-encode the picture of ``video_path`` as keyframe-aligned chunks in parallel
+    ffmpeg processes with identical settings, then concat them losslessly.
+
+    Returns (video-only file, per-chunk timings).
+    """
+    info = probe_video(video_path)
+    bounds = chunk_bounds(keyframe_times(video_path), info["duration"], workers)
+    # Share the cores between the encoders instead of letting each x264 claim all of them.
+    threads = max((os.cpu_count() or 1) // min(workers, len(bounds)), 1)
+    os.makedirs(work_dir, exist_ok=True)
+    parts = [os.path.join(work_dir, f"chunk_{i:04d}.ts") for i in range(len(bounds))]
+
+    print(f"[Step 8] Encoding {len(bounds)} chunks on {workers} workers ({threads} threads each)...")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        secs = list(pool.map(_encode_chunk, [video_path] * len(bounds), parts,
+                             [a for a, _ in bounds], [b for _, b in bounds],
+                             [threads] * len(bounds)))
+    elapsed = time.perf_counter() - t0
+
+    chunks = []
+    for i, ((a, b), sec) in enumerate(zip(bounds, secs)):
+        print(f"  chunk {i:03d} {a:8.2f}s–{b:8.2f}s  {sec:6.1f}s ({(b - a) / sec:.2f}x realtime)")
+        chunks.append({"start": round(a, 3), "end": round(b, 3), "seconds": round(sec, 3)})
+    print(f"[Step 8] Chunked encode: {elapsed:.1f}s wall, {sum(secs):.1f}s summed")
+
+    spliced = os.path.join(work_dir, "video.mp4")
+    _concat(parts, spliced)
+    return spliced, chunks
+
+
+def _concat(parts, output_path, extra_args=()):
+    list_path = os.path.splitext(output_path)[0] + ".txt"
+    with open(list_path, "w") as f:
+        f.writelines(f"file '{os.path.abspath(p)}'\n" for p in parts)
+    _encode(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy"]
+            + list(extra_args) + [output_path])
+
+
+def _seconds(rate):
+    num, _, den = (rate or "0/1").partition("/")
+    return float(den or 1) / float(num) if float(num) else 0.0
+
+
+def smart_render(source_video, windows, work_dir, copy=True):
+    """Rebuild the picture of ``source_video`` with each (start, end, clip) window replaced
+    by the lip-synced clip.
+
+    Only the GOPs covering the windows are encoded, as separate parts: source
+    frames up to a window, the window's clip, source frames after it. Every
+    other GOP is stream-copied, and all parts are concatenated losslessly, so
+    each frame is encoded at most once. copy=False encodes every part (for
+    sources that cannot be stream-copied).
+
+    Returns (video-only file, seconds re-encoded), or None when copying is
+    not possible: the source is not H.264, or a re-encoded GOP would not match
+    its profile, level, size, pixel format or frame rate.
+    """
+    src = probe_video(source_video)
+    if copy:
+        if src["codec"] != "h264":
+            print(f"[Step 8] Source video is {src['codec']}, cannot splice; full re-encode")
+            return None
+        encode_args = splice_encode_args(src)
+        if encode_args is None:
+            print(f"[Step 8] x264 cannot match the source ({src['profile']}, level {src['level']}); "
+                  f"full re-encode")
+            return None
+        spans = gop_spans([(a, b) for a, b, _ in windows], keyframe_times(source_video),
+                          src["duration"])
+    else:
+        encode_args = VIDEO_ENCODE_ARGS + ["-vf", f"scale={src['width']}:{src['height']}",
+                                           "-pix_fmt", "yuv420p"]
+        if src["frame_rate"]:
+            encode_args += ["-r", src["frame_rate"]]
+        spans = [(0.0, src["duration"])]
+
+    # Shorter than half a frame: nothing of the source left between a window and its GOP edge.
+    frame = _seconds(src["frame_rate"])
+    min_piece = frame / 2
+    pieces, t = [], 0.0
+    for a, b in spans:
+        if a > t:
+            pieces.append(("copy", t, a, None))
+        inside = sorted(w for w in windows if a <= w[0] < b)
+        for wa, wb, clip in inside:
+            if wa - a > min_piece:
+                pieces.append(("encode", a, wa, None))
+            pieces.append(("encode", wa, wb, clip))
+            a = wb
+        if b - a > min_piece:
+            pieces.append(("encode", a, b, None))
+        t = b
+    if t < src["duration"]:
+        pieces.append(("copy", t, src["duration"], None))
+
+    os.makedirs(work_dir, exist_ok=True)
+    # MPEG-TS parts carry SPS/PPS in-band, so copied and re-encoded pieces concat cleanly.
+    parts = []
+    for i, (kind, a, b, clip) in enumerate(pieces):
+        part = os.path.join(work_dir, f"part_{i:04d}.ts")
+        if kind == "copy":
+            cmd = ["ffmpeg", "-y", "-ss", str(a), "-i", source_video, "-t", str(b - a),
+                   "-map", "0:v:0", "-c:v", "copy", "-bsf:v", "h264_mp4toannexb", part]
+        else:
+            src_args = ["-i", clip] if clip is not None else ["-ss", str(a), "-i", source_video]
+            cmd = ["ffmpeg", "-y"] + src_args + ["-map", "0:v:0"] + _frame_exact(
+                encode_args, a, b, frame) + [part]
+        _encode(cmd)
+        if copy and kind == "encode":
+            got = probe_video(part)
+            mismatched = [k for k in SPLICE_PARAMS if got[k] != src[k]]
+            if mismatched:
+                print(f"[Step 8] Re-encoded GOPs differ from the source in "
+                      f"{', '.join(mismatched)}; full re-encode")
+                shutil.rmtree(work_dir, ignore_errors=True)
+                return None
+        parts.append(part)
+
+    spliced = os.path.join(work_dir, "video.mp4")
+    timescale = (src["time_base"] or "").partition("/")[2]
+    _concat(parts, spliced, ["-video_track_timescale", timescale] if timescale else [])
+
+    reencoded = sum(b - a for kind, a, b, _ in pieces if kind == "encode")
+    print(f"[Step 8] Smart render: encoded {reencoded:.1f}s of {src['duration']:.1f}s "
+          f"in {len(spans)} GOP ranges with {len(windows)} lip-synced windows"
+          f"{', stream-copied the rest' if copy else ''}")
+    return spliced, reencoded
+
+
+def _frame_exact(encode_args, a, b, frame):
+    """Encode arguments that make an encoded piece exactly the frames of [a, b).
+
+    Wav2Lip drops the frames it has no mel chunk for, so a window clip can
+    come out a few frames short; cloning its last frame keeps every piece
+    after it on the source's timeline.
+    """
+    if not frame:
+        return encode_args + ["-t", str(b - a)]
+    frames = max(int(round(b / frame)) - int(round(a / frame)), 1)
+    pad = f"tpad=stop_mode=clone:stop={frames}"
+    args = list(encode_args)
+    if "-vf" in args:
+        i = args.index("-vf") + 1
+        args[i] = f"{pad},{args[i]}"
+    else:
+        args += ["-vf", pad]
+    return args + ["-frames:v", str(frames)]
+
+
+def _encode(cmd):
     result = subprocess.run(cmd, capture_output=True, text=True)
 
     if result.returncode != 0:
         print(f"[Step 8] Error: {result.stderr[-500:]}")
         raise RuntimeError("Encoding failed")
 
+
+def _write_meta(output_path, output_dir, extra):
     size_mb = os.path.getsize(output_path) / (1024 * 1024)
     print(f"[Step 8] Final output: {output_path} ({size_mb:.1f} MB)")
 
-    info = {
-        "final_output": os.path.abspath(output_path),
-        "source_video": os.path.abspath(input_video),
-        "size_mb": round(size_mb, 2)
-    }
+    info = {"final_output": os.path.abspath(output_path)}
+    info.update(extra)
+    info["size_mb"] = round(size_mb, 2)
 
     meta_path = os.path.join(output_dir, "step8_meta.json")
-    with open(meta_path, "w") as f:
-        json.dump(info, f, indent=2)
+    save_meta(meta_path, info)
 
     return info
 
 
 if __name__ == "__main__":
-    video = sys.argv[1] if len(sys.argv) > 1 else "output/lipsync_video.mp4"
-    if not os.path.exists(video):
-        video = "output/dubbed_video.mp4"
-    master_encode(video)
+    video_mode = "encode" if "--reencode-video" in sys.argv else "auto"
+    workers = next((int(a.split("=", 1)[1]) for a in sys.argv if a.startswith("--workers=")), 1)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if len(args) > 1:
+        assemble(args[0], args[1], video=video_mode, workers=workers)
+    else:
+        video = args[0] if args else "output/lipsync_video.mp4"
+        if not os.path.exists(video):
+            video = "output/dubbed_video.mp4"
+        master_encode(video, video=video_mode, workers=workers)
@@ -0,0 +1,321 @@
+"""Streaming execution of steps 2 through 6.
+
+Whisper runs over silence-cut chunks of audio.wav, and each finished segment
+flows through clean → translate → synthesize → duration-match on its own
+thread, connected by bounded queues. The full mix (step 6) is assembled once
+the last segment has been matched. The same stepN_meta.json files as the
+batch pipeline are written at the end, so steps 7/8 and the helper scripts
+work unchanged.
+"""
+import queue, threading, time
+import json, sys, os
+
+import model_server
+from audio_dsp import plan_chunks, wav_levels
+from job_manifest import save_meta
+from step2_transcribe import load_whisper, run_whisper
+from step2b_clean_asr import iter_clean_segments, iter_merge_short_segments
+from step3_translate import (GENERATION_PARAMS, NLLB_MODEL, print_memory_stats,
+                             translate_with_memory)
+from step4_tts import XTTS_MODEL, extract_reference_clip, load_tts, synthesize_entry
+from step5_duration_match import process_segment
+from translation_memory import DEFAULT_TM_PATH, TranslationMemory
+from vad import speech_regions
+
+
+_DONE = object()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class StreamingPipeline:
+    def __init__(self, audio_wav, output_dir="output", whisper_model="medium",
+                 whisper_backend="openai", nllb_model=NLLB_MODEL, xtts_model=XTTS_MODEL,
+                 translate_batch_size=8, match_engine="numpy", chunk_seconds=30.0, queue_size=16,
+                 tm_path=DEFAULT_TM_PATH, vad=False):
+        self.audio_wav = audio_wav
+        self.output_dir = output_dir
+        self.whisper_model = whisper_model
+        self.whisper_backend = whisper_backend
+        self.nllb_model = nllb_model
+        self.xtts_model = xtts_model
+        self.translate_batch_size = translate_batch_size
+        self.match_engine = match_engine
+        self.chunk_seconds = chunk_seconds
+        self.tm_path = tm_path
+        self.vad = vad
+
+        self.q_raw = queue.Queue(queue_size)
+        self.q_clean = queue.Queue(queue_size)
+        self.q_translated = queue.Queue(queue_size)
+        self.q_tts = queue.Queue(queue_size)
+
+        self.stop = threading.Event()
+        self.errors = []
+        self.busy = {}
+
+        self.raw_segments = []
+        self.cleaned_segments = []
+        self.translated_segments = []
+        self.tts_segments = []
+        self.matched_segments = []
+        self.ref_clip_path = os.path.join(output_dir, "ref_speaker.wav")
+
+        self.t_start = None
+        self.t_first_dubbed = None
+
+    # Queue helpers that give up when another stage has failed.
+
+    def _put(self, q, item):
+        while True:
+            if self.stop.is_set():
+                raise _Cancelled()
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                pass
+
+    def _iter(self, q):
+        while True:
+            if self.stop.is_set():
+                raise _Cancelled()
+            try:
+                item = q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _timed(self, stage, func, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.busy[stage] = self.busy.get(stage, 0.0) + time.perf_counter() - t0
+
+    def _stage(self, name, func, out_q):
+        def target():
+            try:
+                func()
+            except _Cancelled:
+                pass
+            except BaseException as e:
+                self.errors.append((name, e))
+                self.stop.set()
+            finally:
+                if out_q is not None and not self.stop.is_set():
+                    out_q.put(_DONE)
+        return threading.Thread(target=target, name=name, daemon=True)
+
+    # Stages.
+
+    def _transcribe(self):
+        if self.vad:
+            chunks, _ = speech_regions(self.audio_wav, max_len=self.chunk_seconds)
+        else:
+            levels, frame_sec = wav_levels(self.audio_wav)
+            chunks = plan_chunks(levels, frame_sec, max_len=self.chunk_seconds)
+        print(f"[Stream] Whisper over {len(chunks)} chunks of ≤{self.chunk_seconds:.0f}s")
+
+        audio_path = os.path.abspath(self.audio_wav)
+        model = (None if model_server.available()
+                 else load_whisper(self.whisper_model, backend=self.whisper_backend))
+        for start, end in chunks:
+            if model is None:
+                segs = self._timed("transcribe", model_server.call, "transcribe",
+                                   model_name=self.whisper_model, backend=self.whisper_backend,
+                                   audio_path=audio_path,
+                                   start=start, end=end)
+            else:
+                segs = self._timed("transcribe", run_whisper, model, audio_path, start, end)
+            for seg in segs:
+                seg = {"start": round(seg["start"], 3), "end": round(seg["end"], 3),
+                       "text": seg["text"].strip()}
+                self.raw_segments.append(seg)
+                self._put(self.q_raw, seg)
+
+    def _clean(self):
+        for seg in iter_merge_short_segments(iter_clean_segments(self._iter(self.q_raw))):
+            self.cleaned_segments.append(seg)
+            self._put(self.q_clean, seg)
+
+    def _translate(self):
+        tm = (TranslationMemory(self.tm_path, self.nllb_model, GENERATION_PARAMS)
+              if self.tm_path else None)
+        models = {}
+        items = self._iter(self.q_clean)
+        try:
+            for first in items:
+                # Micro-batch whatever has queued up behind the first segment.
+                batch = [first]
+                while len(batch) < self.translate_batch_size:
+                    try:
+                        nxt = self.q_clean.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is _DONE:
+                        self.q_clean.put(_DONE)
+                        break
+                    batch.append(nxt)
+
+                hindi, _, _ = self._timed(
+                    "translate", translate_with_memory, [s["text"] for s in batch],
+                    self.nllb_model, self.translate_batch_size, tm, models
+                )
+                for seg, hindi_text in zip(batch, hindi):
+                    out = {"start": seg["start"], "end": seg["end"],
+                           "english": seg["text"], "hindi": hindi_text}
+                    print(f"  [{seg['start']:.1f}-{seg['end']:.1f}] {seg['text']} → {hindi_text}")
+                    self.translated_segments.append(out)
+                    self._put(self.q_translated, (len(self.translated_segments) - 1, out))
+        finally:
+            if tm:
+                print_memory_stats(tm)
+                tm.close()
+
+    def _synthesize(self):
+        tts_dir = os.path.join(self.output_dir, "tts_segments")
+        os.makedirs(tts_dir, exist_ok=True)
+        tts = load_tts(self.xtts_model)
+
+        # The batch step picks the longest segment as the voice reference; here
+        # the first segment of at least 3s is used so synthesis can start early.
+        pending = []
+        have_ref = False
+
+        def emit(i, seg):
+            entry = self._timed("synthesize", synthesize_entry, tts, i, seg,
+                                self.ref_clip_path, tts_dir)
+            if entry is not None:
+                self.tts_segments.append(entry)
+                self._put(self.q_tts, entry)
+
+        for i, seg in self._iter(self.q_translated):
+            if have_ref:
+                emit(i, seg)
+                continue
+            pending.append((i, seg))
+            if seg["end"] - seg["start"] >= 3.0:
+                best = extract_reference_clip(self.audio_wav, [seg], self.ref_clip_path)
+                print(f"[Stream] Reference clip: {best['start']:.1f}s–{best['end']:.1f}s")
+                have_ref = True
+                for item in pending:
+                    emit(*item)
+                pending = []
+
+        if pending:
+            best = extract_reference_clip(self.audio_wav, [s for _, s in pending],
+                                          self.ref_clip_path)
+            print(f"[Stream] Reference clip: {best['start']:.1f}s–{best['end']:.1f}s")
+            for item in pending:
+                emit(*item)
+
+    def _match(self):
+        matched_dir = os.path.join(self.output_dir, "matched_segments")
+        os.makedirs(matched_dir, exist_ok=True)
+        for seg in self._iter(self.q_tts):
+            if seg["target_duration"] <= 0:
+                continue
+            entry, err, _ = self._timed("match", process_segment, seg, matched_dir,
+                                        self.match_engine)
+            if entry is None:
+                print(f"  [{seg['index']:03d}] ERROR: {err[:100]}")
+                continue
+            if self.t_first_dubbed is None:
+                self.t_first_dubbed = time.perf_counter() - self.t_start
+                print(f"[Stream] First dubbed segment ready after {self.t_first_dubbed:.1f}s")
+            self.matched_segments.append(entry)
+
+    def run(self):
+        self.t_start = time.perf_counter()
+        threads = [
+            self._stage("transcribe", self._transcribe, self.q_raw),
+            self._stage("clean", self._clean, self.q_clean),
+            self._stage("translate", self._translate, self.q_translated),
+            self._stage("synthesize", self._synthesize, self.q_tts),
+            self._stage("match", self._match, None),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if self.errors:
+            name, err = self.errors[0]
+            raise RuntimeError(f"Streaming stage '{name}' failed: {err}") from err
+
+        elapsed = time.perf_counter() - self.t_start
+        self.write_metas()
+        print(f"[Stream] Steps 2–5 done in {elapsed:.1f}s "
+              f"({len(self.matched_segments)} segments)")
+        for stage, seconds in self.busy.items():
+            print(f"  {stage:<11} busy {seconds:.1f}s")
+        return {
+            "elapsed": round(elapsed, 3),
+            "first_dubbed_segment": round(self.t_first_dubbed or 0.0, 3),
+            "busy": {k: round(v, 3) for k, v in self.busy.items()},
+        }
+
+    def write_metas(self):
+        def dump(name, info):
+            save_meta(os.path.join(self.output_dir, name), info)
+
+        dump("step2_meta.json", {
+            "audio_path": self.audio_wav,
+            "language": "kn",
+            "output_language": "en",
+            "full_text": " ".join(s["text"] for s in self.raw_segments),
+            "segments": self.raw_segments
+        })
+        dump("step2_cleaned.json", {
+            "audio_path": self.audio_wav,
+            "language": "kn",
+            "output_language": "en",
+            "original_segments": len(self.raw_segments),
+            "cleaned_segments": len(self.cleaned_segments),
+            "full_text": " ".join(s["text"] for s in self.cleaned_segments),
+            "segments": self.cleaned_segments
+        })
+        dump("step3_meta.json", {
+            "model": self.nllb_model,
+            "source": "en",
+            "target": "hi",
+            "batch_size": self.translate_batch_size,
+            "full_hindi": " ".join(s["hindi"] for s in self.translated_segments),
+            "segments": self.translated_segments
+        })
+        dump("step4_meta.json", {
+            "tts_engine": "xtts-v2",
+            "model": self.xtts_model,
+            "ref_clip": self.ref_clip_path,
+            "total_segments": len(self.tts_segments),
+            "segments": self.tts_segments
+        })
+        avg_error = (sum(s["duration_error"] for s in self.matched_segments)
+                     / max(len(self.matched_segments), 1))
+        dump("step5_meta.json", {
+            "total_segments": len(self.matched_segments),
+            "avg_duration_error": round(avg_error, 4),
+            "segments": self.matched_segments
+        })
+
+
+def run_streaming(audio_wav, input_video, output_dir="output", mixer="array", mux=True, **kwargs):
+    """Run steps 2-5 as a stream, then mix (and unless mux=False, mux) as step 6. Returns step6 info."""
+    from step6_merge_audio import merge_audio
+
+    stats = StreamingPipeline(audio_wav, output_dir, **kwargs).run()
+    info = merge_audio(os.path.join(output_dir, "step5_meta.json"), input_video, output_dir,
+                       mixer=mixer, mux=mux)
+    info["stream"] = stats
+    return info
+
+
+if __name__ == "__main__":
+    video = sys.argv[1] if len(sys.argv) > 1 else "input.mp4"
+    audio = sys.argv[2] if len(sys.argv) > 2 else "output/audio.wav"
+    run_streaming(audio, video)
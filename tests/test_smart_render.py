@@ -0,0 +1,51 @@
+"""smart_render's splice plan keeps every piece on the source's frame grid."""
+import sys, os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import step8_master_encode as step8
+
+
+SOURCE = {"codec": "h264", "pix_fmt": "yuv420p", "profile": "High", "level": 40,
+          "width": 640, "height": 360, "frame_rate": "25/1", "time_base": "1/12800",
+          "duration": 12.0}
+
+
+def _arg(cmd, flag):
+    return cmd[cmd.index(flag) + 1] if flag in cmd else None
+
+
+def _plan(monkeypatch, tmp_path, windows):
+    commands = []
+    monkeypatch.setattr(step8, "probe_video", lambda path: dict(SOURCE))
+    monkeypatch.setattr(step8, "keyframe_times", lambda path: [0.0, 2.0, 4.0, 6.0, 8.0, 10.0])
+    monkeypatch.setattr(step8, "_encode", commands.append)
+    monkeypatch.setattr(step8, "_concat", lambda parts, output_path, extra_args=(): None)
+    result = step8.smart_render("source.mp4", windows, str(tmp_path))
+    return result, [cmd for cmd in commands if cmd[-1].endswith(".ts")]
+
+
+def test_short_clip_is_padded_to_its_window(monkeypatch, tmp_path):
+    # Wav2Lip trims its output to the mel chunks, so this clip holds fewer
+    # than the window's 35 frames; the encoded piece must still be 35 long.
+    windows = [(2.48, 3.88, "short_clip.mp4"), (5.0, 6.0, "clip2.mp4")]
+    result, parts = _plan(monkeypatch, tmp_path, windows)
+    assert result is not None
+
+    clip = next(cmd for cmd in parts if "short_clip.mp4" in cmd)
+    assert _arg(clip, "-frames:v") == "35"
+    assert _arg(clip, "-vf").startswith("tpad=stop_mode=clone:stop=35,")
+
+
+def test_pieces_add_up_to_the_source(monkeypatch, tmp_path):
+    windows = [(2.5, 3.9, "c1.mp4"), (5.0, 6.0, "c2.mp4"), (10.33, 11.1, "c3.mp4")]
+    _, parts = _plan(monkeypatch, tmp_path, windows)
+
+    total = 0.0
+    for cmd in parts:
+        if _arg(cmd, "-c:v") == "copy":
+            total += float(_arg(cmd, "-t"))
+        else:
+            total += int(_arg(cmd, "-frames:v")) / 25
+    assert abs(total - SOURCE["duration"]) < 1e-6
@@ -0,0 +1,104 @@
+"""StageCache: manifest edits survive hits, outputs are linked and old results pruned."""
+import sys, os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from job_manifest import JobManifest, save_meta
+from stage_cache import StageCache
+
+
+def _translate(output_dir, hindi):
+    info = {"segments": [{"english": "a", "hindi": "x"}, {"english": "b", "hindi": hindi}]}
+    save_meta(os.path.join(output_dir, "step3_meta.json"), info)
+    return info
+
+
+def _run(output_dir, hindi):
+    cache = StageCache(output_dir)
+    cache.run("step3", _translate, (output_dir, hindi), params={"hindi": hindi},
+              outputs=[os.path.join(output_dir, "step3_meta.json")])
+    return cache
+
+
+def _hindi(output_dir):
+    with JobManifest(output_dir) as job:
+        return job.get_segment("step3", 1)["hindi"]
+
+
+def test_manifest_edit_survives_cached_run(tmp_path):
+    out = str(tmp_path)
+    _run(out, "y")
+    with JobManifest(out) as job:
+        job.update_segment("step3", 1, hindi="EDITED")
+
+    cache = _run(out, "y")
+    assert cache.hits == 1
+    assert _hindi(out) == "EDITED"
+    # Still kept on later hits, and the view now shows it.
+    _run(out, "y")
+    assert _hindi(out) == "EDITED"
+    with open(os.path.join(out, "step3_meta.json")) as f:
+        assert "EDITED" in f.read()
+
+
+def test_other_result_is_restored_over_rows(tmp_path):
+    out = str(tmp_path)
+    _run(out, "y")
+    _run(out, "z")
+    assert _hindi(out) == "z"
+
+    cache = _run(out, "y")
+    assert cache.hits == 1
+    assert _hindi(out) == "y"
+
+
+def _write_audio(output_dir, tag):
+    path = os.path.join(output_dir, "audio.wav")
+    with open(path, "w") as f:
+        f.write(f"pcm {tag}")
+    return tag
+
+
+def _run_audio(output_dir, tag, keep=3):
+    cache = StageCache(output_dir, keep=keep)
+    result = cache.run("step1", _write_audio, (output_dir, tag), params={"tag": tag},
+                       outputs=[os.path.join(output_dir, "audio.wav")])
+    return cache, result
+
+
+def test_outputs_are_linked_not_copied(tmp_path):
+    out = str(tmp_path)
+    _run_audio(out, "a")
+    cached = [os.path.join(parent, name) for parent, _, names in os.walk(out)
+              for name in names if name == "audio.wav" and parent != out]
+    assert len(cached) == 1
+    assert os.path.samefile(cached[0], os.path.join(out, "audio.wav"))
+
+
+def test_rerun_does_not_write_through_the_link(tmp_path):
+    out = str(tmp_path)
+    _run_audio(out, "a")
+    _run_audio(out, "b")
+    cache, result = _run_audio(out, "a")
+    assert cache.hits == 1 and result == "a"
+    with open(os.path.join(out, "audio.wav")) as f:
+        assert f.read() == "pcm a"
+
+
+def test_in_place_rewrite_drops_the_entry(tmp_path):
+    out = str(tmp_path)
+    _run_audio(out, "a")
+    with open(os.path.join(out, "audio.wav"), "w") as f:
+        f.write("spliced")
+    cache, _ = _run_audio(out, "a")
+    assert cache.hits == 0 and cache.misses == 1
+
+
+def test_only_newest_results_are_kept(tmp_path):
+    out = str(tmp_path)
+    for tag in "abcd":
+        _run_audio(out, tag, keep=2)
+    assert len(os.listdir(os.path.join(out, ".stage_cache", "step1"))) == 2
+    cache, _ = _run_audio(out, "d", keep=2)
+    assert cache.hits == 1
@@ -0,0 +1,158 @@
+import hashlib, re, sqlite3, time, unicodedata
+import json, sys, os
+
+
+DEFAULT_TM_PATH = os.environ.get(
+    "TRANS_TM_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "trans", "translation_memory.sqlite")
+)
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.casefold()
+
+
+def params_key(model_name, params):
+    blob = json.dumps({"model": model_name, "params": params}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+
+class TranslationMemory:
+    """SQLite-backed cache of NLLB outputs plus manual overrides.
+
+    Entries are keyed on (normalized source text, model + generation params).
+    Overrides are keyed on the normalized source alone and always win, so a
+    hand-fixed line stays fixed whatever model produced the original.
+    """
+
+    def __init__(self, path=DEFAULT_TM_PATH, model_name="", params=None,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.config = params_key(model_name, params or {})
+        self.hits = 0
+        self.misses = 0
+        self.override_hits = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                source TEXT NOT NULL,
+                config TEXT NOT NULL,
+                target TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                use_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source, config)
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS overrides (
+                source TEXT PRIMARY KEY,
+                target TEXT NOT NULL,
+                original TEXT,
+                updated REAL NOT NULL
+            );
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def lookup(self, text):
+        key = normalize_text(text)
+        row = self.db.execute("SELECT target FROM overrides WHERE source = ?", (key,)).fetchone()
+        if row:
+            self.override_hits += 1
+            return row[0]
+
+        row = self.db.execute(
+            "SELECT target FROM entries WHERE source = ? AND config = ?", (key, self.config)
+        ).fetchone()
+        if row:
+            self.hits += 1
+            self.db.execute(
+                "UPDATE entries SET last_used = ?, use_count = use_count + 1 "
+                "WHERE source = ? AND config = ?",
+                (time.time(), key, self.config)
+            )
+            return row[0]
+
+        self.misses += 1
+        return None
+
+    def store(self, text, target):
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries (source, config, target, last_used, use_count) "
+            "VALUES (?, ?, ?, ?, 0)",
+            (normalize_text(text), self.config, target, time.time())
+        )
+
+    def set_override(self, text, target):
+        key = normalize_text(text)
+        self.db.execute(
+            "INSERT OR REPLACE INTO overrides (source, target, original, updated) "
+            "VALUES (?, ?, ?, ?)",
+            (key, target, text, time.time())
+        )
+        self.db.commit()
+
+    def remove_override(self, text):
+        self.db.execute("DELETE FROM overrides WHERE source = ?", (normalize_text(text),))
+        self.db.commit()
+
+    def evict(self):
+        count = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.db.execute(
+                "DELETE FROM entries WHERE rowid IN "
+                "(SELECT rowid FROM entries ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+        return max(excess, 0)
+
+    def commit(self):
+        evicted = self.evict()
+        self.db.commit()
+        return evicted
+
+    def stats(self):
+        looked_up = self.hits + self.misses + self.override_hits
+        return {
+            "hits": self.hits,
+            "override_hits": self.override_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.override_hits) / looked_up, 3) if looked_up else 0.0,
+            "entries": self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+            "overrides": self.db.execute("SELECT COUNT(*) FROM overrides").fetchone()[0],
+        }
+
+
+def overrides_digest(path=DEFAULT_TM_PATH):
+    """Hash of the override table, so cached step3 results are invalidated by new fixes."""
+    if not os.path.exists(path):
+        return None
+    db = sqlite3.connect(path)
+    try:
+        rows = db.execute("SELECT source, target FROM overrides ORDER BY source").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    db.close()
+    return hashlib.sha256(json.dumps(rows, ensure_ascii=False).encode()).hexdigest()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    tm = TranslationMemory()
+    if cmd == "override" and len(sys.argv) > 3:
+        tm.set_override(sys.argv[2], sys.argv[3])
+        print(f"[TM] Override stored: {sys.argv[2]} → {sys.argv[3]}")
+    elif cmd == "unoverride" and len(sys.argv) > 2:
+        tm.remove_override(sys.argv[2])
+        print(f"[TM] Override removed: {sys.argv[2]}")
+    else:
+        s = tm.stats()
+        print(f"[TM] {tm.path}: {s['entries']} entries, {s['overrides']} overrides")
+    tm.close()
@@ -0,0 +1,106 @@
+"""Lightweight energy + speech-band voice-activity detection for the step1 WAV.
+
+Frames are classified as speech when they are well above the track's own
+noise floor and most of their energy sits in the 300-3400 Hz speech band.
+The frame decisions are then smoothed into regions: short gaps are bridged,
+blips are dropped and each region gets a little padding.
+"""
+import json, sys, os
+
+import numpy as np
+
+from audio_buffer import open_pcm
+from audio_dsp import plan_chunks, runs
+
+
+FRAME_SEC = 0.03
+BLOCK_SEC = 60.0
+
+
+def frame_features(path):
+    """Per-frame (energy dB, speech-band energy ratio), computed blockwise."""
+    buf = open_pcm(path)
+    sr = buf.sample_rate
+    n = int(FRAME_SEC * sr)
+    freqs = np.fft.rfftfreq(n, 1.0 / sr)
+    band = (freqs >= 300) & (freqs <= 3400)
+    window = np.hanning(n).astype(np.float32)
+
+    energies, ratios = [], []
+    for x in buf.blocks(int(BLOCK_SEC / FRAME_SEC) * n):
+        frames = max(-(-len(x) // n), 1)
+        x = np.pad(x, (0, frames * n - len(x))).reshape(frames, n)
+        power = np.abs(np.fft.rfft(x * window, axis=1)) ** 2
+        total = power.sum(axis=1) + 1e-12
+        energies.append(10 * np.log10(np.mean(x ** 2, axis=1) + 1e-12))
+        ratios.append(power[:, band].sum(axis=1) / total)
+    if not energies:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(energies), np.concatenate(ratios)
+
+
+def detect_speech(path, margin_db=10.0, min_db=-50.0, band_ratio=0.5, min_speech=0.25,
+                  max_gap=0.5, pad=0.2):
+    """Speech regions as a list of (start, end) seconds, plus total duration."""
+    energy, ratio = frame_features(path)
+    total = len(energy) * FRAME_SEC
+    if not len(energy):
+        return [], 0.0
+
+    noise_floor = np.percentile(energy, 10)
+    speech = (energy > max(noise_floor + margin_db, min_db)) & (ratio > band_ratio)
+
+    regions = []
+    for a, b in runs(speech):
+        start, end = float(a) * FRAME_SEC, float(b) * FRAME_SEC
+        if regions and start - regions[-1][1] <= max_gap:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    out = []
+    for start, end in regions:
+        if end - start < min_speech:
+            continue
+        start, end = max(start - pad, 0.0), min(end + pad, total)
+        if out and start <= out[-1][1]:
+            out[-1] = (out[-1][0], round(end, 3))
+        else:
+            out.append((round(start, 3), round(end, 3)))
+    return out, total
+
+
+def speech_regions(path, max_len=None, **kwargs):
+    """detect_speech, with regions longer than max_len split at their quietest points."""
+    regions, total = detect_speech(path, **kwargs)
+    if not max_len:
+        return regions, total
+
+    split = []
+    for start, end in regions:
+        if end - start <= max_len:
+            split.append((start, end))
+            continue
+        energy = _region_energy(path, start, end)
+        for a, b in plan_chunks(energy, FRAME_SEC, max_len=max_len,
+                                search=min(max_len / 5, 30.0)):
+            split.append((round(start + a, 3), round(min(start + b, end), 3)))
+    return split, total
+
+
+def _region_energy(path, start, end):
+    buf = open_pcm(path)
+    x = buf.slice(start, end)
+    n = int(FRAME_SEC * buf.sample_rate)
+    frames = max(-(-len(x) // n), 1)
+    x = np.pad(x, (0, frames * n - len(x))).reshape(frames, n)
+    return 10 * np.log10(np.mean(x ** 2, axis=1) + 1e-12)
+
+
+if __name__ == "__main__":
+    audio = sys.argv[1] if len(sys.argv) > 1 else "output/audio.wav"
+    regions, total = detect_speech(audio)
+    speech = sum(b - a for a, b in regions)
+    print(json.dumps({"regions": regions}, indent=2))
+    print(f"[VAD] {len(regions)} speech regions, {speech:.1f}s of {total:.1f}s "
+          f"({total - speech:.1f}s skippable)")